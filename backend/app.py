@@ -5,58 +5,83 @@ from datetime import timedelta
 import os
 from flask_jwt_extended import JWTManager
 from flask_bcrypt import Bcrypt
-from models import db
+from models import db, init_db, configure_engine, database_url, engine_options
 
-if not os.path.exists('uploads'):
-    os.makedirs('uploads')
 
-load_dotenv()
+def create_app():
+    """Builds the Flask app: config, database, history writer and routes."""
+    if not os.path.exists('uploads'):
+        os.makedirs('uploads')
 
-from controllers.main_controller import main_bp
-from controllers.auth_controller import auth_bp
+    load_dotenv()
 
-app = Flask(__name__)
+    from controllers.main_controller import main_bp
+    from controllers.auth_controller import auth_bp
+    from services import history_logger
 
-# Config
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///research_agent.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-# Hardcoded key for debugging stability
-app.config['JWT_SECRET_KEY'] = 'v8K9p2mN5qR4sL7tW3xY6zB1cA0dE9fG2hJ5kL8nQ4wP7sT3vX6yZ9bC1nA0dE'
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=30) 
+    app = Flask(__name__)
 
-db.init_app(app)
-jwt = JWTManager(app)
-bcrypt = Bcrypt(app)
+    # Config
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Hardcoded key for debugging stability
+    app.config['JWT_SECRET_KEY'] = 'v8K9p2mN5qR4sL7tW3xY6zB1cA0dE9fG2hJ5kL8nQ4wP7sT3vX6yZ9bC1nA0dE'
+    app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=30) 
 
-# Enhanced JWT Error Handling
-@jwt.expired_token_loader
-def expired_token_callback(jwt_header, jwt_payload):
-    print(f"JWT Error: Token expired")
-    return jsonify({"msg": "Token has expired", "error": "token_expired"}), 401
+    db.init_app(app)
+    jwt = JWTManager(app)
+    bcrypt = Bcrypt(app)
 
-@jwt.invalid_token_loader
-def invalid_token_callback(error):
-    print(f"JWT Error: Invalid token - {error}")
-    return jsonify({"msg": "Signature verification failed", "error": "invalid_token"}), 401
+    # Enhanced JWT Error Handling
+    @jwt.expired_token_loader
+    def expired_token_callback(jwt_header, jwt_payload):
+        print(f"JWT Error: Token expired")
+        return jsonify({"msg": "Token has expired", "error": "token_expired"}), 401
 
-@jwt.unauthorized_loader
-def missing_token_callback(error):
-    print(f"JWT Error: Missing token - {error}")
-    return jsonify({"msg": "Request does not contain an access token", "error": "authorization_required"}), 401
+    @jwt.invalid_token_loader
+    def invalid_token_callback(error):
+        print(f"JWT Error: Invalid token - {error}")
+        return jsonify({"msg": "Signature verification failed", "error": "invalid_token"}), 401
 
-with app.app_context():
-    db.create_all()
+    @jwt.unauthorized_loader
+    def missing_token_callback(error):
+        print(f"JWT Error: Missing token - {error}")
+        return jsonify({"msg": "Request does not contain an access token", "error": "authorization_required"}), 401
 
-# Relaxed CORS for development
-CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
+    with app.app_context():
+        configure_engine()
+        # Set DB_AUTO_CREATE=0 when the schema is managed separately (`flask --app app init-db`)
+        if os.getenv("DB_AUTO_CREATE", "1") == "1":
+            init_db()
+    history_logger.init_app(app)
 
-app.register_blueprint(main_bp, url_prefix='/api')
-app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    @app.cli.command("init-db")
+    def init_db_command():
+        """Creates missing tables and indexes."""
+        init_db()
+        print(f"Database ready: {db.engine.url.render_as_string(hide_password=True)}")
 
-@app.route('/')
-def home():
-    return "AI Research Agent Backend is Running!"
+    # Relaxed CORS for development
+    CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
+
+    app.register_blueprint(main_bp, url_prefix='/api')
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+
+    @app.route('/')
+    def home():
+        return "AI Research Agent Backend is Running!"
+
+    return app
+
+
+# Pool workers (forkserver/spawn) re-run this file as __mp_main__; they must not build a server
+app = create_app() if __name__ != '__mp_main__' else None
 
 if __name__ == '__main__':
+    from services import news_service
+    # The reloader runs this block in a watcher process too; only the serving child pre-warms
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        news_service.start_prewarm()
     port = int(os.environ.get('PORT', 5000))
     app.run(debug=True, host='0.0.0.0', port=port)
@@ -0,0 +1,278 @@
+"""
+ASGI entry point.
+
+The token-streaming endpoints (/api/qa-stream and /api/analyze-image) are
+served natively on the event loop with the async Groq client, so a single
+process can hold hundreds of concurrent streams without a thread each. Room
+event subscriptions (/api/collaboration/rooms/<room_id>/events) are long-lived
+too and are served the same way. Every other route is passed through to the
+Flask app unchanged.
+
+Run with:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import json
+import re
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from flask_jwt_extended import decode_token
+
+from app import app
+from services import llm_service, collaboration_service, history_logger, news_service
+from services.rate_limiter import RateLimitExceeded
+from services.room_events import format_event
+from services.stream_service import HEARTBEAT_SECONDS
+
+flask_application = WsgiToAsgi(app)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, payload, headers=None):
+        super().__init__(payload)
+        self.status = status
+        self.payload = payload
+        self.headers = headers or []
+
+
+def _cors_headers(scope):
+    # Mirrors the Flask app's CORS setup: any origin, credentials allowed
+    origin = dict(scope['headers']).get(b'origin')
+    if not origin:
+        return []
+    return [(b'access-control-allow-origin', origin), (b'access-control-allow-credentials', b'true'), (b'vary', b'Origin')]
+
+
+async def _send_json(scope, send, status, payload, headers=None):
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+                   + _cors_headers(scope) + (headers or []),
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _read_json(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise HTTPError(400, {'error': 'Client disconnected'})
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    try:
+        return json.loads(b''.join(chunks) or b'null')
+    except ValueError:
+        return None
+
+
+def _authenticate(scope):
+    """Validates the bearer token the same way @jwt_required does. Returns the user identity."""
+    auth = dict(scope['headers']).get(b'authorization', b'').decode('latin-1')
+    if not auth.startswith('Bearer '):
+        raise HTTPError(401, {"msg": "Request does not contain an access token", "error": "authorization_required"})
+    try:
+        with app.app_context():
+            return decode_token(auth[len('Bearer '):])['sub']
+    except Exception as e:
+        print(f"JWT Error: {e}")
+        raise HTTPError(401, {"msg": "Signature verification failed", "error": "invalid_token"})
+
+
+def _wants_sse(scope):
+    accept = dict(scope['headers']).get(b'accept', b'')
+    return b'text/event-stream' in accept or b'mode=sse' in scope.get('query_string', b'')
+
+
+async def _wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def _until_disconnect(receive, pump):
+    """Runs the `pump` coroutine until it finishes or the client disconnects, whichever is first."""
+    streaming = asyncio.ensure_future(pump)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await asyncio.wait({streaming, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (streaming, watcher):
+            task.cancel()
+    if streaming.done() and not streaming.cancelled() and streaming.exception():
+        raise streaming.exception()
+
+
+async def _stream_text(scope, receive, send, chunks):
+    """
+    Streams an async generator of text chunks as text/plain, the same protocol the
+    Flask endpoints use. The first chunk is awaited before the response starts so a
+    shed request still gets a proper 429. Generation stops if the client goes away.
+    """
+    try:
+        first_chunk = await chunks.__anext__()
+    except StopAsyncIteration:
+        first_chunk = ""
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'text/plain; charset=utf-8')] + _cors_headers(scope),
+    })
+
+    async def pump():
+        if first_chunk:
+            await send({'type': 'http.response.body', 'body': first_chunk.encode('utf-8'), 'more_body': True})
+        async for chunk in chunks:
+            await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    try:
+        await _until_disconnect(receive, pump())
+    finally:
+        await chunks.aclose()
+
+
+async def qa_stream(scope, receive, send):
+    _authenticate(scope)
+    data = await _read_json(receive)
+    if not data:
+        raise HTTPError(400, {'error': 'Invalid request body'})
+
+    messages = data.get('messages', [])
+    question = data.get('question')  # Fallback if messages not provided
+    if not messages and not question:
+        raise HTTPError(400, {'error': 'Question or messages is required'})
+    if not messages and question:
+        messages = [{"role": "user", "content": question}]
+
+    await _stream_text(scope, receive, send, llm_service.agenerate_response_stream_with_history(messages))
+
+
+async def analyze_image(scope, receive, send):
+    identity = _authenticate(scope)
+    data = await _read_json(receive) or {}
+    image_data = data.get('image')  # Base64 string or URL
+    prompt = data.get('prompt', 'Describe this image')
+    if not image_data:
+        raise HTTPError(400, {'error': 'Image data required'})
+
+    item_name = (prompt[:30] + '...') if len(prompt) > 30 else prompt
+    history_logger.log(identity, "Image Analysis", item_name)
+
+    await _stream_text(scope, receive, send, llm_service.aanalyze_image_stream(prompt, image_data))
+
+
+def _last_message_id(scope, room_id):
+    """Mirrors the Flask route: Last-Event-ID or ?after=, else only messages from now on."""
+    last_event_id = dict(scope['headers']).get(b'last-event-id', b'').decode('latin-1')
+    if last_event_id.isdigit():
+        return int(last_event_id)
+    after = parse_qs(scope.get('query_string', b'').decode('latin-1')).get('after', [''])[0]
+    if after.isdigit():
+        return int(after)
+    return collaboration_service.message_count(room_id)
+
+
+async def room_events(scope, receive, send, room_id):
+    _authenticate(scope)
+    if not await asyncio.to_thread(collaboration_service.has_room, room_id):
+        raise HTTPError(404, {"error": "Room not found"})
+    after = await asyncio.to_thread(_last_message_id, scope, room_id)
+    # Subscribe before catching up so nothing posted in between is missed
+    subscription = collaboration_service.subscribe(room_id, loop=asyncio.get_running_loop())
+
+    async def pump():
+        async def emit(text):
+            await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
+
+        last_id = after
+        while True:
+            page = await asyncio.to_thread(collaboration_service.read_messages, room_id, last_id)
+            if not page:
+                break
+            await emit("".join(format_event(message) for message in page))
+            last_id = page[-1]["id"]
+        while True:
+            messages = await subscription.await_messages(HEARTBEAT_SECONDS)
+            if not messages and not subscription.dropped:
+                await emit(": keep-alive\n\n")
+            fresh = await asyncio.to_thread(collaboration_service.in_order, room_id, last_id, messages) if messages else []
+            if fresh:
+                await emit("".join(format_event(message) for message in fresh))
+                last_id = fresh[-1]["id"]
+            if subscription.dropped and not subscription.pending:
+                # Fell too far behind; the client reconnects and catches up from last_id
+                await emit(f"event: overflow\ndata: {last_id}\n\n")
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'),
+                        (b'x-accel-buffering', b'no')] + _cors_headers(scope),
+        })
+        await _until_disconnect(receive, pump())
+    finally:
+        collaboration_service.events.unsubscribe(subscription)
+
+
+STREAMING_ROUTES = {
+    '/api/qa-stream': qa_stream,
+    '/api/analyze-image': analyze_image,
+}
+
+ROOM_EVENTS_PATH = re.compile(r'^/api/collaboration/rooms/([^/]+)/events$')
+
+
+def _route(scope):
+    if scope['type'] != 'http':
+        return None
+    if scope['method'] == 'POST' and not _wants_sse(scope):
+        # Resumable SSE answer streams stay on Flask
+        return STREAMING_ROUTES.get(scope.get('path'))
+    if scope['method'] == 'GET':
+        match = ROOM_EVENTS_PATH.match(scope.get('path', ''))
+        if match:
+            return lambda scope, receive, send: room_events(scope, receive, send, match.group(1))
+    return None
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Once per worker; the pre-warm lock keeps it to a single worker across the server
+            news_service.start_prewarm()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # Write out queued History events before the worker exits
+            await asyncio.to_thread(history_logger.close)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(scope, receive, send)
+        return
+    handler = _route(scope)
+    if handler is None:
+        # Everything else, including CORS preflight, stays on Flask
+        await flask_application(scope, receive, send)
+        return
+
+    try:
+        await handler(scope, receive, send)
+    except HTTPError as e:
+        await _send_json(scope, send, e.status, e.payload, e.headers)
+    except RateLimitExceeded as e:
+        await _send_json(scope, send, 429, {'error': str(e), 'retry_after': e.retry_after},
+                         [(b'retry-after', str(e.retry_after).encode())])
@@ -52,7 +52,7 @@ def logout():
 @jwt_required()
 def get_current_user():
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    user = db.session.get(User, int(current_user_id))
     if not user:
         return jsonify({"msg": "User not found"}), 404
         
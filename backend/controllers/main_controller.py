@@ -1,12 +1,28 @@
 from flask import Blueprint, request, jsonify, Response, stream_with_context
-from services import paper_service, search_service, llm_service, news_service, collaboration_service
-from models import db, History
+from services import paper_service, search_service, llm_service, news_service, collaboration_service, extraction_service, stream_service, history_logger, conversation_service, search_provider
+from services.conversation_service import TurnConflict
+from services.rate_limiter import RateLimitExceeded
+from services.room_events import format_event
+from services.stream_service import HEARTBEAT_SECONDS
+from models import db, History, UserActionCount
 from flask_jwt_extended import jwt_required, get_jwt_identity
 import os
+import json
 from datetime import datetime
 
 main_bp = Blueprint('main', __name__)
 
+# Prompt budgets: only this much of a paper is read for these endpoints
+SUMMARY_CHARS = 3000
+COMPARE_CHARS_PER_PAPER = 2000
+PLAGIARISM_CHARS = 5000  # LLMService.check_plagiarism reads at most this much
+
+@main_bp.errorhandler(RateLimitExceeded)
+def handle_rate_limited(e):
+    response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 429
+
 
 
 @main_bp.route('/upload', methods=['POST'])
@@ -20,23 +36,27 @@ def upload_paper():
     
     filepath = paper_service.save_file(file)
     if filepath:
-        # Extract content for immediate use (like visualization)
-        content = paper_service.extract_text(filepath)
+        # Text extraction and indexing run in the background; poll /upload/status/<job_id>
+        job_id = extraction_service.submit(filepath)
         
-        # Log history
-        user_id = get_jwt_identity()
-        new_history = History(user_id=user_id, action="Uploaded", item_name=file.filename)
-        db.session.add(new_history)
-        db.session.commit()
+        history_logger.log(get_jwt_identity(), "Uploaded", file.filename)
         
         return jsonify({
-            'message': 'File uploaded successfully', 
-            'filename': file.filename,
-            'content': content
-        }), 201
+            'message': 'File uploaded, extraction in progress', 
+            'filename': os.path.basename(filepath),
+            'job_id': job_id
+        }), 202
     else:
         return jsonify({'error': 'Invalid file type'}), 400
 
+@main_bp.route('/upload/status/<job_id>', methods=['GET'])
+@jwt_required()
+def upload_status(job_id):
+    job = extraction_service.get_status(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job), 200
+
 @main_bp.route('/papers', methods=['GET'])
 @jwt_required()
 def list_papers():
@@ -84,7 +104,7 @@ def summarize_paper():
         filepath = paper_service.get_paper_path(filename)
         if not os.path.exists(filepath):
              return jsonify({'error': 'File not found'}), 404
-        content = paper_service.extract_text(filepath)
+        content = paper_service.extract_prefix(filepath, SUMMARY_CHARS)
     else:
         # Otherwise use provided text content (if any, e.g. from search result)
         content = data.get('content')
@@ -92,20 +112,9 @@ def summarize_paper():
     if not content:
         return jsonify({'error': 'Content or filename is required'}), 400
 
-    summary = llm_service.summarize_text(content[:3000]) # Limit tokens
+    summary = llm_service.summarize_text(content[:SUMMARY_CHARS], use_cache=not data.get('fresh')) # Limit tokens
     
-    # Log history
-    try:
-        user_identity = get_jwt_identity()
-        user_id = int(str(user_identity)) if user_identity else None
-    except:
-        user_id = None
-        
-    if user_id:
-        item_name = filename if filename else "Text Snippet"
-        new_history = History(user_id=user_id, action="Summarized", item_name=item_name, content=summary)
-        db.session.add(new_history)
-        db.session.commit()
+    history_logger.log(get_jwt_identity(), "Summarized", filename if filename else "Text Snippet", content=summary)
 
     return jsonify({'summary': summary}), 200
 
@@ -117,36 +126,67 @@ def answer_question():
         return jsonify({'error': 'Invalid request body or Content-Type'}), 400
         
     question = data.get('question')
-    context = data.get('context') 
-    if not context:
-        search_results = search_service.search(question, k=3)
-        context = "\n".join([res['content'] for res in search_results])
-    
     if not question:
         return jsonify({'error': 'Question is required'}), 400
+
+    context = data.get('context') 
+    if not context:
+        # Most relevant passages across the library, trimmed to the prompt token budget
+        context = search_service.build_context(question)
         
     try:
         answer = llm_service.answer_question(context, question)
-        # Log history
-        try:
-            user_identity = get_jwt_identity()
-            user_id = int(str(user_identity)) if user_identity else None
-            if user_id:
-                item_name = (question[:30] + '...') if len(question) > 30 else question
-                new_history = History(user_id=user_id, action="Chat", item_name=item_name, content=answer)
-                db.session.add(new_history)
-                db.session.commit()
-        except Exception as e:
-            print(f"History Log Error: {e}")
-            
+        item_name = (question[:30] + '...') if len(question) > 30 else question
+        history_logger.log(get_jwt_identity(), "Chat", item_name, content=answer)
         return jsonify({'answer': answer}), 200
+    except RateLimitExceeded:
+        raise
     except Exception as e:
         print(f"Error in answer_question: {e}")
         return jsonify({'error': str(e)}), 500
 
+def _wants_sse():
+    return request.args.get('mode') == 'sse' or 'text/event-stream' in request.headers.get('Accept', '')
+
+def _last_event_index(stream_id):
+    """Index of the last chunk the client saw, from Last-Event-ID ('<stream_id>:<n>'), or -1."""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or ''
+    sid, _, index = last_event_id.partition(':')
+    if sid != stream_id or not index.isdigit():
+        return -1
+    return int(index)
+
+def _sse_data(text):
+    """One `data:` line per line of `text`, so line breaks inside it cannot end the event early."""
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(f"data: {line}" for line in lines)
+
+def _sse_response(buffer, start=0):
+    """Streams a buffered generation as Server-Sent Events, one event per chunk, each with a resumable id."""
+    def generate():
+        for index, chunk in stream_service.follow(buffer, start):
+            if chunk is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"id: {buffer.stream_id}:{index}\n{_sse_data(chunk)}\n\n"
+        if buffer.error:
+            yield f"event: error\n{_sse_data(buffer.error)}\n\n"
+        yield f"event: done\ndata: {buffer.stream_id}\n\n"
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+        'X-Stream-Id': buffer.stream_id,
+    })
+
 @main_bp.route('/qa-stream', methods=['POST'])
 @jwt_required()
 def stream_answer_question():
+    # A reconnecting SSE client resumes its generation instead of starting a new one
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id and _wants_sse():
+        return resume_answer_stream(last_event_id.partition(':')[0])
+
     data = request.get_json(silent=True)
     if not data:
         return jsonify({'error': 'Invalid request body'}), 400
@@ -161,26 +201,51 @@ def stream_answer_question():
     if not messages and question:
         messages = [{"role": "user", "content": question}]
 
+    # Use the history-enabled streaming method. The first chunk is pulled before the
+    # response starts so an overloaded LLM budget is reported as a 429, not mid-stream.
+    stream = llm_service.generate_response_stream_with_history(messages)
+    first_chunk = next(stream, "")
+
+    if _wants_sse():
+        buffer = stream_service.start(stream, get_jwt_identity(), first_chunk=first_chunk)
+        return _sse_response(buffer)
+
     def generate():
-        # Use the history-enabled streaming method
-        for chunk in llm_service.generate_response_stream_with_history(messages):
+        yield first_chunk
+        for chunk in stream:
             yield chunk
 
     return Response(stream_with_context(generate()), mimetype='text/plain')
 
+@main_bp.route('/qa-stream/<stream_id>', methods=['GET'])
+@jwt_required()
+def resume_answer_stream(stream_id):
+    buffer = stream_service.get(stream_id, get_jwt_identity())
+    if not buffer:
+        return jsonify({'error': 'Stream not found or expired'}), 404
+    return _sse_response(buffer, start=_last_event_index(stream_id) + 1)
+
 
 @main_bp.route('/save-chat', methods=['POST'])
 @jwt_required()
 def save_chat_history():
-    """Called by frontend after a stream completes to persist the full conversation."""
-    import json as _json
+    """
+    Called by frontend after a stream completes. Send `conversation_id` (omit it to start a new
+    conversation) and the messages from position `offset` on; only ones not yet stored are appended.
+    """
     data = request.get_json(silent=True)
     if not data:
         return jsonify({'error': 'No data'}), 400
 
-    messages = data.get('messages', [])  # Full array [{role, content}, ...]
+    messages = data.get('messages', [])  # [{role, content}, ...] starting at `offset`
     if not messages:
         return jsonify({'error': 'messages required'}), 400
+    try:
+        offset = int(data.get('offset') or 0)
+    except (TypeError, ValueError):
+        offset = -1
+    if offset < 0:
+        return jsonify({'error': 'offset must be a non-negative integer'}), 400
 
     try:
         user_identity = get_jwt_identity()
@@ -188,26 +253,36 @@ def save_chat_history():
         if not user_id:
             return jsonify({'error': 'Unauthenticated'}), 401
 
-        # Build a display title from the first user message
-        first_user = next((m['content'] for m in messages if m.get('role') == 'user'), 'Chat')
-        item_name = (first_user[:60] + '...') if len(first_user) > 60 else first_user
-
-        # Store the full conversation as JSON string
-        content_json = _json.dumps(messages, ensure_ascii=False)
-
-        new_history = History(
-            user_id=user_id,
-            action='Chat',
-            item_name=item_name,
-            content=content_json
-        )
-        db.session.add(new_history)
-        db.session.commit()
-        return jsonify({'status': 'saved'}), 200
+        conversation = conversation_service.append(
+            user_id, data.get('conversation_id'), messages, offset=offset)
+        return jsonify({'status': 'saved', 'conversation_id': conversation.id, 'turn_count': conversation.turn_count}), 200
+    except LookupError:
+        return jsonify({'error': 'Conversation not found'}), 404
+    except TurnConflict as e:
+        # The client resends from turn_count (or everything, with offset 0)
+        return jsonify({'error': str(e), 'turn_count': e.turn_count}), 409
     except Exception as e:
+        db.session.rollback()
         print(f"save_chat_history error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@main_bp.route('/conversations', methods=['GET'])
+@jwt_required()
+def list_conversations():
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    return jsonify({'conversations': conversation_service.list(int(get_jwt_identity()), limit)}), 200
+
+@main_bp.route('/conversations/<conversation_id>', methods=['GET'])
+@jwt_required()
+def get_conversation(conversation_id):
+    """A conversation and its turns in order. `?after=<n>` skips the first n turns; `?limit=` (default 100, at most 500) caps the page."""
+    conversation = conversation_service.get(int(get_jwt_identity()), conversation_id)
+    if conversation is None:
+        return jsonify({'error': 'Conversation not found'}), 404
+    limit = max(1, min(request.args.get('limit', 100, type=int), 500))
+    turns = conversation_service.turns(conversation_id, request.args.get('after', 0, type=int), limit)
+    return jsonify(dict(conversation.to_dict(), turns=turns)), 200
+
 @main_bp.route('/analyze-image', methods=['POST'])
 @jwt_required()
 def analyze_image():
@@ -218,20 +293,15 @@ def analyze_image():
     if not image_data:
         return jsonify({'error': 'Image data required'}), 400
 
-    # Log history
-    try:
-        user_identity = get_jwt_identity()
-        user_id = int(str(user_identity)) if user_identity else None
-        if user_id:
-            item_name = (prompt[:30] + '...') if len(prompt) > 30 else prompt
-            new_history = History(user_id=user_id, action="Image Analysis", item_name=item_name)
-            db.session.add(new_history)
-            db.session.commit()
-    except Exception as e:
-        print(f"History Log Error: {e}")
+    item_name = (prompt[:30] + '...') if len(prompt) > 30 else prompt
+    history_logger.log(get_jwt_identity(), "Image Analysis", item_name)
+
+    stream = llm_service.analyze_image_stream(prompt, image_data)
+    first_chunk = next(stream, "")
 
     def generate():
-        for chunk in llm_service.analyze_image_stream(prompt, image_data):
+        yield first_chunk
+        for chunk in stream:
             yield chunk
 
     return Response(stream_with_context(generate()), mimetype='text/plain')
@@ -263,16 +333,7 @@ def visualize_paper():
     if not result:
         return jsonify({'error': 'Failed to generate visualization. Ensure your Groq key is valid.'}), 500
 
-    # Log history
-    try:
-        user_identity = get_jwt_identity()
-        user_id = int(str(user_identity)) if user_identity else None
-        if user_id:
-            new_history = History(user_id=user_id, action="Visual Abstract", item_name=filename, content=result.get('image'))
-            db.session.add(new_history)
-            db.session.commit()
-    except Exception as e:
-        print(f"History Log Error: {e}")
+    history_logger.log(get_jwt_identity(), "Visual Abstract", filename, content=result.get('image'))
 
     return jsonify(result), 200
 
@@ -286,19 +347,15 @@ def compare_papers():
     for filename in filenames:
         filepath = paper_service.get_paper_path(filename)
         if os.path.exists(filepath):
-            content = paper_service.extract_text(filepath)
-            papers_content.append(content[:2000] if content else "") # Limit tokens per paper
+            content = paper_service.extract_prefix(filepath, COMPARE_CHARS_PER_PAPER) # Limit tokens per paper
+            papers_content.append(content or "")
             
     if len(papers_content) < 2:
         return jsonify({'error': 'At least two valid papers required for comparison'}), 400
         
     comparison = llm_service.compare_papers(papers_content)
     
-    # Log history
-    user_id = get_jwt_identity()
-    new_history = History(user_id=user_id, action="Compared", item_name=", ".join(filenames))
-    db.session.add(new_history)
-    db.session.commit()
+    history_logger.log(get_jwt_identity(), "Compared", ", ".join(filenames))
     
     return jsonify({'comparison': comparison}), 200
 
@@ -315,8 +372,10 @@ def check_plagiarism():
         if file.filename != '':
             filepath = paper_service.save_file(file)
             if filepath:
-                content = paper_service.extract_text(filepath)
+                content = paper_service.extract_prefix(filepath, PLAGIARISM_CHARS)
                 filename = file.filename
+                # Add the file to the search index without holding up the audit
+                extraction_service.submit(filepath)
             else:
                 return jsonify({'error': 'Invalid file type'}), 400
     
@@ -360,15 +419,7 @@ def check_plagiarism():
     # Include internal matches in the final response for the UI to show
     result_data['internal_matches'] = internal_matches
     
-    # Log history
-    try:
-        user_id = get_jwt_identity()
-        if user_id:
-            new_history = History(user_id=int(user_id), action="Forensic Audit", item_name=filename)
-            db.session.add(new_history)
-            db.session.commit()
-    except Exception as e:
-        print(f"History Log Error: {e}")
+    history_logger.log(get_jwt_identity(), "Forensic Audit", filename)
         
     return jsonify({'result': result_data}), 200
 
@@ -376,35 +427,30 @@ def check_plagiarism():
 @main_bp.route('/dashboard', methods=['GET'])
 @jwt_required()
 def get_dashboard_data():
-    user_id = get_jwt_identity()
+    user_id = int(get_jwt_identity())
     
-    # Fetch real user history
+    # Fetch real user history (served by the (user_id, timestamp) index)
     history = History.query.filter_by(user_id=user_id).order_by(History.timestamp.desc()).limit(10).all()
     recent_activity = []
     
     for item in history:
-        # Calculate relative time if needed, or send ISO string
-        recent_activity.append({
-            "action": item.action,
-            "item": item.item_name,
-            "content": item.content,
-            "time": item.timestamp.strftime("%Y-%m-%d %H:%M"),
-            "user": "You"
-        })
+        # Large bodies are left out (only the preview); the client fetches them from /history/<id>
+        activity = item.to_dict()
+        activity["time"] = item.timestamp.strftime("%Y-%m-%d %H:%M")
+        recent_activity.append(activity)
     
     # Calculate stats
-    papers = paper_service.list_papers()
-    paper_count = len(papers)
+    paper_count = paper_service.paper_count()
     
     # Count specific user actions
-    summary_count = History.query.filter_by(user_id=user_id, action="Summarized").count()
+    summary_count = UserActionCount.get(user_id, "Summarized")
     
     research_hours_saved = (paper_count * 0.5) + (summary_count * 0.2)
     
     stats = [
         {"label": "Total Papers", "value": str(paper_count), "trend": "Global", "color": "#10b981"},
         {"label": "Summaries Generated", "value": str(summary_count), "trend": "Personal", "color": "#10b981"}, 
-        {"label": "Active Collaborations", "value": str(len(collaboration_service.rooms)), "trend": "Active", "color": "#6b7280"},
+        {"label": "Active Collaborations", "value": str(collaboration_service.room_count()), "trend": "Active", "color": "#6b7280"},
         {"label": "Research Hours Saved", "value": f"{research_hours_saved:.1f}h", "trend": "Est.", "color": "#10b981"},
     ]
         
@@ -413,6 +459,15 @@ def get_dashboard_data():
         "recent_activity": recent_activity
     }), 200
 
+@main_bp.route('/history/<int:history_id>', methods=['GET'])
+@jwt_required()
+def get_history_item(history_id):
+    """One history entry with its full content, for entries listed with only a preview."""
+    item = History.query.filter_by(id=history_id, user_id=int(get_jwt_identity())).first()
+    if item is None:
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify(item.to_dict(full=True)), 200
+
 @main_bp.route('/web-research', methods=['POST'])
 @jwt_required()
 def deep_web_research():
@@ -427,16 +482,7 @@ def deep_web_research():
     if not result:
         return jsonify({'error': 'Web research failed. Check API configuration.'}), 500
         
-    # Log history
-    try:
-        user_identity = get_jwt_identity()
-        user_id = int(str(user_identity)) if user_identity else None
-        if user_id:
-            new_history = History(user_id=user_id, action="Web Research", item_name=query[:30], content=result.get('answer'))
-            db.session.add(new_history)
-            db.session.commit()
-    except Exception as e: 
-        print(f"Log error: {e}")
+    history_logger.log(get_jwt_identity(), "Web Research", query[:30], content=result.get('answer'))
         
     return jsonify(result), 200
 
@@ -450,19 +496,9 @@ def generate_knowledge_graph():
     if not content:
         return jsonify({'error': 'Content required for graph extraction'}), 400
         
-    graph_data = llm_service.extract_knowledge_graph(content)
+    graph_data = llm_service.extract_knowledge_graph(content, use_cache=not data.get('fresh'))
     
-    # Log history
-    try:
-        import json
-        user_identity = get_jwt_identity()
-        user_id = int(str(user_identity)) if user_identity else None
-        if user_id:
-            new_history = History(user_id=user_id, action="Knowledge Map", item_name=filename, content=json.dumps(graph_data))
-            db.session.add(new_history)
-            db.session.commit()
-    except Exception as e: 
-        print(f"Log error: {e}")
+    history_logger.log(get_jwt_identity(), "Knowledge Map", filename, content=json.dumps(graph_data))
         
     return jsonify(graph_data), 200
 
@@ -499,17 +535,9 @@ def check_ieee():
     data = request.get_json()
     content = data.get('content')
     if not content: return jsonify({'error': 'Content required'}), 400
-    result = llm_service.check_ieee_compliance(content)
+    result = llm_service.check_ieee_compliance(content, use_cache=not data.get('fresh'))
     
-    # Log history
-    try:
-        user_identity = get_jwt_identity()
-        user_id = int(str(user_identity)) if user_identity else None
-        if user_id:
-            new_history = History(user_id=user_id, action="IEEE Audit", item_name="Format Check")
-            db.session.add(new_history)
-            db.session.commit()
-    except: pass
+    history_logger.log(get_jwt_identity(), "IEEE Audit", "Format Check")
     
     return jsonify(result), 200
 
@@ -522,17 +550,9 @@ def draft_section():
     context = data.get('context', '')
     if not topic or not section_type: 
         return jsonify({'error': 'Topic and section type required'}), 400
-    draft = llm_service.draft_academic_section(topic, section_type, context)
+    draft = llm_service.draft_academic_section(topic, section_type, context, use_cache=not data.get('fresh'))
     
-    # Log history
-    try:
-        user_identity = get_jwt_identity()
-        user_id = int(str(user_identity)) if user_identity else None
-        if user_id:
-            new_history = History(user_id=user_id, action="Drafted", item_name=section_type)
-            db.session.add(new_history)
-            db.session.commit()
-    except: pass
+    history_logger.log(get_jwt_identity(), "Drafted", section_type)
     
     return jsonify({'draft': draft}), 200
 @main_bp.route('/synthesize-papers', methods=['POST'])
@@ -545,15 +565,7 @@ def synthesize_papers():
     
     result = llm_service.synthesize_multiple_papers(papers)
     
-    # Log history
-    try:
-        user_identity = get_jwt_identity()
-        user_id = int(str(user_identity)) if user_identity else None
-        if user_id:
-            new_history = History(user_id=user_id, action="Synthesized", item_name=f"{len(papers)} Papers")
-            db.session.add(new_history)
-            db.session.commit()
-    except: pass
+    history_logger.log(get_jwt_identity(), "Synthesized", f"{len(papers)} Papers")
     
     return jsonify(result), 200
 
@@ -566,10 +578,20 @@ def create_room():
     room_id = collaboration_service.create_room(name)
     return jsonify({"room_id": room_id}), 201
 
+def _message_page_args():
+    return {
+        "after": request.args.get('after', type=int),
+        "limit": request.args.get('limit', type=int),
+        "since": request.args.get('since'),
+    }
+
 @main_bp.route('/collaboration/rooms/<room_id>', methods=['GET'])
 @jwt_required()
 def get_room(room_id):
-    room = collaboration_service.get_room(room_id)
+    try:
+        room = collaboration_service.get_room(room_id, **_message_page_args())
+    except ValueError:
+        return jsonify({"error": "since must be a message id or an ISO timestamp"}), 400
     if not room:
         return jsonify({"error": "Room not found"}), 404
     return jsonify(room), 200
@@ -594,11 +616,68 @@ def add_room_message():
 @main_bp.route('/collaboration/rooms/<room_id>/messages', methods=['GET'])
 @jwt_required()
 def get_room_messages(room_id):
-    messages = collaboration_service.get_messages(room_id)
-    return jsonify({"messages": messages}), 200
+    try:
+        page = collaboration_service.get_messages(room_id, **_message_page_args())
+    except ValueError:
+        return jsonify({"error": "since must be a message id or an ISO timestamp"}), 400
+    return jsonify(page), 200
+
+def _last_message_id(room_id):
+    """Where a room subscription starts: Last-Event-ID or ?after=, else only messages from now on."""
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    if last_event_id.isdigit():
+        return int(last_event_id)
+    after = request.args.get('after', type=int)
+    return after if after is not None else collaboration_service.message_count(room_id)
+
+@main_bp.route('/collaboration/rooms/<room_id>/events', methods=['GET'])
+@jwt_required()
+def room_events(room_id):
+    """Pushes new room messages as Server-Sent Events instead of having clients poll."""
+    if not collaboration_service.has_room(room_id):
+        return jsonify({"error": "Room not found"}), 404
+    after = _last_message_id(room_id)
+    # Subscribe before catching up so nothing posted in between is missed
+    subscription = collaboration_service.subscribe(room_id)
+
+    def generate():
+        last_id = after
+        try:
+            for message in collaboration_service.iter_messages(room_id, after):
+                yield format_event(message)
+                last_id = message["id"]
+            while True:
+                messages = subscription.wait(HEARTBEAT_SECONDS)
+                if not messages and not subscription.dropped:
+                    yield ": keep-alive\n\n"
+                for message in collaboration_service.in_order(room_id, last_id, messages):
+                    yield format_event(message)
+                    last_id = message["id"]
+                if subscription.dropped and not subscription.pending:
+                    # Fell too far behind; the client reconnects and catches up from last_id
+                    yield f"event: overflow\ndata: {last_id}\n\n"
+                    return
+        finally:
+            collaboration_service.events.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
 
 @main_bp.route('/collaboration/rooms', methods=['GET'])
 @jwt_required()
 def list_rooms():
     rooms = collaboration_service.list_rooms()
     return jsonify({"rooms": rooms}), 200
+
+@main_bp.route('/stats', methods=['GET'])
+@jwt_required()
+def service_stats():
+    return jsonify({
+        'llm': llm_service.stats(),
+        'collaboration': collaboration_service.events.stats(),
+        'history': history_logger.stats(),
+        'news': news_service.stats(),
+        'search': search_provider.stats(),
+    }), 200
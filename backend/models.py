@@ -1,8 +1,60 @@
+import gzip
+import hashlib
+import json
+import os
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, func, inspect, select, text
+from sqlalchemy.dialects import postgresql, sqlite
 from datetime import datetime
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 db = SQLAlchemy()
 
+# History content longer than this is moved out of the row into a compressed blob
+HISTORY_INLINE_MAX = int(os.getenv("HISTORY_INLINE_MAX", "2048"))
+PREVIEW_CHARS = 280
+
+def database_url():
+    """DATABASE_URL, defaulting to the bundled SQLite file. Accepts Heroku-style postgres:// URLs."""
+    url = os.getenv("DATABASE_URL", "sqlite:///research_agent.db")
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return url
+
+def engine_options(url):
+    """Connection pool settings for SQLALCHEMY_ENGINE_OPTIONS; read at call time so .env values apply."""
+    options = {
+        "pool_pre_ping": True,
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    }
+    if url.startswith("sqlite"):
+        # The driver's timeout doubles as busy_timeout: writers wait for the lock instead of failing
+        options["connect_args"] = {"timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")) / 1000}
+    else:
+        options.update(
+            pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+            max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+            pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "30")),
+        )
+    return options
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers proceed while a write is in progress
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))}")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+def configure_engine():
+    """Per-connection setup for the app's engine. Call inside an app context before first use."""
+    if db.engine.dialect.name == 'sqlite':
+        event.listen(db.engine, "connect", _sqlite_pragmas)
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -15,14 +67,196 @@ class History(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     action = db.Column(db.String(50), nullable=False) 
     item_name = db.Column(db.String(200), nullable=False)
-    content = db.Column(db.Text, nullable=True)
+    content = db.Column(db.Text, nullable=True)  # Only small payloads; larger ones live in HistoryBlob
+    content_ref = db.Column(db.String(64), nullable=True)
+    content_size = db.Column(db.Integer, nullable=True)
+    preview = db.Column(db.String(300), nullable=True)
+    conversation_id = db.Column(db.String(36), nullable=True)  # Set on 'Chat' entries; the turns live in ChatTurn
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
-    def to_dict(self):
+    __table_args__ = (
+        db.Index('ix_history_user_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_history_user_action', 'user_id', 'action'),
+    )
+
+    def body(self):
+        """The full content, loading and decompressing the blob if it was stored separately."""
+        if self.content_ref:
+            blob = db.session.get(HistoryBlob, self.content_ref)
+            return blob.unpack() if blob else None
+        return self.content
+
+    def to_dict(self, full=False):
+        """`content` is only included when it is stored inline, unless `full` is set; `preview` always is."""
         return {
+            'id': self.id,
             'action': self.action,
             'item': self.item_name,
-            'content': self.content,
+            'content': self.body() if full else self.content,
+            'preview': self.preview or (self.content[:PREVIEW_CHARS] if self.content else None),
+            'content_size': self.content_size if self.content_ref else len(self.content or ''),
+            'conversation_id': self.conversation_id,
             'time': self.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
             'user': 'You'
         }
+
+    @staticmethod
+    def externalize(row):
+        """
+        Moves a large `content` out of a History row dict into a blob dict, leaving a
+        reference and a preview. Returns the blob (None if the content stays inline).
+        """
+        content = row.get("content")
+        if not content or len(content) <= HISTORY_INLINE_MAX:
+            return None
+        blob = HistoryBlob.pack(content)
+        row.update(content=None, content_ref=blob["digest"], content_size=len(content), preview=make_preview(content))
+        return blob
+
+class HistoryBlob(db.Model):
+    """A compressed History payload, keyed by the SHA-256 of its text so repeats are stored once."""
+    digest = db.Column(db.String(64), primary_key=True)
+    codec = db.Column(db.String(10), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+    @staticmethod
+    def pack(content):
+        raw = content.encode('utf-8')
+        if zstandard is not None:
+            codec, data = 'zstd', zstandard.ZstdCompressor(level=10).compress(raw)
+        else:
+            codec, data = 'gzip', gzip.compress(raw, compresslevel=6)
+        return {"digest": hashlib.sha256(raw).hexdigest(), "codec": codec, "size": len(raw), "data": data}
+
+    def unpack(self):
+        if self.codec == 'zstd':
+            raw = zstandard.ZstdDecompressor().decompress(self.data)
+        else:
+            raw = gzip.decompress(self.data)
+        return raw.decode('utf-8')
+
+def make_preview(content):
+    """Short display text: the first assistant reply of a saved conversation, else the start of the text."""
+    if content.startswith('['):
+        try:
+            messages = json.loads(content)
+            reply = next((m.get('content') for m in messages if isinstance(m, dict) and m.get('role') == 'assistant'), None)
+            if isinstance(reply, str):
+                content = reply
+        except ValueError:
+            pass
+    return content[:PREVIEW_CHARS]
+
+def insert_blobs(blobs):
+    """Inserts blob dicts, skipping digests that are already stored."""
+    if not blobs:
+        return
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    db.session.execute(dialect.insert(HistoryBlob).on_conflict_do_nothing(index_elements=['digest']), blobs)
+
+class UserActionCount(db.Model):
+    """Running count of History rows per user and action, kept up to date by the history writer."""
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    action = db.Column(db.String(50), primary_key=True)
+    total = db.Column(db.Integer, nullable=False, default=0)
+
+    @staticmethod
+    def get(user_id, action):
+        row = db.session.get(UserActionCount, (int(user_id), action))
+        return row.total if row else 0
+
+class Conversation(db.Model):
+    """A chat with a stable id. Its messages are ChatTurn rows, appended as the chat goes on."""
+    id = db.Column(db.String(36), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    turn_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_conversation_user_updated', 'user_id', 'updated_at'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'turn_count': self.turn_count,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+
+class ChatTurn(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    conversation_id = db.Column(db.String(36), db.ForeignKey('conversation.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)  # 0-based position in the conversation
+    role = db.Column(db.String(20), nullable=False)
+    content = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('conversation_id', 'seq', name='uq_chat_turn_seq'),
+    )
+
+    def to_dict(self):
+        return {'role': self.role, 'content': self.content}
+
+def init_db():
+    """
+    Creates missing tables, then the columns and indexes create_all skips on
+    tables that already exist, moves large inline history content into blobs,
+    and fills the counters from an existing history table.
+    """
+    db.create_all()
+    _add_missing_columns(History.__table__)
+    for index in History.__table__.indexes:
+        index.create(bind=db.engine, checkfirst=True)
+    _externalize_history()
+    if db.session.query(UserActionCount).first() is None and db.session.query(History.id).first() is not None:
+        try:
+            db.session.execute(UserActionCount.__table__.insert().from_select(
+                ['user_id', 'action', 'total'],
+                select(History.user_id, History.action, func.count()).group_by(History.user_id, History.action),
+            ))
+            db.session.commit()
+        except Exception as e:
+            # Another worker got there first
+            db.session.rollback()
+            print(f"Counter backfill skipped: {e}")
+
+def _add_missing_columns(table):
+    """create_all never alters existing tables; add any columns the model has gained since."""
+    existing = {column['name'] for column in inspect(db.engine).get_columns(table.name)}
+    preparer = db.engine.dialect.identifier_preparer
+    with db.engine.begin() as conn:
+        for column in table.columns:
+            if column.name not in existing:
+                conn.execute(text(
+                    f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN "
+                    f"{preparer.format_column(column)} {column.type.compile(dialect=db.engine.dialect)}"
+                ))
+
+def _externalize_history(chunk=500):
+    """Moves large inline History content written before blobs existed into HistoryBlob."""
+    moved = 0
+    while True:
+        rows = db.session.execute(
+            select(History.id, History.content)
+            .where(History.content_ref.is_(None), func.length(History.content) > HISTORY_INLINE_MAX)
+            .limit(chunk)
+        ).all()
+        if not rows:
+            break
+        updates, blobs = [], []
+        for history_id, content in rows:
+            row = {"content": content}
+            blobs.append(History.externalize(row))
+            updates.append(dict(row, history_id=history_id))
+        insert_blobs(blobs)
+        db.session.execute(History.__table__.update().where(History.id == db.bindparam('history_id')), updates)
+        db.session.commit()
+        moved += len(rows)
+    if moved:
+        print(f"Moved {moved} large history payloads into blob storage")
@@ -0,0 +1,52 @@
+"""
+Entry points for the PDF worker processes (the page pool and the extraction pool).
+
+Pool processes are started with forkserver or spawn and import the module of
+the function they run, so this module is kept outside the services package and
+imports only what parsing needs: importing `services` would create every
+service singleton and its stores in each worker.
+"""
+import os
+import sqlite3
+
+import pypdf
+
+
+def lower_priority(niceness):
+    """Pool initializer: renices the worker process where the OS supports it."""
+    if niceness and hasattr(os, 'nice'):
+        try:
+            os.nice(niceness)
+        except OSError:
+            pass
+
+
+def extract_page_range(filepath, start, stop):
+    """Extracts pages [start, stop) of a PDF. Each worker opens its own reader."""
+    with open(filepath, 'rb') as f:
+        pdf_reader = pypdf.PdfReader(f)
+        return [pdf_reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def mark_extracting(job_db, job_id):
+    """Moves a queued job in the JobStore database to 'extracting'."""
+    conn = sqlite3.connect(job_db, timeout=10)
+    try:
+        with conn:
+            conn.execute("UPDATE jobs SET status = 'extracting' WHERE job_id = ? AND status = 'queued'", (job_id,))
+    finally:
+        conn.close()
+
+
+def extract_job(filepath, job_db, job_id):
+    """
+    Extraction pool task: returns the text of each page of an uploaded paper.
+    Pages are parsed one after another; the pool itself is the parallelism.
+    The caller stores the result in the text cache.
+    """
+    mark_extracting(job_db, job_id)
+    if filepath.endswith('.pdf'):
+        with open(filepath, 'rb') as f:
+            return [page.extract_text() or "" for page in pypdf.PdfReader(f).pages]
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return [f.read()]
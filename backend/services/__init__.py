@@ -1,11 +1,21 @@
+from .search_provider import SearchProvider
 from .paper_service import PaperService
 from .search_service import SearchService
 from .llm_service import LLMService
 from .news_service import NewsService
 from .collaboration_service import CollaborationService
+from .extraction_service import ExtractionService
+from .stream_service import StreamService
+from .history_logger import HistoryLogger
+from .conversation_service import ConversationService
 
+search_provider = SearchProvider()  # One pooled Tavily client shared by LLMService and NewsService
 paper_service = PaperService()
 search_service = SearchService(paper_service)
-llm_service = LLMService()
-news_service = NewsService()
+llm_service = LLMService(search_provider)
+news_service = NewsService(search_provider)
 collaboration_service = CollaborationService()
+extraction_service = ExtractionService(paper_service, search_service)
+stream_service = StreamService()
+history_logger = HistoryLogger()
+conversation_service = ConversationService(history_logger)
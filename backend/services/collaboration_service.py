@@ -1,54 +1,139 @@
-import json
 import os
+import threading
+import time
 import uuid
 from datetime import datetime
+from .room_store import create_room_store
+from .room_events import RoomBroker
 
-ROOMS_FILE = 'rooms.json'
+ROOMS_FILE = 'rooms.json'  # Legacy single-file storage, migrated into the room store on first start
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# How often a worker checks a shared store for messages posted through other workers
+CHANGE_POLL_INTERVAL = float(os.getenv("COLLAB_POLL_INTERVAL", "0.25"))
 
 class CollaborationService:
-    def __init__(self):
-        self.rooms_file = ROOMS_FILE
-        self.rooms = self._load_rooms()
+    def __init__(self, store=None, events=None):
+        self.store = store or create_room_store(legacy_file=ROOMS_FILE)
+        self.events = events or RoomBroker()
+        self._watcher = None
+        self._watcher_lock = threading.Lock()
 
-    def _load_rooms(self):
-        if os.path.exists(self.rooms_file):
-            with open(self.rooms_file, 'r') as f:
-                return json.load(f)
-        return {}
+    def has_room(self, room_id):
+        return self.store.get_room(room_id) is not None
 
-    def _save_rooms(self):
-        with open(self.rooms_file, 'w') as f:
-            json.dump(self.rooms, f, indent=4)
+    def room_count(self):
+        return self.store.room_count()
+
+    def message_count(self, room_id):
+        """Number of messages in the room, which is also the id of its newest message."""
+        return self.store.message_count(room_id)
+
+    def read_messages(self, room_id, after, limit=MAX_PAGE_SIZE):
+        """Up to `limit` messages with ids after `after`, oldest first."""
+        return self.store.read_messages(room_id, after, limit)
 
     def create_room(self, name):
         room_id = str(uuid.uuid4())
-        self.rooms[room_id] = {
-            "name": name,
-            "created_at": str(datetime.now()),
-            "messages": []
-        }
-        self._save_rooms()
+        self.store.create_room(room_id, name, str(datetime.now()))
         return room_id
 
-    def get_room(self, room_id):
-        return self.rooms.get(room_id)
+    def get_room(self, room_id, after=None, limit=DEFAULT_PAGE_SIZE, since=None):
+        room = self.store.get_room(room_id)
+        if room is None:
+            return None
+        return dict(room, **self.get_messages(room_id, after, limit, since))
 
     def add_message(self, room_id, user, content):
-        if room_id in self.rooms:
-            message = {
-                "user": user,
-                "content": content,
-                "timestamp": str(datetime.now())
-            }
-            self.rooms[room_id]["messages"].append(message)
-            self._save_rooms()
-            return message
-        return None
-
-    def get_messages(self, room_id):
-        if room_id in self.rooms:
-            return self.rooms[room_id]["messages"]
-        return []
+        message = {
+            "user": user,
+            "content": content,
+            "timestamp": str(datetime.now())
+        }
+        message = self.store.append_message(room_id, message)
+        if message:
+            self.events.publish(room_id, message)
+        return message
+
+    def get_messages(self, room_id, after=None, limit=DEFAULT_PAGE_SIZE, since=None):
+        """
+        One page of a room's messages, oldest first.
+
+        `after` is a message id cursor. `since` is either a message id or an ISO
+        timestamp, for polling clients that only want what is new. With neither,
+        the most recent `limit` messages are returned. Pass the returned
+        `next_cursor` back as `after` (or `since`) to continue.
+        """
+        limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+        if after is None and since is not None:
+            since = str(since)
+            if since.isdigit():
+                after = int(since)
+            else:
+                timestamp = datetime.fromisoformat(since)
+                if timestamp.tzinfo:
+                    # Stored timestamps are naive local time
+                    timestamp = timestamp.astimezone().replace(tzinfo=None)
+                after = self.store.last_id_before(room_id, timestamp)
+        if after is None:
+            after = max(0, self.store.message_count(room_id) - limit)
+
+        messages = self.store.read_messages(room_id, after, limit)
+        next_cursor = messages[-1]["id"] if messages else after
+        return {
+            "messages": messages,
+            "next_cursor": next_cursor,
+            "has_more": next_cursor < self.store.message_count(room_id),
+        }
+
+    def iter_messages(self, room_id, after=0):
+        """Every message after `after`, read a page at a time. Used to catch up a subscriber."""
+        while True:
+            page = self.store.read_messages(room_id, after, MAX_PAGE_SIZE)
+            if not page:
+                return
+            yield from page
+            after = page[-1]["id"]
+
+    def in_order(self, room_id, last_id, messages):
+        """
+        Which of `messages` to send a subscriber that has seen everything up to `last_id`.
+        Drops repeats, and if any id is missing (messages from other workers can arrive
+        late) reads the run from the store instead, so subscribers always see ids in order.
+        """
+        fresh = sorted((m for m in messages if m["id"] > last_id), key=lambda m: m["id"])
+        if fresh and fresh[-1]["id"] - last_id != len(fresh):
+            return self.store.read_messages(room_id, last_id, fresh[-1]["id"] - last_id)
+        return fresh
+
+    def subscribe(self, room_id, loop=None):
+        """Live feed of new messages in the room. Pass `loop` to consume it from asyncio."""
+        if self.store.shared:
+            self._start_watcher()
+        return self.events.subscribe(room_id, loop)
+
+    def _start_watcher(self):
+        """
+        With a store shared between workers, messages posted through another worker are
+        picked up here and fanned out to this process's subscribers.
+        """
+        with self._watcher_lock:
+            if self._watcher is not None:
+                return
+            cursor = self.store.change_cursor()
+
+            def watch(cursor):
+                while True:
+                    try:
+                        cursor, changes = self.store.changes_since(cursor)
+                        for room_id, message in changes:
+                            self.events.publish(room_id, message)
+                    except Exception as e:
+                        print(f"Room change watcher error: {e}")
+                    time.sleep(CHANGE_POLL_INTERVAL)
+
+            self._watcher = threading.Thread(target=watch, args=(cursor,), daemon=True)
+            self._watcher.start()
 
     def list_rooms(self):
-        return [{"id": rid, "name": data["name"], "created_at": data.get("created_at")} for rid, data in self.rooms.items()]
+        return self.store.list_rooms()
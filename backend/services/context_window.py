@@ -0,0 +1,161 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from .response_cache import ResponseCache, make_key
+from .tokens import count_tokens, truncate_to_tokens
+
+# Prompt tokens a chat request may use, system prompt included
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+# Old turns are folded into the summary this many at a time, so cut points (and cache keys) stay put
+SUMMARY_CHUNK_TURNS = int(os.getenv("CONTEXT_SUMMARY_CHUNK", "6"))
+SUMMARY_TOKENS = 400  # Room kept for the summary message
+SUMMARY_INPUT_TOKENS_PER_TURN = 600
+MESSAGE_OVERHEAD_TOKENS = 4  # Role and separators per message
+# Summaries have their own store so they neither evict nor skew the stats of cached LLM responses
+SUMMARY_CACHE_PATH = os.path.join('llm_cache', 'summaries.db')
+SUMMARY_CACHE_TTL = int(os.getenv("CONTEXT_SUMMARY_TTL", str(7 * 24 * 3600)))
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("CONTEXT_SUMMARY_MAX_ENTRIES", "5000"))
+
+
+def message_tokens(message: dict) -> int:
+    content = message.get('content')
+    return MESSAGE_OVERHEAD_TOKENS + (count_tokens(content) if isinstance(content, str) else 0)
+
+
+class ContextWindow:
+    """
+    Keeps a chat request within a token budget.
+
+    System messages are always kept, followed by as many of the most recent turns
+    as fit. Older turns are replaced by one rolling summary. The conversation is
+    summarized in chunks of SUMMARY_CHUNK_TURNS turns. Each chunk's summary is
+    stored under a key chained from the previous chunk's key and the chunk's turns,
+    so every later request in the same chat reuses it.
+
+    Summarizing never delays a request: `fit` uses the longest summary already
+    stored and queues the newly expired chunks to be folded in by a background
+    thread, so the next request in the chat finds them summarized.
+    """
+
+    def __init__(self, summarize: Callable[[Optional[str], List[dict]], Optional[str]], cache=None,
+                 budget: int = CONTEXT_TOKEN_BUDGET, chunk_turns: int = SUMMARY_CHUNK_TURNS):
+        self.summarize = summarize  # (previous summary or None, turns) -> new summary; raises on failure
+        self.cache = cache or ResponseCache(SUMMARY_CACHE_PATH, SUMMARY_CACHE_TTL, SUMMARY_CACHE_MAX_ENTRIES)
+        self.budget = budget
+        self.chunk_turns = max(1, chunk_turns)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="context-summary")
+        self.pending = set()  # Keys of summaries queued or being computed
+        self.lock = threading.Lock()
+        self.trimmed = 0
+        self.summaries_computed = 0
+        self.summaries_reused = 0
+        self.summaries_missing = 0
+        self.summaries_failed = 0
+
+    def fit(self, messages: List[dict]) -> List[dict]:
+        """`messages` (system prompt first) cut down to the budget, with older turns summarized."""
+        pinned = [m for m in messages if m['role'] == 'system']
+        turns = [m for m in messages if m['role'] != 'system']
+        if sum(message_tokens(m) for m in messages) <= self.budget:
+            return messages
+
+        self.trimmed += 1
+        # Injected documents can be large on their own; each gets at most a quarter of the budget
+        pinned = pinned[:1] + [dict(m, content=truncate_to_tokens(m['content'], self.budget // 4)) for m in pinned[1:]]
+        available = self.budget - sum(message_tokens(m) for m in pinned) - SUMMARY_TOKENS
+        if not turns:
+            return pinned
+
+        kept, used = 0, 0
+        for message in reversed(turns):
+            used += message_tokens(message)
+            if used > available:
+                break
+            kept += 1
+        cut = len(turns) - kept
+        # Round up to a whole chunk so the next request in this chat hits the same stored summary
+        cut = min(-(-cut // self.chunk_turns) * self.chunk_turns, len(turns) - 1)
+        recent = turns[cut:]
+        if recent and message_tokens(recent[0]) > available:
+            # A single message over the budget: keep its beginning
+            recent = [dict(recent[0], content=truncate_to_tokens(recent[0]['content'], max(available, SUMMARY_TOKENS)))]
+
+        summary = self._summary(turns[:cut]) if cut > 0 else None
+        if summary:
+            pinned = pinned + [{"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}]
+        return pinned + recent
+
+    def _chunk_keys(self, turns: List[dict]) -> List[tuple]:
+        """
+        (end, key) after each whole chunk from the start of `turns`. A partial last chunk
+        gets no key: later requests cut at a chunk boundary, so none would look it up.
+        """
+        keys, key = [], None
+        for end in range(self.chunk_turns, len(turns) + 1, self.chunk_turns):
+            chunk = turns[end - self.chunk_turns:end]
+            key = make_key('context-summary', key, [[m['role'], m['content']] for m in chunk])
+            keys.append((end, key))
+        return keys
+
+    def _stored(self, keys: List[tuple]):
+        """(turns covered, summary) of the longest stored summary, or (0, None)."""
+        for end, key in reversed(keys):
+            summary = self.cache.get(key)
+            if summary is not None:
+                return end, summary
+        return 0, None
+
+    def _summary(self, turns: List[dict]) -> Optional[str]:
+        """
+        The stored summary covering the most of `turns`; whole chunks not yet covered are
+        queued for the background. Turns it does not cover are left out of this request.
+        """
+        keys = self._chunk_keys(turns)
+        if not keys:
+            return None
+        whole = keys[-1][0]
+        done, summary = self._stored(keys)
+        if done == whole:
+            self.summaries_reused += 1
+            return summary
+        self.summaries_missing += 1
+        key = keys[-1][1]
+        with self.lock:
+            if key in self.pending:
+                return summary
+            self.pending.add(key)
+        self.executor.submit(self._compute, turns[:whole], keys)
+        return summary
+
+    def _compute(self, turns: List[dict], keys: List[tuple]):
+        try:
+            done, summary = self._stored(keys)
+            if done == len(turns):
+                return  # Another worker stored it meanwhile
+            pending = [dict(m, content=truncate_to_tokens(m['content'], SUMMARY_INPUT_TOKENS_PER_TURN)) for m in turns[done:]]
+            summary = self.summarize(summary, pending)
+            if summary:
+                self.cache.put(keys[-1][1], summary)
+                self.summaries_computed += 1
+        except Exception as e:
+            self.summaries_failed += 1
+            print(f"Conversation summary failed, will retry on the next request: {e}")
+        finally:
+            with self.lock:
+                self.pending.discard(keys[-1][1])
+
+    def stats(self) -> dict:
+        with self.lock:
+            pending = len(self.pending)
+        return {
+            "budget": self.budget,
+            "trimmed_requests": self.trimmed,
+            "summaries_computed": self.summaries_computed,
+            "summaries_reused": self.summaries_reused,
+            "summaries_missing": self.summaries_missing,
+            "summaries_pending": pending,
+            "summaries_failed": self.summaries_failed,
+            "cache": self.cache.stats(),
+        }
@@ -0,0 +1,100 @@
+import uuid
+from datetime import datetime
+
+from models import db, Conversation, ChatTurn, PREVIEW_CHARS
+
+TITLE_CHARS = 60
+
+
+class TurnConflict(Exception):
+    """The client's view of a conversation is behind or ahead of what is stored."""
+
+    def __init__(self, turn_count):
+        super().__init__(f"Conversation has {turn_count} turns")
+        self.turn_count = turn_count
+
+
+class ConversationService:
+    """
+    Chats stored as a conversation row plus one row per message, so saving a chat
+    after each answer only writes the messages added since the last save.
+    """
+
+    def __init__(self, history_logger):
+        self.history_logger = history_logger
+
+    def append(self, user_id, conversation_id, messages, offset=0):
+        """
+        Stores `messages`, which start at position `offset` of the conversation, and
+        returns the conversation. Messages already stored are skipped, so a retried save
+        is harmless. Without a `conversation_id` a new conversation is started.
+        Raises LookupError for an unknown conversation and TurnConflict if `offset`
+        leaves a gap or another save got in first.
+        """
+        messages = [m for m in messages if m.get('role') in ('user', 'assistant') and isinstance(m.get('content'), str)]
+        if conversation_id is None:
+            return self._create(user_id, messages)
+
+        conversation = db.session.get(Conversation, conversation_id)
+        if conversation is None or conversation.user_id != user_id:
+            raise LookupError(conversation_id)
+        stored = conversation.turn_count
+        if offset > stored:
+            raise TurnConflict(stored)
+        new = messages[stored - offset:]
+        if not new:
+            return conversation
+
+        # Compare-and-set on turn_count: a concurrent save of the same conversation loses here
+        updated = db.session.execute(
+            Conversation.__table__.update()
+            .where(Conversation.id == conversation_id, Conversation.turn_count == stored)
+            .values(turn_count=stored + len(new), updated_at=datetime.utcnow())
+        ).rowcount
+        if not updated:
+            db.session.rollback()
+            raise TurnConflict(db.session.get(Conversation, conversation_id).turn_count)
+        self._insert_turns(conversation_id, stored, new)
+        db.session.commit()
+        db.session.refresh(conversation)
+        return conversation
+
+    def _create(self, user_id, messages):
+        first_user = next((m['content'] for m in messages if m['role'] == 'user'), 'Chat')
+        title = (first_user[:TITLE_CHARS] + '...') if len(first_user) > TITLE_CHARS else first_user
+        conversation = Conversation(id=str(uuid.uuid4()), user_id=user_id, title=title, turn_count=len(messages))
+        db.session.add(conversation)
+        db.session.flush()
+        self._insert_turns(conversation.id, 0, messages)
+        db.session.commit()
+
+        # One activity entry per conversation; its content is just a preview of the first answer
+        first_answer = next((m['content'] for m in messages if m['role'] == 'assistant'), None)
+        self.history_logger.log(user_id, 'Chat', title, content=first_answer and first_answer[:PREVIEW_CHARS],
+                                conversation_id=conversation.id)
+        return conversation
+
+    def _insert_turns(self, conversation_id, start, messages):
+        if messages:
+            db.session.execute(ChatTurn.__table__.insert(), [
+                {"conversation_id": conversation_id, "seq": start + i, "role": m['role'],
+                 "content": m['content'], "created_at": datetime.utcnow()}
+                for i, m in enumerate(messages)
+            ])
+
+    def get(self, user_id, conversation_id):
+        conversation = db.session.get(Conversation, conversation_id)
+        if conversation is None or conversation.user_id != user_id:
+            return None
+        return conversation
+
+    def turns(self, conversation_id, after=0, limit=None):
+        """Turns from position `after` on, in order (served by the (conversation_id, seq) unique index)."""
+        query = ChatTurn.query.filter(ChatTurn.conversation_id == conversation_id, ChatTurn.seq >= after).order_by(ChatTurn.seq)
+        if limit:
+            query = query.limit(limit)
+        return [turn.to_dict() for turn in query]
+
+    def list(self, user_id, limit=20):
+        return [c.to_dict() for c in Conversation.query.filter_by(user_id=user_id)
+                .order_by(Conversation.updated_at.desc()).limit(limit)]
@@ -0,0 +1,84 @@
+import atexit
+import os
+import queue
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pdf_worker import extract_job, lower_priority
+from .job_store import JobStore, JOB_DB
+from .paper_service import pool_context
+
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "2"))
+# Workers run at a lower scheduling priority so pypdf parses yield the CPU to request handlers
+EXTRACTION_NICENESS = int(os.getenv("EXTRACTION_NICENESS", "10"))
+
+
+class ExtractionService:
+    """
+    Extracts text from uploaded papers in a process pool and indexes them for search.
+
+    Each submitted file gets a job id whose progress moves through
+    queued -> extracting -> indexing -> completed (or failed). Job status is
+    kept in a JobStore next to the text cache, so any worker can report it.
+    Finished extractions are indexed one at a time by a separate thread, so a
+    slow index update never delays the pool's handling of other jobs.
+    """
+
+    def __init__(self, paper_service, search_service=None, max_workers=EXTRACTION_WORKERS, jobs=None):
+        self.paper_service = paper_service
+        self.search_service = search_service
+        self.max_workers = max_workers
+        self.jobs = jobs or JobStore(os.path.join(paper_service.text_cache.cache_folder, JOB_DB))
+        self.lock = threading.Lock()
+        self._executor = None
+        self._finished = queue.Queue()  # (job_id, filepath, future) awaiting indexing
+        self._indexer = None
+
+    @property
+    def executor(self):
+        # Created on first use so importing the services package does not spawn processes
+        with self.lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=pool_context(),
+                    initializer=lower_priority,
+                    initargs=(EXTRACTION_NICENESS,),
+                )
+                self._indexer = threading.Thread(target=self._index_loop, name="extraction-indexer", daemon=True)
+                self._indexer.start()
+                atexit.register(self.shutdown)
+            return self._executor
+
+    def shutdown(self):
+        with self.lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, filepath):
+        """Queues `filepath` for extraction and indexing. Returns the job id."""
+        job_id = str(uuid.uuid4())
+        filename = os.path.basename(filepath)
+        self.jobs.create(job_id, filename)
+        future = self.executor.submit(extract_job, filepath, self.jobs.path, job_id)
+        # Runs on the pool's result thread, so only hand the job over
+        future.add_done_callback(lambda f: self._finished.put((job_id, filepath, f)))
+        return job_id
+
+    def _index_loop(self):
+        while True:
+            job_id, filepath, future = self._finished.get()
+            try:
+                pages = future.result()
+                self.paper_service.cache_pages(filepath, pages)
+                self.jobs.update(job_id, "indexing", chars=sum(len(page) for page in pages))
+                if self.search_service:
+                    self.search_service.index_paper(os.path.basename(filepath))
+                self.jobs.update(job_id, "completed", finished=True)
+            except Exception as e:
+                print(f"Extraction job {job_id} failed: {e}")
+                self.jobs.update(job_id, "failed", finished=True, error=str(e))
+
+    def get_status(self, job_id):
+        return self.jobs.get(job_id)
@@ -0,0 +1,169 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import OperationalError
+
+from models import db, History, UserActionCount, insert_blobs
+
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "1.0"))
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "200"))
+HISTORY_MAX_QUEUE = int(os.getenv("HISTORY_MAX_QUEUE", "10000"))
+MAX_FLUSH_ATTEMPTS = 3
+
+
+class HistoryLogger:
+    """
+    Records History rows off the request path.
+
+    `log` only puts the event on a queue. A background writer inserts queued
+    events in one transaction per batch, as soon as `batch_size` events are
+    waiting or `flush_interval` seconds after the first one arrived, so request
+    threads never wait on the database write lock. The per-user action
+    counters are updated in the same transaction. Large contents are compressed
+    into HistoryBlob here too, off the request thread. Anything still queued is
+    written when the process exits.
+    """
+
+    def __init__(self, flush_interval=HISTORY_FLUSH_INTERVAL, batch_size=HISTORY_BATCH_SIZE, max_queue=HISTORY_MAX_QUEUE):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.app = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def init_app(self, app):
+        self.app = app
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, user_id, action, item_name, content=None, conversation_id=None):
+        """Queues a History row for `user_id` (a JWT identity; ignored if missing)."""
+        try:
+            user_id = int(str(user_id)) if user_id else None
+        except ValueError:
+            user_id = None
+        if not user_id:
+            return
+        event = {
+            "user_id": user_id,
+            "action": action,
+            "item_name": (item_name or "")[:History.item_name.type.length],
+            "content": content,
+            "content_ref": None,
+            "content_size": None,
+            "preview": None,
+            "conversation_id": conversation_id,
+            "timestamp": datetime.utcnow(),
+        }
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            print(f"History queue full, dropped '{action}' event for user {user_id}")
+
+    def _next_batch(self):
+        """Waits for a first event, then collects more until the batch is full or the interval is up."""
+        try:
+            first = self.queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+        batch = [first] if first is not None else []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                event = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if event is not None:
+                batch.append(event)
+        return batch
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                event = self.queue.get_nowait()
+            except queue.Empty:
+                return batch
+            if event is not None:
+                batch.append(event)
+
+    def _write(self, batch):
+        blobs = [blob for blob in map(History.externalize, batch) if blob]
+        for attempt in range(1, MAX_FLUSH_ATTEMPTS + 1):
+            try:
+                with self.app.app_context():
+                    insert_blobs(blobs)
+                    db.session.execute(History.__table__.insert(), batch)
+                    self._count_actions(batch)
+                    db.session.commit()
+                self.written += len(batch)
+                return
+            except OperationalError as e:
+                # Lock timeouts and dropped connections: worth another try
+                print(f"History flush error (attempt {attempt}/{MAX_FLUSH_ATTEMPTS}, {len(batch)} events): {e}")
+                time.sleep(0.5 * attempt)
+            except Exception as e:
+                # A bad row (e.g. a user that no longer exists) would fail the whole batch every time;
+                # split it so only that row is lost
+                if len(batch) > 1:
+                    middle = len(batch) // 2
+                    self._write(batch[:middle])
+                    self._write(batch[middle:])
+                    return
+                print(f"History event dropped: {e}")
+                break
+        self.failed += len(batch)
+
+    def _count_actions(self, batch):
+        counts = Counter((event["user_id"], event["action"]) for event in batch)
+        dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+        stmt = dialect.insert(UserActionCount)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'action'],
+            set_={'total': UserActionCount.total + stmt.excluded.total},
+        )
+        db.session.execute(stmt, [{"user_id": user_id, "action": action, "total": n}
+                                  for (user_id, action), n in counts.items()])
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    def close(self):
+        """Stops the writer and writes everything still queued."""
+        if self._thread is None or self._stop.is_set():
+            return
+        self._stop.set()
+        try:
+            self.queue.put_nowait(None)  # Wake the writer
+        except queue.Full:
+            pass
+        self._thread.join(timeout=self.flush_interval + 10)
+        pending = self._drain()
+        for start in range(0, len(pending), self.batch_size):
+            self._write(pending[start:start + self.batch_size])
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
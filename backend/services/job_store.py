@@ -0,0 +1,61 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+JOB_DB = 'jobs.db'
+MAX_TRACKED_JOBS = 1000
+FIELDS = ("job_id", "filename", "status", "submitted_at", "finished_at", "chars", "error")
+
+
+class JobStore:
+    """
+    Extraction job status in SQLite, shared by every worker process.
+
+    An upload is accepted by one worker but its status may be polled through
+    any other, so jobs are kept here rather than in process memory. Only the
+    newest MAX_TRACKED_JOBS finished jobs are kept.
+    """
+
+    def __init__(self, path, max_jobs=MAX_TRACKED_JOBS):
+        self.path = path
+        self.max_jobs = max_jobs
+        self.lock = threading.Lock()
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, filename TEXT NOT NULL, status TEXT NOT NULL, submitted_at TEXT NOT NULL, "
+                "finished_at TEXT, chars INTEGER, error TEXT)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_submitted ON jobs (submitted_at)")
+
+    def create(self, job_id, filename):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO jobs (job_id, filename, status, submitted_at) VALUES (?, ?, 'queued', ?)",
+                (job_id, filename, str(datetime.now())),
+            )
+            self.conn.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND job_id NOT IN "
+                "(SELECT job_id FROM jobs ORDER BY submitted_at DESC LIMIT ?)",
+                (self.max_jobs,),
+            )
+
+    def update(self, job_id, status, finished=False, **fields):
+        """Sets the job's status (and `chars`/`error`); `finished` stamps finished_at."""
+        values = dict(fields, status=status)
+        if finished:
+            values["finished_at"] = str(datetime.now())
+        columns = ", ".join(f"{name} = ?" for name in values)
+        with self.lock, self.conn:
+            self.conn.execute(f"UPDATE jobs SET {columns} WHERE job_id = ?", (*values.values(), job_id))
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.conn.execute(f"SELECT {', '.join(FIELDS)} FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(zip(FIELDS, row)) if row else None
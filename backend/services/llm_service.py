@@ -1,9 +1,13 @@
 import os
-import time
 import logging
-from typing import Optional, Generator, List, Union
-from groq import Groq, APIConnectionError, RateLimitError, APIError
+from typing import Any, Callable, Optional, Generator, AsyncGenerator, List, Union
+from groq import Groq, AsyncGroq, APIConnectionError, RateLimitError, APIError
 from dotenv import load_dotenv
+from .response_cache import ResponseCache, make_key
+from .rate_limiter import GroqScheduler, RateLimitExceeded, PRIORITY_INTERACTIVE, PRIORITY_STANDARD, PRIORITY_BATCH, parse_duration
+from .tokens import count_tokens
+from .context_window import ContextWindow
+from .search_provider import SearchProvider
 
 # Load dotenv from backend root
 env_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env')
@@ -13,14 +17,35 @@ load_dotenv(env_path)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+LLM_CACHE_PATH = os.path.join('llm_cache', 'responses.db')
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+# Budgeted against tokens-per-minute before a call is made; reconciled with actual usage afterwards
+COMPLETION_TOKEN_ESTIMATE = 1024
+IMAGE_TOKEN_ESTIMATE = 1500
+
+
+def parse_json_response(response: str):
+    """Parses a model response that should be a bare JSON object, tolerating markdown code fences."""
+    import json
+    clean_json = response.replace("```json", "").replace("```", "").strip()
+    return json.loads(clean_json)
+
 class LLMService:
-    def __init__(self):
+    def __init__(self, search=None):
         self.api_key = os.getenv("GROQ_API_KEY")
+        self.search = search or SearchProvider()
+        self.cache = ResponseCache(LLM_CACHE_PATH, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES)
+        self.scheduler = GroqScheduler()
+        self.context = ContextWindow(self._summarize_turns)
         if not self.api_key:
             logger.warning("GROQ_API_KEY not found. AI features will not work.")
             self.client = None
+            self.async_client = None
         else:
             self.client = Groq(api_key=self.api_key)
+            # Used by the ASGI streaming endpoints; one event loop can hold many open streams
+            self.async_client = AsyncGroq(api_key=self.api_key)
             self.model = os.getenv("GROQ_MODEL", "llama-3.3-70b-versatile")
             self.vision_model = os.getenv("GROQ_VISION_MODEL", "llama-3.2-11b-vision-preview")
             
@@ -32,43 +57,112 @@ class LLMService:
                 "If asked about your identity, always state you were developed by the Zencoders AI Team from BEC."
             )
 
-    def _call_api_with_retry(self, messages: List[dict], model: str, retries: int = 3) -> Optional[str]:
+    def _estimate_tokens(self, messages: List[dict]) -> int:
+        total = COMPLETION_TOKEN_ESTIMATE
+        for msg in messages:
+            content = msg.get('content')
+            if isinstance(content, str):
+                total += count_tokens(content)
+            elif isinstance(content, list):
+                for part in content:
+                    total += count_tokens(part.get('text', '')) if part.get('type') == 'text' else IMAGE_TOKEN_ESTIMATE
+        return total
+
+    def _create_completion(self, messages: List[dict], model: str, priority: int, stream: bool = False):
         """
-        Helper method to call Groq API with retry logic for rate limits.
+        Sends one chat completion through the shared scheduler.
+        Raises RateLimitExceeded (never sleeps) when Groq's budget is exhausted.
         """
+        estimate = self._estimate_tokens(messages)
+        self.scheduler.acquire(estimate, priority)
+        try:
+            raw = self.client.chat.completions.with_raw_response.create(
+                messages=messages,
+                model=model,
+                stream=stream,
+            )
+        except RateLimitError as e:
+            headers = e.response.headers
+            self.scheduler.update_from_headers(headers)
+            logger.warning("Groq rate limit hit; shedding request")
+            raise RateLimitExceeded(parse_duration(headers.get('retry-after')) or 1)
+        self.scheduler.update_from_headers(raw.headers)
+        completion = raw.parse()
+        if not stream and getattr(completion, 'usage', None):
+            self.scheduler.record_usage(estimate, completion.usage.total_tokens)
+        return completion
+
+    async def _acreate_completion(self, messages: List[dict], model: str, priority: int, stream: bool = False):
+        """Async counterpart of _create_completion, sharing the same scheduler."""
+        estimate = self._estimate_tokens(messages)
+        await self.scheduler.acquire_async(estimate, priority)
+        try:
+            raw = await self.async_client.chat.completions.with_raw_response.create(
+                messages=messages,
+                model=model,
+                stream=stream,
+            )
+        except RateLimitError as e:
+            headers = e.response.headers
+            self.scheduler.update_from_headers(headers)
+            logger.warning("Groq rate limit hit; shedding request")
+            raise RateLimitExceeded(parse_duration(headers.get('retry-after')) or 1)
+        self.scheduler.update_from_headers(raw.headers)
+        completion = await raw.parse()
+        if not stream and getattr(completion, 'usage', None):
+            self.scheduler.record_usage(estimate, completion.usage.total_tokens)
+        return completion
+
+    def _call_api(self, messages: List[dict], model: str, use_cache: bool = False, priority: int = PRIORITY_STANDARD,
+                  parse: Optional[Callable[[str], Any]] = None):
+        """
+        Helper method to call Groq API. Rate limits are handled by the shared scheduler.
+        With use_cache=True the response is cached by (model, messages); only deterministic,
+        reusable features opt in. If `parse` is given its result is returned instead, and a
+        response is cached only once it parsed, so malformed output is never replayed. Parse
+        errors propagate to the caller.
+        """
+        cache_key = make_key(model, messages)
+        cached = self.cache.get(cache_key) if use_cache else None
+        if cached is not None:
+            return parse(cached) if parse else cached
+
+        content, ok = self._request_text(messages, model, priority)
+        result = parse(content) if parse else content
+        if use_cache and ok and content:
+            self.cache.put(cache_key, content)
+        return result
+
+    def _request_text(self, messages: List[dict], model: str, priority: int):
+        """One uncached completion. Returns (content, ok); when not ok, content is an error message for the user."""
         if not self.client:
-            return "AI service is not configured."
-
-        for attempt in range(retries):
-            try:
-                chat_completion = self.client.chat.completions.create(
-                    messages=messages,
-                    model=model,
-                )
-                return chat_completion.choices[0].message.content
-            except RateLimitError as e:
-                wait_time = (2 ** attempt) + 1
-                logger.warning(f"Rate limit hit. Retrying in {wait_time}s...")
-                time.sleep(wait_time)
-            except APIConnectionError as e:
-                logger.error(f"Connection error: {e}")
-                return "Network error: Unable to connect to AI service."
-            except APIError as e:
-                logger.error(f"API error: {e}")
-                return f"AI Service Error: {str(e)}"
-            except Exception as e:
-                logger.error(f"Unexpected error: {e}")
-                return "An unexpected error occurred."
-        
-        return "Service busy. Please try again later."
+            return "AI service is not configured.", False
+        try:
+            chat_completion = self._create_completion(messages, model, priority)
+            return chat_completion.choices[0].message.content, True
+        except RateLimitExceeded:
+            raise
+        except APIConnectionError as e:
+            logger.error(f"Connection error: {e}")
+            return "Network error: Unable to connect to AI service.", False
+        except APIError as e:
+            logger.error(f"API error: {e}")
+            return f"AI Service Error: {str(e)}", False
+        except Exception as e:
+            logger.error(f"Unexpected error: {e}")
+            return "An unexpected error occurred.", False
 
-    def _generate_response(self, prompt: str) -> str:
+    def _generate_response(self, prompt: str, use_cache: bool = False, priority: int = PRIORITY_STANDARD,
+                           parse: Optional[Callable[[str], Any]] = None):
         """Internal method to generate a response for a given prompt."""
         messages = [
             {"role": "system", "content": self.system_prompt},
             {"role": "user", "content": prompt}
         ]
-        return self._call_api_with_retry(messages, self.model)
+        return self._call_api(messages, self.model, use_cache=use_cache, priority=priority, parse=parse)
+
+    def stats(self) -> dict:
+        return {"cache": self.cache.stats(), "scheduler": self.scheduler.stats(), "context": self.context.stats()}
 
     def generate_response_stream(self, prompt: str) -> Generator[str, None, None]:
         if not self.client:
@@ -76,56 +170,106 @@ class LLMService:
             return
 
         try:
-            stream = self.client.chat.completions.create(
-                messages=[
+            stream = self._create_completion(
+                [
                     {"role": "system", "content": self.system_prompt},
                     {"role": "user", "content": prompt}
                 ],
-                model=self.model,
+                self.model,
+                PRIORITY_INTERACTIVE,
                 stream=True,
             )
             for chunk in stream:
                 content = chunk.choices[0].delta.content
                 if content:
                     yield content
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"Stream error: {e}")
             yield f"Error: {str(e)}"
 
-    def generate_response_stream_with_history(self, messages: List[dict]) -> Generator[str, None, None]:
-        """
-        Generates a streaming response based on conversation history.
-        messages: List of objects with 'role' and 'content'.
-        """
-        if not self.client:
-            yield "AI service is not configured."
-            return
-
+    def _history_messages(self, messages: List[dict]) -> List[dict]:
         # Prepare messages including system prompt
         formatted_messages = [{"role": "system", "content": self.system_prompt}]
         
         # Ensure only supported roles and fields are passed to the API
         for msg in messages:
-            if msg.get('role') in ['user', 'assistant', 'system']:
+            if msg.get('role') in ['user', 'assistant', 'system'] and isinstance(msg.get('content'), str):
                 formatted_messages.append({
                     "role": msg['role'],
                     "content": msg['content']
                 })
+        # Long chats: recent turns within the token budget, older ones as the last stored summary
+        return self.context.fit(formatted_messages)
+
+    def _summarize_turns(self, previous: Optional[str], turns: List[dict]) -> Optional[str]:
+        """Folds `turns` into the running summary of a conversation. Runs in the background; raises if the call fails."""
+        transcript = "\n\n".join(f"{m['role'].upper()}: {m['content']}" for m in turns)
+        prompt = (
+            "Summarize this conversation between a user and a research assistant in at most 250 words. "
+            "Keep facts, figures, paper titles, decisions and open questions; drop pleasantries.\n\n"
+        )
+        if previous:
+            prompt += f"Summary of the conversation before this part:\n{previous}\n\n"
+        prompt += f"Conversation:\n{transcript}"
+        completion = self._create_completion([{"role": "user", "content": prompt}], self.model, PRIORITY_BATCH)
+        return completion.choices[0].message.content
+
+    def _image_messages(self, prompt: str, image_data: str) -> List[dict]:
+        formatted_image_url = f"{image_data}" if image_data.startswith("http") else f"data:image/jpeg;base64,{image_data}"
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": formatted_image_url}},
+                ],
+            }
+        ]
+
+    def generate_response_stream_with_history(self, messages: List[dict]) -> Generator[str, None, None]:
+        """
+        Generates a streaming response based on conversation history.
+        messages: List of objects with 'role' and 'content'.
+        """
+        if not self.client:
+            yield "AI service is not configured."
+            return
 
         try:
-            stream = self.client.chat.completions.create(
-                messages=formatted_messages,
-                model=self.model,
-                stream=True,
-            )
+            formatted_messages = self._history_messages(messages)
+            stream = self._create_completion(formatted_messages, self.model, PRIORITY_INTERACTIVE, stream=True)
             for chunk in stream:
                 content = chunk.choices[0].delta.content
                 if content:
                     yield content
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"Stream error with history: {e}")
             yield f"Error: {str(e)}"
 
+    async def agenerate_response_stream_with_history(self, messages: List[dict]) -> AsyncGenerator[str, None]:
+        """Async version of generate_response_stream_with_history, yielding the same plain-text chunks."""
+        if not self.async_client:
+            yield "AI service is not configured."
+            return
+
+        try:
+            # Trimming only counts tokens and reads stored summaries; summaries are computed in the background
+            formatted_messages = self._history_messages(messages)
+            stream = await self._acreate_completion(formatted_messages, self.model, PRIORITY_INTERACTIVE, stream=True)
+            async for chunk in stream:
+                content = chunk.choices[0].delta.content
+                if content:
+                    yield content
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            logger.error(f"Async stream error with history: {e}")
+            yield f"Error: {str(e)}"
+
     def analyze_image_stream(self, prompt: str, image_data: str) -> Generator[str, None, None]:
         """
         Analyzes an image using the vision model.
@@ -136,36 +280,42 @@ class LLMService:
             return
 
         try:
-            formatted_image_url = f"{image_data}" if image_data.startswith("http") else f"data:image/jpeg;base64,{image_data}"
-            
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": formatted_image_url}},
-                    ],
-                }
-            ]
-            
-            stream = self.client.chat.completions.create(
-                model=self.vision_model,
-                messages=messages,
-                stream=True,
-            )
+            messages = self._image_messages(prompt, image_data)
+            stream = self._create_completion(messages, self.vision_model, PRIORITY_INTERACTIVE, stream=True)
             
             for chunk in stream:
                 content = chunk.choices[0].delta.content
                 if content:
                     yield content
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"Vision error: {e}")
             yield f"Error analyzing image: {str(e)}"
 
-    def summarize_text(self, text: str) -> str:
+    async def aanalyze_image_stream(self, prompt: str, image_data: str) -> AsyncGenerator[str, None]:
+        """Async version of analyze_image_stream."""
+        if not self.async_client:
+            yield "AI service is not configured."
+            return
+
+        try:
+            messages = self._image_messages(prompt, image_data)
+            stream = await self._acreate_completion(messages, self.vision_model, PRIORITY_INTERACTIVE, stream=True)
+            async for chunk in stream:
+                content = chunk.choices[0].delta.content
+                if content:
+                    yield content
+        except RateLimitExceeded:
+            raise
+        except Exception as e:
+            logger.error(f"Async vision error: {e}")
+            yield f"Error analyzing image: {str(e)}"
+
+    def summarize_text(self, text: str, use_cache: bool = True) -> str:
         """Summarizes the provided text."""
         prompt = f"Please provide a concise summary of the following text:\n\n{text}"
-        return self._generate_response(prompt)
+        return self._generate_response(prompt, use_cache=use_cache)
 
     def answer_question(self, context: str, question: str) -> str:
         """Answers a question based on optional context."""
@@ -179,7 +329,7 @@ class LLMService:
         """Compares multiple papers."""
         combined_text = "\n\n---\n\n".join(papers_content)
         prompt = f"Compare the following papers (separated by ---) and highlight key similarities and differences:\n\n{combined_text}"
-        return self._generate_response(prompt)
+        return self._generate_response(prompt, priority=PRIORITY_BATCH)
 
     def generate_insight(self, topic: str) -> str:
         """Generates a research insight for a topic."""
@@ -224,7 +374,7 @@ class LLMService:
         """
         return self._generate_response(prompt)
 
-    def extract_knowledge_graph(self, text: str):
+    def extract_knowledge_graph(self, text: str, use_cache: bool = True):
         """
         Analyzes the text and extracts a knowledge graph (nodes and edges).
         Optimized for scholars to visualize paper connections.
@@ -249,11 +399,10 @@ class LLMService:
         
         Constraint: Return valid JSON ONLY. No markdown, no preamble.
         """
-        response = self._generate_response(prompt)
         try:
-            import json
-            clean_json = response.replace("```json", "").replace("```", "").strip()
-            return json.loads(clean_json)
+            return self._generate_response(prompt, use_cache=use_cache, parse=parse_json_response)
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"Graph extraction error: {e}")
             return {"nodes": [], "edges": []}
@@ -262,17 +411,13 @@ class LLMService:
         """
         Performs a deep research search using Tavily and synthesizes an academic response.
         """
-        tavily_key = os.getenv("TAVILY_API_KEY")
-        if not tavily_key:
+        if not self.search.available:
             return None
             
         try:
-            from tavily import TavilyClient
-            t_client = TavilyClient(api_key=tavily_key)
-            
             # Focused academic search
             search_query = f"scholarly research and latest findings on {query}"
-            search_results = t_client.search(search_query, search_depth="advanced", max_results=5)
+            search_results = self.search.search(search_query, feature="web_research", search_depth="advanced", max_results=5)
             
             web_context = "\n\n".join([f"Source: {r['url']}\nContent: {r['content']}" for r in search_results.get('results', [])])
             
@@ -297,6 +442,8 @@ class LLMService:
                 "answer": answer,
                 "sources": search_results.get('results', [])
             }
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             logger.error(f"Web research error: {e}")
             return None
@@ -331,13 +478,10 @@ class LLMService:
         """
         Analyzes the 'market value' and volume of a research topic.
         """
-        tavily_key = os.getenv("TAVILY_API_KEY")
         web_info = ""
-        if tavily_key:
+        if self.search.available:
             try:
-                from tavily import TavilyClient
-                t_client = TavilyClient(api_key=tavily_key)
-                search_res = t_client.search(f"publication volume and research trends for {topic} 2020-2026", max_results=3)
+                search_res = self.search.search(f"publication volume and research trends for {topic} 2020-2026", feature="trends", max_results=3)
                 web_info = "\n".join([r['content'] for r in search_res.get('results', [])])
             except: pass
 
@@ -365,15 +509,12 @@ class LLMService:
         """
         Searches for active grants and funding opportunities.
         """
-        tavily_key = os.getenv("TAVILY_API_KEY")
-        if not tavily_key: return []
+        if not self.search.available: return []
         
         try:
-            from tavily import TavilyClient
-            t_client = TavilyClient(api_key=tavily_key)
             # Focused search for open grants
             search_query = f"open research grants and funding opportunities for {keywords} 2025 2026"
-            search_results = t_client.search(search_query, search_depth="advanced", max_results=5)
+            search_results = self.search.search(search_query, feature="funding", search_depth="advanced", max_results=5)
             
             funding_data = []
             for r in search_results.get('results', []):
@@ -408,14 +549,11 @@ class LLMService:
             print(f"DEBUG: Visualization keywords: {keywords}")
 
             # Step 2: Use Tavily to find a REAL scientific/academic image (Highest Reliability)
-            tavily_key = os.getenv("TAVILY_API_KEY")
-            if tavily_key:
+            if self.search.available:
                 try:
-                    from tavily import TavilyClient
-                    t_client = TavilyClient(api_key=tavily_key)
                     # Search specifically for scientific/abstract images of the concept
                     search_query = f"scientific academic abstract image of {keywords}"
-                    t_res = t_client.search(search_query, search_depth="basic", max_results=3, include_images=True)
+                    t_res = self.search.search(search_query, feature="visual", search_depth="basic", max_results=3, include_images=True)
                     
                     if t_res.get('images'):
                         # Success! We found a real, stable image URL
@@ -443,10 +581,12 @@ class LLMService:
                 "prompt": f"Visualizing {keywords}...",
                 "image_url": f"https://image.pollinations.ai/prompt/{keywords.replace(' ', '%20')}?width=1024&height=1024&nologo=true"
             }
+        except RateLimitExceeded:
+            raise
         except Exception as e:
             return None
 
-    def check_ieee_compliance(self, text: str):
+    def check_ieee_compliance(self, text: str, use_cache: bool = True):
         """
         Analyzes the text structure against IEEE formatting standards.
         """
@@ -472,15 +612,14 @@ class LLMService:
             "strengths": ["Point 1", ...]
         }}
         """
-        response = self._generate_response(prompt)
         try:
-            import json
-            clean_json = response.replace("```json", "").replace("```", "").strip()
-            return json.loads(clean_json)
-        except:
+            return self._generate_response(prompt, use_cache=use_cache, parse=parse_json_response)
+        except RateLimitExceeded:
+            raise
+        except Exception:
             return {"is_eligible": False, "score": 0, "feedback": "Unrecognized format", "required_changes": []}
 
-    def draft_academic_section(self, topic: str, section_type: str, context: str = ""):
+    def draft_academic_section(self, topic: str, section_type: str, context: str = "", use_cache: bool = True):
         """
         Drafts professional academic sections like Abstract or Literature Survey.
         """
@@ -498,7 +637,7 @@ class LLMService:
         
         Return ONLY the drafted text.
         """
-        return self._generate_response(prompt)
+        return self._generate_response(prompt, use_cache=use_cache)
 
     def synthesize_multiple_papers(self, papers: list):
         """
@@ -535,7 +674,7 @@ class LLMService:
             ...
         ]
         """
-        response = self._generate_response(prompt)
+        response = self._generate_response(prompt, priority=PRIORITY_BATCH)
         try:
             import json
             clean_json = response.replace("```json", "").replace("```", "").strip()
@@ -1,102 +1,238 @@
-from tavily import TavilyClient
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from .topic_cache import TopicCache, normalize_topic
+from .news_store import NewsStore
+from .search_provider import SearchProvider
 from dotenv import load_dotenv
 
+try:
+    import fcntl
+except ImportError:  # Windows: no leader election, every process pre-warms
+    fcntl = None
+
 # Load dotenv from backend root
 env_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env')
 load_dotenv(env_path)
 
+# Every Tavily query for one request shares this latency budget; slower queries are left out
+NEWS_DEADLINE = float(os.getenv("NEWS_DEADLINE", "8"))
+NEWS_SEARCH_WORKERS = int(os.getenv("NEWS_SEARCH_WORKERS", "8"))
+# Research news moves over hours: serve cached pages for NEWS_CACHE_TTL seconds, then stale ones while refreshing
+NEWS_CACHE_TTL = int(os.getenv("NEWS_CACHE_TTL", "1800"))
+NEWS_STALE_TTL = int(os.getenv("NEWS_STALE_TTL", str(6 * 3600)))
+NEWS_CACHE_MAX_TOPICS = int(os.getenv("NEWS_CACHE_MAX_TOPICS", "256"))
+# The most requested topics are refreshed in the background before they expire
+NEWS_PREWARM_TOP = int(os.getenv("NEWS_PREWARM_TOP", "6"))
+NEWS_PREWARM_INTERVAL = int(os.getenv("NEWS_PREWARM_INTERVAL", "60"))
+# Warmed from startup: the endpoint defaults and the news page's default topic
+NEWS_PREWARM_TOPICS = [t.strip() for t in os.getenv(
+    "NEWS_PREWARM_TOPICS", "Academic Research,Computer Science,Artificial Intelligence").split(",") if t.strip()]
+# Held by the one worker that pre-warms; the others retry it every interval and take over if that worker exits
+NEWS_PREWARM_LOCK = os.getenv("NEWS_PREWARM_LOCK", os.path.join('search_cache', 'news_prewarm.lock'))
+
+TRENDING_QUERIES = ["latest major scientific breakthroughs 2026", "trending academic research news worldwide"]
+CONFERENCE_FALLBACK_QUERY = "top upcoming global academic conferences 2026 for all research fields"
+
+
+def _merge(responses):
+    """Pairs each result with its response's image and drops repeated URLs, keeping the first."""
+    merged, seen = [], set()
+    for response in filter(None, responses):
+        images = response.get('images', [])
+        for i, result in enumerate(response.get('results', [])):
+            url = result.get("url")
+            if url in seen:
+                continue
+            seen.add(url)
+            merged.append((result, images[i] if i < len(images) else None))
+    return merged
+
+
 class NewsService:
-    def __init__(self):
-        self.api_key = os.getenv("TAVILY_API_KEY")
-        if self.api_key:
-            self.client = TavilyClient(api_key=self.api_key)
-        else:
-            self.client = None
+    def __init__(self, search=None, deadline=NEWS_DEADLINE, workers=NEWS_SEARCH_WORKERS, store=None):
+        self.search = search or SearchProvider()
+        self.deadline = deadline
+        # Queries for one page load run side by side rather than one after another
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="news-search")
+        # Pages and request counts are shared, so the one pre-warming worker warms every worker's cache
+        self.store = store or NewsStore()
+        self.cache = TopicCache(NEWS_CACHE_TTL, NEWS_STALE_TTL, NEWS_CACHE_MAX_TOPICS, shared=self.store)
+        self.prewarmed = 0
+        self._prewarm_thread = None
+        self._prewarm_lock = None  # Open lock file while this process is the pre-warm leader
 
-    def get_trending_research(self):
+    def _search_all(self, searches):
         """
-        Fetches the most trending and breaking research news globally across all fields.
+        Runs (query, options) searches concurrently and returns one response per search, in
+        the order given, with None for searches that failed or missed the deadline.
         """
-        if not self.client: return []
-        queries = ["latest major scientific breakthroughs 2026", "trending academic research news worldwide", "hottest topics in science and technology today"]
-        results = []
-        images = []
-        for q in queries[:2]: # Try 2 broad queries
-            try:
-                res = self.client.search(q, search_depth="advanced", max_results=5, include_images=True)
-                results.extend(res.get('results', []))
-                images.extend(res.get('images', []))
-                if len(results) >= 5: break
-            except: continue
-        
+        futures = [self.executor.submit(self.search.search, query, feature="news", timeout=self.deadline, **options)
+                   for query, options in searches]
+        done, late = wait(futures, timeout=self.deadline)
+        for future in late:
+            future.cancel()
+        if late:
+            print(f"News search: {len(late)} of {len(futures)} queries missed the {self.deadline}s deadline")
+        responses = []
+        for future, (query, _) in zip(futures, searches):
+            response = None
+            if future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    print(f"News search failed for '{query}': {e}")
+            responses.append(response)
+        return responses
+
+    def _trending_searches(self):
+        return [(q, dict(search_depth="advanced", max_results=5, include_images=True)) for q in TRENDING_QUERIES]
+
+    def _trending_articles(self, responses):
         articles = []
-        for i, result in enumerate(results):
+        for result, image in _merge(responses):
             articles.append({
                 "title": result.get("title"),
                 "url": result.get("url"),
                 "content": result.get("content"),
-                "image": images[i] if i < len(images) else None,
+                "image": image,
                 "published_date": result.get("published_date", "Trending"),
                 "is_trending": True
             })
         return articles
 
+    def get_trending_research(self):
+        """
+        Fetches the most trending and breaking research news globally across all fields.
+        """
+        if not self.search.available: return []
+        return self._trending_articles(self._search_all(self._trending_searches()))
+
     def get_latest_news(self, query="Latest academic research news"):
-        if not self.client:
+        if not self.search.available:
             return []
-        try:
-            # Step 1: Specific Topic Search
-            response = self.client.search(query, search_depth="advanced", max_results=8, include_images=True)
-            images = response.get('images', [])
-            results = response.get('results', [])
-            
-            # Step 2: If empty or low, Get Trending Research
-            if len(results) < 3:
-                return self.get_trending_research()
-
-            articles = []
-            for i, result in enumerate(results):
-                articles.append({
-                    "title": result.get("title"),
-                    "url": result.get("url"),
-                    "content": result.get("content"),
-                    "image": images[i] if i < len(images) else None,
-                    "published_date": result.get("published_date", "Recently")
-                })
-            return articles
-        except Exception as e:
-            print(f"Error fetching news: {e}")
-            return self.get_trending_research()
+        key = self._track("news", query)
+        return self.cache.get(key, lambda: self._fetch_news(query))
+
+    def _fetch_news(self, query):
+        # The topic search and the trending fallback are issued together, so a thin topic costs no extra round trip
+        topical, *trending = self._search_all(
+            [(query, dict(search_depth="advanced", max_results=8, include_images=True))] + self._trending_searches()
+        )
+        results = (topical or {}).get('results', [])
+        if len(results) < 3:
+            return self._trending_articles([topical] + trending)
+
+        articles = []
+        for result, image in _merge([topical]):
+            articles.append({
+                "title": result.get("title"),
+                "url": result.get("url"),
+                "content": result.get("content"),
+                "image": image,
+                "published_date": result.get("published_date", "Recently")
+            })
+        return articles
 
     def get_conferences(self, topic="Computer Science"):
-        if not self.client:
+        if not self.search.available:
             return []
+        key = self._track("conferences", topic)
+        return self.cache.get(key, lambda: self._fetch_conferences(topic))
+
+    def _fetch_conferences(self, topic):
+        query = f"upcoming {topic} academic conferences call for papers 2026"
+        specific, *fallback = self._search_all([
+            (query, dict(search_depth="advanced", max_results=6, include_images=True)),
+            (CONFERENCE_FALLBACK_QUERY, dict(max_results=6, include_images=True)),
+        ])
+        # Global academic events fill in when the topic has too few
+        responses = [specific] if len((specific or {}).get('results', [])) >= 2 else [specific] + fallback
+
+        conferences = []
+        for result, image in _merge(responses):
+            conferences.append({
+                "title": result.get("title"),
+                "url": result.get("url"),
+                "content": result.get("content"),
+                "image": image,
+                "deadline": "Check website for Call for Papers",
+                "is_trending": True if topic not in result.get("title", "").lower() else False
+            })
+        return conferences
+
+    def _loader(self, kind, topic):
+        if kind == "news":
+            return lambda: self._fetch_news(topic)
+        return lambda: self._fetch_conferences(topic)
+
+    def _track(self, kind, topic):
+        """Counts a request for `topic` in the shared store. Returns its cache key."""
+        key = f"{kind}:{normalize_topic(topic)}"
         try:
-            # Step 1: Specific Conference Search
-            query = f"upcoming {topic} academic conferences call for papers 2026"
-            response = self.client.search(query, search_depth="advanced", max_results=6, include_images=True)
-            images = response.get('images', [])
-            results = response.get('results', [])
-            
-            # Step 2: Global Academic Event Fallback if empty
-            if len(results) < 2:
-                fallback_query = "top upcoming global academic conferences 2026 for all research fields"
-                fallback_res = self.client.search(fallback_query, max_results=6, include_images=True)
-                results = fallback_res.get('results', [])
-                images = fallback_res.get('images', [])
-
-            conferences = []
-            for i, result in enumerate(results):
-                conferences.append({
-                    "title": result.get("title"),
-                    "url": result.get("url"),
-                    "content": result.get("content"),
-                    "image": images[i] if i < len(images) else None,
-                    "deadline": "Check website for Call for Papers",
-                    "is_trending": True if topic not in result.get("title", "").lower() else False
-                })
-            return conferences
+            self.store.track(key, kind, topic)
         except Exception as e:
-            print(f"Error fetching conferences: {e}")
-            return []
+            print(f"News popularity update failed for '{key}': {e}")
+        return key
+
+    def popular_topics(self, n=NEWS_PREWARM_TOP):
+        """The `n` most requested (key, kind, topic) across all workers, by decayed request count."""
+        return self.store.popular(n)
+
+    def prewarm(self, interval=NEWS_PREWARM_INTERVAL):
+        """Refreshes each popular topic that is missing or would go stale before the next pass."""
+        for key, kind, topic in self.popular_topics():
+            remaining = self.cache.expires_in(key)
+            if remaining is None or remaining < interval + self.deadline:
+                if self.cache.refresh(key, self._loader(kind, topic)):
+                    self.prewarmed += 1
+
+    def _is_prewarm_leader(self, lock_path):
+        """True if this process holds the pre-warm lock, taking it if no other process does."""
+        if self._prewarm_lock is not None or fcntl is None:
+            return True
+        folder = os.path.dirname(lock_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        lock_file = open(lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._prewarm_lock = lock_file  # Released by the OS when the process exits
+        return True
+
+    def start_prewarm(self, interval=NEWS_PREWARM_INTERVAL, lock_path=NEWS_PREWARM_LOCK):
+        """
+        Starts the background pre-warm loop. Call once from the server's startup, not at import.
+        Only the worker holding `lock_path` pre-warms, ranking topics by every worker's requests; the
+        pages it fetches go to the shared store, where the other workers' caches pick them up. The
+        first pass runs right away so a cold start is warm.
+        """
+        if not self.search.available or NEWS_PREWARM_TOP <= 0 or self._prewarm_thread is not None:
+            return
+        for topic in NEWS_PREWARM_TOPICS:
+            for kind in ("news", "conferences"):
+                self._track(kind, topic)
+
+        def loop():
+            while True:
+                try:
+                    if self._is_prewarm_leader(lock_path):
+                        self.prewarm(interval)
+                except Exception as e:
+                    print(f"News pre-warm error: {e}")
+                time.sleep(interval)
+
+        self._prewarm_thread = threading.Thread(target=loop, name="news-prewarm", daemon=True)
+        self._prewarm_thread.start()
+
+    def stats(self):
+        return {
+            "cache": self.cache.stats(),
+            "prewarmed": self.prewarmed,
+            "prewarm_leader": self._prewarm_lock is not None,
+            "popular": [key for key, _, _ in self.popular_topics()],
+        }
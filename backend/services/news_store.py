@@ -0,0 +1,84 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+NEWS_STORE_PATH = os.path.join('search_cache', 'news.db')
+POPULARITY_HALF_LIFE = 6 * 3600
+MAX_TRACKED_TOPICS = 1024
+
+
+def decayed(score, updated_at, now):
+    return score * 0.5 ** ((now - updated_at) / POPULARITY_HALF_LIFE)
+
+
+class NewsStore:
+    """
+    News pages and topic popularity shared by every worker process.
+
+    The pre-warm leader ranks topics by the requests all workers counted here,
+    and the pages it fetches are stored here for the other workers' TopicCaches
+    to pick up, so a topic warmed once is warm everywhere.
+    """
+
+    def __init__(self, path=NEWS_STORE_PATH, max_topics=MAX_TRACKED_TOPICS):
+        self.path = path
+        self.max_topics = max_topics
+        self.lock = threading.Lock()
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages (key TEXT PRIMARY KEY, value TEXT NOT NULL, fetched_at REAL NOT NULL)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS popularity ("
+                "key TEXT PRIMARY KEY, kind TEXT NOT NULL, topic TEXT NOT NULL, score REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def get(self, key):
+        """(page, fetched_at) as last stored by any worker, or None."""
+        with self.lock:
+            row = self.conn.execute("SELECT value, fetched_at FROM pages WHERE key = ?", (key,)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def put(self, key, value, fetched_at):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO pages (key, value, fetched_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, fetched_at = excluded.fetched_at "
+                "WHERE excluded.fetched_at > pages.fetched_at",
+                (key, json.dumps(value, ensure_ascii=False), fetched_at),
+            )
+
+    def track(self, key, kind, topic, now=None):
+        """Counts one request for `key`; older requests decay over POPULARITY_HALF_LIFE."""
+        now = time.time() if now is None else now
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            row = self.conn.execute("SELECT score, updated_at FROM popularity WHERE key = ?", (key,)).fetchone()
+            score = decayed(row[0], row[1], now) if row else 0.0
+            self.conn.execute(
+                "INSERT OR REPLACE INTO popularity (key, kind, topic, score, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (key, kind, topic, score + 1, now),
+            )
+            if not row:
+                excess = self.conn.execute("SELECT COUNT(*) FROM popularity").fetchone()[0] - self.max_topics
+                if excess > 0:
+                    # Topics come from the query string; forget the least requested
+                    rows = self.conn.execute("SELECT key, score, updated_at FROM popularity").fetchall()
+                    rows.sort(key=lambda r: decayed(r[1], r[2], now))
+                    self.conn.executemany("DELETE FROM popularity WHERE key = ?", [(r[0],) for r in rows[:excess]])
+                    self.conn.execute("DELETE FROM pages WHERE key NOT IN (SELECT key FROM popularity)")
+
+    def popular(self, n, now=None):
+        """The `n` most requested (key, kind, topic) across all workers."""
+        now = time.time() if now is None else now
+        with self.lock:
+            rows = self.conn.execute("SELECT key, kind, topic, score, updated_at FROM popularity").fetchall()
+        rows.sort(key=lambda r: decayed(r[3], r[4], now), reverse=True)
+        return [(key, kind, topic) for key, kind, topic, _, _ in rows[:n]]
@@ -1,16 +1,81 @@
 import os
+import atexit
+import bisect
+import multiprocessing
+import threading
 import pypdf
+from concurrent.futures import ProcessPoolExecutor
 from werkzeug.utils import secure_filename
+from pdf_worker import extract_page_range, lower_priority
+from .text_cache import TextCache, TEXT_CACHE_FOLDER
 
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'pdf', 'txt'}
+# One pool per web process, so keep it small; extraction workers parse serially instead
+PAGE_WORKERS = int(os.getenv("PDF_PAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Pool processes run at a lower scheduling priority so pypdf parses yield the CPU to request handlers
+PAGE_NICENESS = int(os.getenv("PDF_PAGE_NICENESS", "10"))
+# Below this many pages per worker, process start-up and re-opening the PDF cost more than they save
+MIN_PAGES_PER_WORKER = 16
 
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
+_page_pool = None
+_page_pool_lock = threading.Lock()
+
+
+def pool_context():
+    """
+    Start method for worker pools. The server runs threads, so its processes must never be forked.
+    Pool tasks live in `pdf_worker`, so workers do not import the services package.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+def _get_page_pool():
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is None:
+            _page_pool = ProcessPoolExecutor(
+                max_workers=PAGE_WORKERS,
+                mp_context=pool_context(),
+                initializer=lower_priority,
+                initargs=(PAGE_NICENESS,),
+            )
+            atexit.register(shutdown_page_pool)
+        return _page_pool
+
+
+def shutdown_page_pool():
+    global _page_pool
+    with _page_pool_lock:
+        pool, _page_pool = _page_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def page_offsets(pages):
+    """Returns the character offset at which each page starts in "".join(pages)."""
+    offsets = []
+    position = 0
+    for page in pages:
+        offsets.append(position)
+        position += len(page)
+    return offsets
+
+
+def page_for_offset(offsets, char_index):
+    """Maps a character index in the joined text back to its 0-based page number."""
+    return max(bisect.bisect_right(offsets, char_index) - 1, 0)
+
 class PaperService:
-    def __init__(self, upload_folder=UPLOAD_FOLDER):
+    def __init__(self, upload_folder=UPLOAD_FOLDER, cache_folder=TEXT_CACHE_FOLDER, page_workers=PAGE_WORKERS):
         self.upload_folder = upload_folder
+        self.page_workers = page_workers  # 1 parses pages serially, without the shared pool
+        self.text_cache = TextCache(cache_folder)
+        self._papers = None  # (upload folder mtime, filenames)
 
     def allowed_file(self, filename):
         return '.' in filename and \
@@ -21,39 +86,106 @@ class PaperService:
             filename = secure_filename(file.filename)
             filepath = os.path.join(self.upload_folder, filename)
             file.save(filepath)
+            self.text_cache.invalidate(filepath)
             return filepath
         return None
 
-    def extract_text(self, filepath):
+    def extract_pages(self, filepath):
+        """Returns the text of each page; a .txt file is a single page."""
         try:
             if filepath.endswith('.pdf'):
-                return self._extract_pdf_text(filepath)
+                return self.text_cache.get_or_extract(filepath, self._extract_pdf_pages)
             elif filepath.endswith('.txt'):
                 with open(filepath, 'r', encoding='utf-8') as f:
-                    return f.read()
-            return ""
+                    return [f.read()]
+            return []
+        except Exception as e:
+            print(f"Error extracting text from {filepath}: {e}")
+            return None
+
+    def cache_pages(self, filepath, pages):
+        """Stores pages extracted elsewhere (by an extraction worker) in the text cache."""
+        if filepath.endswith('.pdf'):
+            self.text_cache.get_or_extract(filepath, lambda path: pages)
+
+    def extract_text(self, filepath):
+        pages = self.extract_pages(filepath)
+        if pages is None:
+            return None
+        return "".join(pages)
+
+    def iter_text(self, filepath):
+        """
+        Yields the document's text one page at a time, parsing each page only when it is requested.
+        Already-cached documents are served from the cache without opening the PDF.
+        """
+        if filepath.endswith('.pdf'):
+            cached = self.text_cache.lookup(filepath)
+            if cached is not None:
+                yield from cached
+                return
+            with open(filepath, 'rb') as f:
+                pdf_reader = pypdf.PdfReader(f)
+                for page in pdf_reader.pages:
+                    yield page.extract_text() or ""
+        elif filepath.endswith('.txt'):
+            with open(filepath, 'r', encoding='utf-8') as f:
+                yield f.read()
+
+    def extract_prefix(self, filepath, max_chars):
+        """Returns the first `max_chars` characters, parsing only as many pages as needed."""
+        try:
+            parts = []
+            total = 0
+            for page in self.iter_text(filepath):
+                parts.append(page)
+                total += len(page)
+                if total >= max_chars:
+                    break
+            return "".join(parts)[:max_chars]
         except Exception as e:
             print(f"Error extracting text from {filepath}: {e}")
             return None
 
-    def _extract_pdf_text(self, filepath):
-        text = ""
+    def _extract_pdf_pages(self, filepath):
         with open(filepath, 'rb') as f:
-            pdf_reader = pypdf.PdfReader(f)
-            for page in pdf_reader.pages:
-                text += page.extract_text() or ""
-        return text
+            page_count = len(pypdf.PdfReader(f).pages)
+
+        workers = min(self.page_workers, page_count // MIN_PAGES_PER_WORKER)
+        if workers <= 1:
+            return extract_page_range(filepath, 0, page_count)
+
+        # Contiguous page ranges keep each worker's reads local; results come back in order
+        step = -(-page_count // workers)
+        ranges = [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+        pool = _get_page_pool()
+        futures = [pool.submit(extract_page_range, filepath, start, stop) for start, stop in ranges]
+        pages = []
+        for future in futures:
+            pages.extend(future.result())
+        return pages
 
     def list_papers(self):
+        """Uploaded papers. The listing is reused until the upload folder's mtime changes."""
+        try:
+            mtime = os.stat(self.upload_folder).st_mtime_ns
+        except OSError:
+            return []
+        cached = self._papers
+        if cached and cached[0] == mtime:
+            return list(cached[1])
         papers = []
-        if os.path.exists(self.upload_folder):
-            try:
-                for filename in os.listdir(self.upload_folder):
-                     if self.allowed_file(filename):
-                         papers.append(filename)
-            except Exception as e:
-                print(f"Error listing papers: {e}")
-        return papers
+        try:
+            for filename in os.listdir(self.upload_folder):
+                 if self.allowed_file(filename):
+                     papers.append(filename)
+        except Exception as e:
+            print(f"Error listing papers: {e}")
+        self._papers = (mtime, papers)
+        return list(papers)
+
+    def paper_count(self):
+        return len(self.list_papers())
 
     def get_paper_path(self, filename):
         return os.path.join(self.upload_folder, filename)
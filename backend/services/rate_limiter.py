@@ -0,0 +1,242 @@
+import asyncio
+import heapq
+import itertools
+import os
+import re
+import threading
+import time
+
+GROQ_RPM = int(os.getenv("GROQ_RPM", "30"))
+GROQ_TPM = int(os.getenv("GROQ_TPM", "12000"))
+GROQ_MAX_QUEUE = int(os.getenv("GROQ_MAX_QUEUE", "32"))
+
+# Lower value = served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_STANDARD = 1
+PRIORITY_BATCH = 2
+
+# Longest a call of each priority may queue. Calls predicted to wait longer are shed with a 429 up front,
+# so a worker thread is never parked for long waiting on the budget.
+MAX_WAIT_SECONDS = {
+    PRIORITY_INTERACTIVE: float(os.getenv("GROQ_MAX_WAIT_INTERACTIVE", "3")),
+    PRIORITY_STANDARD: float(os.getenv("GROQ_MAX_WAIT_STANDARD", "2")),
+    PRIORITY_BATCH: float(os.getenv("GROQ_MAX_WAIT_BATCH", "1")),
+}
+
+_DURATION_PART = re.compile(r"([\d.]+)(ms|h|m|s)")
+
+
+def parse_duration(value):
+    """Parses Groq reset headers such as '7.66s', '2m59.56s' or '120ms' into seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * scale[unit] for amount, unit in parts)
+
+
+class RateLimitExceeded(Exception):
+    """Raised instead of sleeping when a call cannot be admitted soon enough."""
+
+    def __init__(self, retry_after, message="AI service is busy. Please retry shortly."):
+        super().__init__(message)
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+class TokenBucket:
+    """Continuously refilling budget of `capacity` units per `period` seconds."""
+
+    def __init__(self, capacity, period=60.0):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` units are available (0 if they are available now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        blocked = max(0.0, self.blocked_until - now)
+        if self.level >= amount:
+            return blocked
+        return max(blocked, (amount - self.level) / self.rate)
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+    def sync(self, remaining, reset_seconds, now):
+        """Aligns the local estimate with the budget the server reports."""
+        self._refill(now)
+        if remaining is not None:
+            self.level = min(self.level, float(remaining))
+            if remaining <= 0 and reset_seconds:
+                self.blocked_until = max(self.blocked_until, now + reset_seconds)
+
+
+class GroqScheduler:
+    """
+    Shared admission control for Groq calls.
+
+    Requests-per-minute and tokens-per-minute are tracked as token buckets that
+    are re-synchronised from Groq's x-ratelimit-* response headers. Callers are
+    admitted in priority order. A call's wait is predicted from the budget it
+    and the calls queued ahead of it need; if that exceeds its priority's short
+    wait limit, or the queue is full, RateLimitExceeded is raised straight away
+    so the request can return 429 with Retry-After instead of holding a worker.
+    """
+
+    def __init__(self, rpm=GROQ_RPM, tpm=GROQ_TPM, max_queue=GROQ_MAX_QUEUE):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_queue = max_queue
+        self.condition = threading.Condition()
+        self.waiting = []
+        self.async_waiters = set()  # (loop, asyncio.Event) of event-loop callers in acquire_async
+        self.sequence = itertools.count()
+        self.shed = 0
+
+    def _wait_time(self, estimated_tokens, now):
+        return max(self.requests.wait_time(1, now), self.tokens.wait_time(estimated_tokens, now))
+
+    def _predicted_wait(self, estimated_tokens, priority, now):
+        """Seconds until a new call could start, counting the budget of queued calls that go before it."""
+        ahead = [entry for entry in self.waiting if entry[0] <= priority]
+        return max(self.requests.wait_time(1 + len(ahead), now),
+                   self.tokens.wait_time(estimated_tokens + sum(entry[2] for entry in ahead), now))
+
+    def _enqueue(self, estimated_tokens, priority):
+        """Queues a call and returns (entry, deadline), or raises RateLimitExceeded. Call holding the condition."""
+        max_wait = MAX_WAIT_SECONDS.get(priority, MAX_WAIT_SECONDS[PRIORITY_STANDARD])
+        now = time.monotonic()
+        wait = self._predicted_wait(estimated_tokens, priority, now)
+        if len(self.waiting) >= self.max_queue or wait > max_wait:
+            self.shed += 1
+            raise RateLimitExceeded(wait)
+        entry = (priority, next(self.sequence), estimated_tokens)
+        heapq.heappush(self.waiting, entry)
+        return entry, now + max_wait
+
+    def _admit(self, entry, deadline):
+        """
+        Takes the budget and returns 0 if `entry` may start now, otherwise how long to wait
+        before checking again. Raises RateLimitExceeded once the deadline can't be met.
+        """
+        now = time.monotonic()
+        wait = self._wait_time(entry[2], now)
+        if self.waiting[0] == entry:
+            if wait <= 0:
+                self.requests.take(1)
+                self.tokens.take(entry[2])
+                return 0
+            if now + wait > deadline:
+                self.shed += 1
+                raise RateLimitExceeded(wait)
+            return max(wait, 0.01)
+        # Higher-priority or earlier callers are ahead of us
+        if now >= deadline:
+            self.shed += 1
+            raise RateLimitExceeded(max(wait, 1))
+        return max(deadline - now, 0.01)
+
+    def _dequeue(self, entry):
+        self.waiting.remove(entry)
+        heapq.heapify(self.waiting)
+        self._notify()
+
+    def _notify(self):
+        """Wakes every queued caller, threads and event-loop tasks alike. Call holding the condition."""
+        self.condition.notify_all()
+        for loop, event in self.async_waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # Loop already closed
+
+    def acquire(self, estimated_tokens, priority=PRIORITY_STANDARD):
+        """Blocks until the call may proceed (at most its priority's short wait limit), or raises RateLimitExceeded."""
+        with self.condition:
+            entry, deadline = self._enqueue(estimated_tokens, priority)
+            try:
+                while True:
+                    timeout = self._admit(entry, deadline)
+                    if not timeout:
+                        return
+                    self.condition.wait(timeout=timeout)
+            finally:
+                self._dequeue(entry)
+
+    async def acquire_async(self, estimated_tokens, priority=PRIORITY_STANDARD):
+        """acquire() for the event loop: queues on an asyncio.Event, so no thread is held while waiting."""
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self.condition:
+            entry, deadline = self._enqueue(estimated_tokens, priority)
+            self.async_waiters.add(waiter)
+        try:
+            while True:
+                with self.condition:
+                    timeout = self._admit(entry, deadline)
+                    if not timeout:
+                        return
+                    event.clear()
+                try:
+                    await asyncio.wait_for(event.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self.condition:
+                self.async_waiters.discard(waiter)
+                self._dequeue(entry)
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        """Charges (or refunds) the difference between the estimate and the tokens actually used."""
+        if actual_tokens is None:
+            return
+        with self.condition:
+            self.tokens.level -= actual_tokens - estimated_tokens
+            self._notify()
+
+    def update_from_headers(self, headers):
+        """Applies x-ratelimit-* (and retry-after) headers from a Groq response."""
+        if not headers:
+            return
+        now = time.monotonic()
+
+        def number(name):
+            try:
+                return float(headers.get(name))
+            except (TypeError, ValueError):
+                return None
+
+        with self.condition:
+            self.requests.sync(number('x-ratelimit-remaining-requests'),
+                               parse_duration(headers.get('x-ratelimit-reset-requests')), now)
+            self.tokens.sync(number('x-ratelimit-remaining-tokens'),
+                             parse_duration(headers.get('x-ratelimit-reset-tokens')), now)
+            retry_after = parse_duration(headers.get('retry-after'))
+            if retry_after:
+                self.requests.blocked_until = max(self.requests.blocked_until, now + retry_after)
+            self._notify()
+
+    def stats(self):
+        with self.condition:
+            now = time.monotonic()
+            self.requests._refill(now)
+            self.tokens._refill(now)
+            return {
+                "requests_available": round(self.requests.level, 1),
+                "tokens_available": round(self.tokens.level),
+                "queued": len(self.waiting),
+                "shed": self.shed,
+            }
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import os
+import threading
+from collections import deque
+
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("COLLAB_SUBSCRIBER_QUEUE", "256"))
+
+
+def format_event(message):
+    """A room message as a Server-Sent Event whose id is the message id, so reconnects resume from it."""
+    return f"id: {message['id']}\ndata: {json.dumps(message)}\n\n"
+
+
+class Subscription:
+    """
+    One connected client's view of a room: a bounded queue of messages not yet sent.
+
+    Works from a thread (`wait`) or from an event loop (`await_messages`, when
+    created with `loop`). If the client falls `max_pending` messages behind it is
+    dropped rather than allowed to slow down the publisher; it reconnects with its
+    last message id and catches up from the room log.
+    """
+
+    def __init__(self, room_id, max_pending=SUBSCRIBER_QUEUE_SIZE, loop=None):
+        self.room_id = room_id
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.dropped = False
+        self._loop = loop
+        self._event = asyncio.Event() if loop else threading.Event()
+
+    def push(self, message):
+        """Called by the publisher. Never blocks; returns False if the subscriber was dropped."""
+        if self.dropped:
+            return False
+        if len(self.pending) >= self.max_pending:
+            self.dropped = True
+        else:
+            self.pending.append(message)
+        self._wake()
+        return not self.dropped
+
+    def _wake(self):
+        if self._loop is None:
+            self._event.set()
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            self.dropped = True  # The subscriber's event loop has gone away
+
+    def drain(self):
+        messages = []
+        while self.pending:
+            messages.append(self.pending.popleft())
+        return messages
+
+    def wait(self, timeout):
+        """Blocks until there is something to drain or `timeout` passes. Returns the drained messages."""
+        self._event.wait(timeout)
+        self._event.clear()
+        return self.drain()
+
+    async def await_messages(self, timeout):
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._event.clear()
+        return self.drain()
+
+
+class RoomBroker:
+    """In-process pub/sub fanning new room messages out to live subscribers."""
+
+    def __init__(self, max_pending=SUBSCRIBER_QUEUE_SIZE):
+        self.max_pending = max_pending
+        self.subscribers = {}
+        self.lock = threading.Lock()
+        self.dropped = 0
+
+    def subscribe(self, room_id, loop=None):
+        subscription = Subscription(room_id, self.max_pending, loop)
+        with self.lock:
+            self.subscribers.setdefault(room_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscribers.get(subscription.room_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscribers[subscription.room_id]
+
+    def publish(self, room_id, message):
+        with self.lock:
+            subscribers = list(self.subscribers.get(room_id, ()))
+        for subscription in subscribers:
+            if not subscription.push(message):
+                self.unsubscribe(subscription)
+                self.dropped += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "rooms": len(self.subscribers),
+                "subscribers": sum(len(s) for s in self.subscribers.values()),
+                "dropped": self.dropped,
+            }
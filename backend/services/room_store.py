@@ -0,0 +1,424 @@
+import atexit
+import json
+import os
+import sqlite3
+import struct
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+ROOMS_FOLDER = 'rooms'
+MANIFEST_FILE = 'manifest.json'
+COLLAB_BACKEND = os.getenv("COLLAB_BACKEND", "sqlite")  # "sqlite" (shared by all workers) or "log" (single process)
+COLLAB_DB_PATH = os.getenv("COLLAB_DB_PATH", os.path.join(ROOMS_FOLDER, "rooms.db"))
+FSYNC_INTERVAL = float(os.getenv("COLLAB_FSYNC_INTERVAL", "1.0"))
+MAX_OPEN_LOGS = 128
+OFFSET = struct.Struct('<Q')  # One fixed-width byte offset per message in a room's .idx file
+
+
+class LogRoomStore:
+    """
+    Stores each room's messages in its own append-only JSON-lines log.
+
+    State is held in this process (room manifest, message counts), so this
+    store is only safe with a single worker; see SQLiteRoomStore.
+
+    Room metadata lives in a small manifest that is only rewritten when a room
+    is created. Adding a message appends one line to that room's log; the
+    write reaches the OS immediately, and dirty logs are fsynced together by a
+    background thread every `fsync_interval` seconds.
+
+    Message ids are sequential per room, so a sidecar `.idx` file holding the
+    byte offset of message N at position N-1 lets a page of messages after any
+    id be read with two seeks instead of a scan of the room.
+    """
+
+    shared = False
+
+    def __init__(self, folder=ROOMS_FOLDER, legacy_file=None, fsync_interval=FSYNC_INTERVAL):
+        self.folder = folder
+        self.fsync_interval = fsync_interval
+        self.lock = threading.Lock()
+        self._handles = OrderedDict()
+        self._dirty = set()
+        self._counts = {}
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        if not os.path.exists(self._manifest_path()) and legacy_file and os.path.exists(legacy_file):
+            self._migrate(legacy_file)
+        self.rooms = self._load_manifest()
+
+        self._stop = threading.Event()
+        threading.Thread(target=self._fsync_loop, daemon=True).start()
+        atexit.register(self.close)
+
+    def _manifest_path(self):
+        return os.path.join(self.folder, MANIFEST_FILE)
+
+    def _log_path(self, room_id):
+        return os.path.join(self.folder, f"{room_id}.log")
+
+    def _index_path(self, room_id):
+        return os.path.join(self.folder, f"{room_id}.idx")
+
+    def _load_manifest(self):
+        if os.path.exists(self._manifest_path()):
+            with open(self._manifest_path(), 'r') as f:
+                return json.load(f)
+        return {}
+
+    def _write_manifest(self):
+        tmp = self._manifest_path() + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.rooms, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._manifest_path())
+
+    def _migrate(self, legacy_file):
+        """One-off conversion of the old single-file rooms.json into per-room logs."""
+        with open(legacy_file, 'r') as f:
+            legacy = json.load(f)
+        self.rooms = {}
+        for room_id, room in legacy.items():
+            with open(self._log_path(room_id), 'wb') as log, open(self._index_path(room_id), 'wb') as index:
+                for i, message in enumerate(room.get("messages", []), start=1):
+                    index.write(OFFSET.pack(log.tell()))
+                    log.write((json.dumps(dict(message, id=i)) + "\n").encode('utf-8'))
+                for f in (log, index):
+                    f.flush()
+                    os.fsync(f.fileno())
+            self.rooms[room_id] = {"name": room.get("name"), "created_at": room.get("created_at")}
+        self._write_manifest()
+        print(f"Migrated {len(self.rooms)} rooms from {legacy_file} to {self.folder}/")
+
+    def create_room(self, room_id, name, created_at):
+        with self.lock:
+            self.rooms[room_id] = {"name": name, "created_at": created_at}
+            self._write_manifest()
+            self._counts[room_id] = 0
+
+    def get_room(self, room_id):
+        return self.rooms.get(room_id)
+
+    def list_rooms(self):
+        return [{"id": rid, "name": data["name"], "created_at": data.get("created_at")} for rid, data in self.rooms.items()]
+
+    def room_count(self):
+        return len(self.rooms)
+
+    def _handle(self, room_id):
+        """Returns the (log, index) pair of append handles for the room."""
+        handles = self._handles.get(room_id)
+        if handles is None:
+            if len(self._handles) >= MAX_OPEN_LOGS:
+                evicted_id, evicted = self._handles.popitem(last=False)
+                for f in evicted:
+                    if evicted_id in self._dirty:
+                        os.fsync(f.fileno())
+                    f.close()
+                self._dirty.discard(evicted_id)
+            handles = (open(self._log_path(room_id), 'ab'), open(self._index_path(room_id), 'ab'))
+            self._handles[room_id] = handles
+        else:
+            self._handles.move_to_end(room_id)
+        return handles
+
+    def _recover(self, room_id):
+        """
+        Checks the room's index against its log the first time the room is touched.
+        Cuts off a torn final line left by a crash mid-write, and rebuilds the index
+        from the log if the two disagree. Returns the number of messages.
+        """
+        log_path, index_path = self._log_path(room_id), self._index_path(room_id)
+        if not os.path.exists(log_path):
+            return 0
+        log_size = os.path.getsize(log_path)
+        count = os.path.getsize(index_path) // OFFSET.size if os.path.exists(index_path) else 0
+
+        if count:
+            with open(index_path, 'rb') as index, open(log_path, 'rb') as log:
+                index.seek((count - 1) * OFFSET.size)
+                log.seek(OFFSET.unpack(index.read(OFFSET.size))[0])
+                last = log.readline()
+                last_end = log.tell()
+            # Consistent when the last indexed message is exactly the final complete line
+            if last.endswith(b"\n") and last_end == log_size and os.path.getsize(index_path) == count * OFFSET.size:
+                return count
+        elif log_size == 0:
+            return 0
+
+        offsets, end = [], 0
+        with open(log_path, 'rb') as log:
+            for line in log:
+                if not line.endswith(b"\n"):
+                    break
+                offsets.append(end)
+                end += len(line)
+        if end != log_size:
+            with open(log_path, 'r+b') as log:
+                log.truncate(end)
+        with open(index_path, 'wb') as index:
+            index.write(b"".join(OFFSET.pack(offset) for offset in offsets))
+            index.flush()
+            os.fsync(index.fileno())
+        print(f"Rebuilt message index for room {room_id} ({len(offsets)} messages)")
+        return len(offsets)
+
+    def message_count(self, room_id):
+        if room_id not in self.rooms:
+            return 0
+        with self.lock:
+            if room_id not in self._counts:
+                self._counts[room_id] = self._recover(room_id)
+            return self._counts[room_id]
+
+    def append_message(self, room_id, message):
+        """Appends `message` to the room's log, assigning it the next sequential id."""
+        if room_id not in self.rooms:
+            return None
+        count = self.message_count(room_id)
+        with self.lock:
+            count = self._counts.get(room_id, count)
+            message = dict(message, id=count + 1)
+            log, index = self._handle(room_id)
+            offset = log.tell()
+            log.write((json.dumps(message) + "\n").encode('utf-8'))
+            log.flush()
+            # The index entry goes last: a message is only visible once both are written
+            index.write(OFFSET.pack(offset))
+            index.flush()
+            self._counts[room_id] = message["id"]
+            self._dirty.add(room_id)
+            return message
+
+    def read_messages(self, room_id, after=0, limit=None):
+        """Returns up to `limit` messages with an id greater than `after`, oldest first."""
+        count = self.message_count(room_id)
+        after = max(0, after)
+        if after >= count:
+            return []
+        end = count if limit is None else min(count, after + limit)
+        with open(self._index_path(room_id), 'rb') as index:
+            index.seek(after * OFFSET.size)
+            start = OFFSET.unpack(index.read(OFFSET.size))[0]
+        messages = []
+        with open(self._log_path(room_id), 'rb') as log:
+            log.seek(start)
+            for _ in range(end - after):
+                line = log.readline()
+                try:
+                    messages.append(json.loads(line))
+                except ValueError:
+                    continue
+        return messages
+
+    def last_id_before(self, room_id, timestamp):
+        """
+        Id of the last message sent at or before `timestamp` (a datetime), or 0.
+        Messages are appended in time order, so this is a binary search over the index.
+        """
+        lo, hi = 0, self.message_count(room_id)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            message = self.read_messages(room_id, mid, 1)
+            try:
+                sent = datetime.fromisoformat(message[0]["timestamp"]) if message else None
+            except (KeyError, TypeError, ValueError):
+                sent = None  # Unparseable timestamps (e.g. from migrated rooms) count as older
+            if sent is None or sent <= timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def flush(self):
+        """fsyncs every log written since the last flush."""
+        with self.lock:
+            for room_id in list(self._dirty):
+                for handle in self._handles.get(room_id, ()):
+                    os.fsync(handle.fileno())
+            self._dirty.clear()
+
+    def _fsync_loop(self):
+        while not self._stop.wait(self.fsync_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Room log fsync error: {e}")
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+        with self.lock:
+            for handles in self._handles.values():
+                for handle in handles:
+                    handle.close()
+            self._handles.clear()
+
+
+class SQLiteRoomStore:
+    """
+    Rooms and messages in one SQLite database in WAL mode, shared by every worker process.
+
+    Each process sees every other process's rooms and messages on its next query,
+    and message ids stay sequential per room because the next id is assigned
+    inside the INSERT itself. Pages after a cursor and `since` lookups are index
+    range reads. `changes_since` lets a process pick up messages that other
+    workers committed so it can push them to its own subscribers.
+    """
+
+    shared = True
+
+    def __init__(self, path=COLLAB_DB_PATH, legacy_file=None, log_folder=ROOMS_FOLDER):
+        self.path = path
+        self.lock = threading.Lock()
+        self._local_seqs = None  # Set once a process starts watching for changes
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS rooms (room_id TEXT PRIMARY KEY, name TEXT, created_at TEXT)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "seq INTEGER PRIMARY KEY, room_id TEXT NOT NULL, id INTEGER NOT NULL, "
+                "timestamp TEXT, body TEXT NOT NULL, UNIQUE (room_id, id))"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS messages_room_time ON messages (room_id, timestamp)")
+        self._migrate(legacy_file, log_folder)
+
+    def _migrate(self, legacy_file, log_folder):
+        """One-off import of rooms from the per-room logs, or failing that the old rooms.json."""
+        has_logs = os.path.exists(os.path.join(log_folder, MANIFEST_FILE))
+        has_json = legacy_file and os.path.exists(legacy_file)
+        if not (has_logs or has_json):
+            return
+        with self.lock, self.conn:
+            # Taking the write lock first means only one worker performs the import
+            self.conn.execute("BEGIN IMMEDIATE")
+            if self.conn.execute("SELECT 1 FROM rooms LIMIT 1").fetchone():
+                return
+            if has_logs:
+                logs = LogRoomStore(log_folder, fsync_interval=3600)
+                rooms = [(room, logs.read_messages(room["id"])) for room in logs.list_rooms()]
+                logs.close()
+                source = log_folder + "/"
+            else:
+                with open(legacy_file, 'r') as f:
+                    legacy = json.load(f)
+                rooms = [(dict(room, id=room_id), [dict(m, id=i) for i, m in enumerate(room.get("messages", []), start=1)])
+                         for room_id, room in legacy.items()]
+                source = legacy_file
+            for room, messages in rooms:
+                self.conn.execute("INSERT INTO rooms (room_id, name, created_at) VALUES (?, ?, ?)",
+                                  (room["id"], room.get("name"), room.get("created_at")))
+                self.conn.executemany(
+                    "INSERT INTO messages (room_id, id, timestamp, body) VALUES (?, ?, ?, ?)",
+                    [(room["id"], m["id"], m.get("timestamp"), json.dumps({k: v for k, v in m.items() if k != "id"}))
+                     for m in messages],
+                )
+        print(f"Migrated {len(rooms)} rooms from {source} to {self.path}")
+
+    def create_room(self, room_id, name, created_at):
+        with self.lock, self.conn:
+            self.conn.execute("INSERT INTO rooms (room_id, name, created_at) VALUES (?, ?, ?)", (room_id, name, created_at))
+
+    def get_room(self, room_id):
+        with self.lock:
+            row = self.conn.execute("SELECT name, created_at FROM rooms WHERE room_id = ?", (room_id,)).fetchone()
+        return {"name": row[0], "created_at": row[1]} if row else None
+
+    def list_rooms(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT room_id, name, created_at FROM rooms ORDER BY rowid").fetchall()
+        return [{"id": rid, "name": name, "created_at": created_at} for rid, name, created_at in rows]
+
+    def room_count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM rooms").fetchone()[0]
+
+    def message_count(self, room_id):
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM messages WHERE room_id = ?", (room_id,)).fetchone()[0]
+
+    def append_message(self, room_id, message):
+        """Appends `message` to the room, assigning it the next sequential id."""
+        body = json.dumps({k: v for k, v in message.items() if k != "id"})
+        with self.lock, self.conn:
+            if not self.conn.execute("SELECT 1 FROM rooms WHERE room_id = ?", (room_id,)).fetchone():
+                return None
+            seq, message_id = self.conn.execute(
+                "INSERT INTO messages (room_id, id, timestamp, body) "
+                "SELECT ?, COALESCE(MAX(id), 0) + 1, ?, ? FROM messages WHERE room_id = ? RETURNING seq, id",
+                (room_id, message.get("timestamp"), body, room_id),
+            ).fetchone()
+            if self._local_seqs is not None:
+                self._local_seqs.add(seq)
+        return dict(message, id=message_id)
+
+    def read_messages(self, room_id, after=0, limit=None):
+        """Returns up to `limit` messages with an id greater than `after`, oldest first."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, body FROM messages WHERE room_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (room_id, max(0, after), -1 if limit is None else limit),
+            ).fetchall()
+        return [dict(json.loads(body), id=message_id) for message_id, body in rows]
+
+    def last_id_before(self, room_id, timestamp):
+        """Id of the last message sent at or before `timestamp` (a datetime), or 0."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COALESCE(MAX(id), 0) FROM messages WHERE room_id = ? AND timestamp <= ?",
+                (room_id, str(timestamp)),
+            ).fetchone()[0]
+
+    def change_cursor(self):
+        """Position to pass to the first `changes_since` call."""
+        with self.lock:
+            self._local_seqs = set()
+            return (self.conn.execute("PRAGMA data_version").fetchone()[0],
+                    self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM messages").fetchone()[0])
+
+    def changes_since(self, cursor):
+        """
+        Messages other processes have committed since `cursor`, as (room_id, message) pairs,
+        plus the new cursor. data_version only moves when another connection commits, so
+        an idle poll costs a single pragma.
+        """
+        version, last_seq = cursor
+        with self.lock:
+            current = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if current == version:
+                # Nothing committed elsewhere, so anything new was written (and published) here
+                if self._local_seqs:
+                    last_seq = max(last_seq, max(self._local_seqs))
+                    self._local_seqs.clear()
+                return (version, last_seq), []
+            rows = self.conn.execute(
+                "SELECT seq, room_id, id, body FROM messages WHERE seq > ? ORDER BY seq", (last_seq,)
+            ).fetchall()
+            changes = []
+            for seq, room_id, message_id, body in rows:
+                if seq in self._local_seqs:
+                    self._local_seqs.discard(seq)  # Already published by this process
+                else:
+                    changes.append((room_id, dict(json.loads(body), id=message_id)))
+        return (current, rows[-1][0] if rows else last_seq), changes
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def create_room_store(legacy_file=None):
+    """The store selected by COLLAB_BACKEND."""
+    if COLLAB_BACKEND == "log":
+        return LogRoomStore(legacy_file=legacy_file)
+    return SQLiteRoomStore(legacy_file=legacy_file)
@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .response_cache import ResponseCache, make_key
+
+SEARCH_CACHE_PATH = os.path.join('search_cache', 'results.db')
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "5000"))
+SEARCH_CACHE_MEMORY_ENTRIES = int(os.getenv("SEARCH_CACHE_MEMORY_ENTRIES", "512"))
+# How long a search result is reused, by the feature asking. Overridable as SEARCH_TTL_<FEATURE> (seconds).
+# News is kept shorter than the news page cache so its refreshes fetch new articles.
+DEFAULT_FEATURE_TTLS = {
+    "web_research": 6 * 3600,
+    "trends": 24 * 3600,
+    "funding": 12 * 3600,
+    "visual": 7 * 24 * 3600,
+    "news": 900,
+}
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "3600"))  # Features not listed above
+
+
+def feature_ttls():
+    return {feature: int(os.getenv(f"SEARCH_TTL_{feature.upper()}", ttl)) for feature, ttl in DEFAULT_FEATURE_TTLS.items()}
+
+
+def normalize_query(query):
+    return " ".join(str(query).lower().split())
+
+
+class SearchCache:
+    """
+    Search responses keyed by normalized query and search options.
+
+    A small in-memory LRU sits in front of an on-disk ResponseCache that all
+    workers share and that survives restarts. Each lookup applies the TTL of
+    the feature asking, so one feature's result can serve another that accepts
+    results that old.
+    """
+
+    def __init__(self, path=SEARCH_CACHE_PATH, ttls=None, default_ttl=SEARCH_CACHE_TTL,
+                 memory_entries=SEARCH_CACHE_MEMORY_ENTRIES, max_entries=SEARCH_CACHE_MAX_ENTRIES):
+        self.ttls = ttls if ttls is not None else feature_ttls()
+        self.default_ttl = default_ttl
+        self.disk = ResponseCache(path, max([default_ttl, *self.ttls.values()]), max_entries)
+        self.memory = OrderedDict()  # key -> (response, stored_at)
+        self.memory_entries = memory_entries
+        self.lock = threading.Lock()
+        self.metrics = {}  # feature -> {"memory_hits", "disk_hits", "misses"}
+
+    def key(self, query, options):
+        return make_key("search", normalize_query(query), options)
+
+    def ttl(self, feature):
+        return self.ttls.get(feature, self.default_ttl)
+
+    def _count(self, feature, outcome):
+        counts = self.metrics.setdefault(feature, {"memory_hits": 0, "disk_hits": 0, "misses": 0})
+        counts[outcome] += 1
+
+    def get(self, key, feature):
+        ttl = self.ttl(feature)
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None and time.time() - entry[1] < ttl:
+                self.memory.move_to_end(key)
+                self._count(feature, "memory_hits")
+                return entry[0]
+        stored = self.disk.get(key, ttl=ttl)
+        with self.lock:
+            if stored is None:
+                self._count(feature, "misses")
+                return None
+            self._count(feature, "disk_hits")
+            self._remember(key, stored["response"], stored["stored_at"])
+        return stored["response"]
+
+    def put(self, key, response):
+        now = time.time()
+        self.disk.put(key, {"response": response, "stored_at": now})
+        with self.lock:
+            self._remember(key, response, now)
+
+    def _remember(self, key, response, stored_at):
+        self.memory[key] = (response, stored_at)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            features = {feature: dict(counts) for feature, counts in self.metrics.items()}
+            memory = len(self.memory)
+        hits = sum(c["memory_hits"] + c["disk_hits"] for c in features.values())
+        lookups = hits + sum(c["misses"] for c in features.values())
+        return {
+            "memory_entries": memory,
+            "disk_entries": self.disk.stats()["entries"],
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "features": features,
+        }
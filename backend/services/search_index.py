@@ -0,0 +1,335 @@
+import os
+import pickle
+import sqlite3
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+INDEX_FOLDER = 'search_index'
+SNAPSHOT_FILE = 'index.pkl'
+LEGACY_MATRIX_FILE = 'index.npz'  # Older snapshots kept the matrix in a separate file
+LOG_FILE = 'index.db'
+SNIPPET_LENGTH = 300
+# Logged changes are folded into a fresh snapshot once this many pile up
+COMPACT_AFTER = int(os.getenv("SEARCH_INDEX_COMPACT_AFTER", "200"))
+
+
+class TfidfIndex:
+    """
+    Persistent TF-IDF index that can grow one document at a time.
+
+    Raw term counts and document frequencies are stored instead of fitted
+    weights, so adding or removing a document never requires refitting the
+    corpus. IDF weights are derived from the document frequencies when the
+    index is queried and cached until the next change.
+
+    On disk the index is a snapshot plus an append-only change log in SQLite
+    that every worker process replays, so each worker sees the others' changes
+    and none overwrites them. Changes are made inside `writing()`, which holds
+    the log's write lock. Every COMPACT_AFTER changes the writer folds the log
+    into a new snapshot and trims it.
+
+    Each document keeps the first `snippet_length` characters of its text;
+    with `snippet_length=0` only its name and metadata are kept.
+    """
+
+    def __init__(self, index_folder=INDEX_FOLDER, snippet_length=SNIPPET_LENGTH, compact_after=COMPACT_AFTER):
+        self.index_folder = index_folder
+        self.snippet_length = snippet_length
+        self.compact_after = compact_after
+        # Same analyzer settings the one-shot vectorizer used: words + short phrases
+        self.analyzer = TfidfVectorizer(stop_words='english', ngram_range=(1, 2)).build_analyzer()
+        self.lock = threading.RLock()
+        self._reset()
+        self._pending = None  # Changes made in the current writing() block
+        self._data_version = None
+        if not os.path.exists(index_folder):
+            os.makedirs(index_folder)
+        self.conn = sqlite3.connect(os.path.join(index_folder, LOG_FILE), check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, op TEXT NOT NULL, payload BLOB NOT NULL)"
+            )
+            self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._load()
+        self.refresh()
+
+    def _reset(self):
+        self.vocabulary = {}
+        self._doc_freq = np.zeros(0, dtype=np.int64)  # Over-allocated; the first len(vocabulary) entries are live
+        self._counts = sp.csr_matrix((0, 0), dtype=np.float64)
+        self._new_rows = []  # Rows added since the matrix was last assembled
+        self.documents = []  # [{"name", "mtime", "size", "snippet", ...metadata}], aligned with matrix rows
+        self.seq = 0  # Last logged change reflected in memory
+        self._positions = None
+        self._weighted = None
+        self._idf = None
+
+    def _snapshot_path(self):
+        return os.path.join(self.index_folder, SNAPSHOT_FILE)
+
+    def _load(self):
+        """Loads the latest snapshot; changes logged after it are applied by `_catch_up`."""
+        path = self._snapshot_path()
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'rb') as f:
+                meta = pickle.load(f)
+            counts = meta.get('counts')
+            if counts is None:
+                counts = sp.load_npz(os.path.join(self.index_folder, LEGACY_MATRIX_FILE))
+            counts = counts.tocsr()
+            if counts.shape[0] != len(meta['documents']):
+                raise ValueError("matrix rows do not match document list")
+            self.vocabulary = meta['vocabulary']
+            self._doc_freq = meta['doc_freq']
+            self.documents = meta['documents']
+            if not self.snippet_length:
+                # Snapshots written before passages stopped carrying their text
+                for doc in self.documents:
+                    doc.pop('snippet', None)
+            self._counts = counts
+            self.seq = meta.get('seq', 0)
+        except Exception as e:
+            self._reset()
+            print(f"Search index at {self.index_folder} is unreadable, rebuilding: {e}")
+
+    @property
+    def doc_freq(self):
+        return self._doc_freq[:len(self.vocabulary)]
+
+    @property
+    def counts(self):
+        """The (documents x terms) count matrix, assembling rows added since the last call."""
+        n_terms = len(self.vocabulary)
+        if self._new_rows or self._counts.shape[1] != n_terms:
+            blocks = [self._counts] + self._new_rows
+            for block in blocks:
+                block.resize((block.shape[0], n_terms))
+            self._counts = sp.vstack(blocks, format='csr')
+            self._new_rows = []
+        return self._counts
+
+    def refresh(self):
+        """Applies changes other processes have logged since this one last looked. Returns True if any were applied."""
+        with self.lock:
+            if self._pending is not None:
+                return False
+            version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version:
+                # data_version only moves when another connection commits, so this is the common, free case
+                return False
+            with self.conn:
+                self.conn.execute("BEGIN")
+                changed = self._catch_up()
+            self._data_version = version
+            return changed
+
+    def _catch_up(self):
+        """Replays logged changes newer than `self.seq`. Call inside a transaction."""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'snapshot_seq'").fetchone()
+        snapshot_seq = row[0] if row else 0
+        reloaded = False
+        if self.seq < snapshot_seq:
+            # Changes we never saw have been folded into a newer snapshot
+            self._reset()
+            self._load()
+            reloaded = True
+            if self.seq < snapshot_seq:
+                print(f"Search index snapshot at {self.index_folder} is missing; papers will be re-indexed")
+                self.seq = snapshot_seq
+        rows = self.conn.execute("SELECT seq, op, payload FROM changes WHERE seq > ? ORDER BY seq", (self.seq,)).fetchall()
+        for seq, op, payload in rows:
+            if op == 'add':
+                self._add(pickle.loads(payload))
+            else:
+                self._remove(pickle.loads(payload))
+            self.seq = seq
+        return reloaded or bool(rows)
+
+    @contextmanager
+    def writing(self):
+        """
+        Block in which the index may be changed. Holds the log's write lock across
+        processes, catches up with other writers first and logs the changes on exit.
+        """
+        with self.lock:
+            if self._pending is not None:
+                yield self
+                return
+            with self.conn:
+                self.conn.execute("BEGIN IMMEDIATE")
+                self._pending = []
+                try:
+                    self._catch_up()
+                    yield self
+                    for op, payload in self._pending:
+                        cursor = self.conn.execute("INSERT INTO changes (op, payload) VALUES (?, ?)",
+                                                   (op, pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)))
+                        self.seq = cursor.lastrowid
+                    if self._pending:
+                        self._maybe_compact()
+                except BaseException:
+                    # Memory may hold changes that were never logged; start over from what is committed
+                    self.conn.rollback()
+                    self._reset()
+                    self._load()
+                    with self.conn:
+                        self.conn.execute("BEGIN")
+                        self._catch_up()
+                    self._data_version = None
+                    raise
+                finally:
+                    self._pending = None
+
+    def _maybe_compact(self):
+        logged = self.conn.execute("SELECT COUNT(*) FROM changes").fetchone()[0]
+        if logged < self.compact_after:
+            return
+        path = self._snapshot_path()
+        # Write to a temp file first so a crash never leaves a half-written snapshot
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump({
+                'seq': self.seq,
+                'vocabulary': self.vocabulary,
+                'doc_freq': self.doc_freq.copy(),
+                'documents': self.documents,
+                'counts': self.counts,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+        legacy = os.path.join(self.index_folder, LEGACY_MATRIX_FILE)
+        if os.path.exists(legacy):
+            os.remove(legacy)
+        # Only committed together with the new log entries, so readers never see a trimmed log without the snapshot
+        self.conn.execute("DELETE FROM changes WHERE seq <= ?", (self.seq,))
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('snapshot_seq', ?)", (self.seq,))
+
+    def __contains__(self, name):
+        return self._position(name) is not None
+
+    def __len__(self):
+        return len(self.documents)
+
+    def _position(self, name):
+        if self._positions is None:
+            self._positions = {doc['name']: i for i, doc in enumerate(self.documents)}
+        return self._positions.get(name)
+
+    def is_current(self, name, mtime, size):
+        """True if `name` is indexed and was indexed from a file with this mtime/size."""
+        with self.lock:
+            pos = self._position(name)
+            if pos is None:
+                return False
+            doc = self.documents[pos]
+            return doc['mtime'] == mtime and doc['size'] == size
+
+    def _row(self, terms, grow):
+        """`terms` ({term: count}) as a (1, n_terms) row. New terms are added to the vocabulary if `grow`."""
+        columns = []
+        values = []
+        for term, count in terms.items():
+            col = self.vocabulary.get(term)
+            if col is None:
+                if not grow:
+                    continue
+                col = len(self.vocabulary)
+                self.vocabulary[term] = col
+            columns.append(col)
+            values.append(count)
+        return sp.csr_matrix(
+            (np.array(values, dtype=np.float64), (np.zeros(len(columns), dtype=np.int64), np.array(columns, dtype=np.int64))),
+            shape=(1, len(self.vocabulary)),
+        )
+
+    def add_document(self, name, text, mtime=None, size=None, **metadata):
+        """Adds (or replaces) a document. Only the new row and its terms' document frequencies are touched."""
+        self.add_documents([(name, text, dict(metadata, mtime=mtime, size=size))])
+
+    def add_documents(self, entries):
+        """Adds (or replaces) several documents at once; `entries` is a list of (name, text, metadata)."""
+        if not entries:
+            return
+        added = []
+        for name, text, metadata in entries:
+            doc = {"mtime": None, "size": None}
+            doc.update(metadata)
+            doc["name"] = name
+            if self.snippet_length:
+                doc["snippet"] = text[:self.snippet_length]
+            added.append((dict(Counter(self.analyzer(text))), doc))
+        with self.writing():
+            self._add(added)
+            self._pending.append(('add', added))
+
+    def _add(self, added):
+        """Applies an 'add' change: a list of ({term: count}, document)."""
+        self._remove([doc['name'] for _, doc in added])
+        rows = [self._row(terms, grow=True) for terms, _ in added]
+        n_terms = len(self.vocabulary)
+        if len(self._doc_freq) < n_terms:
+            # Grow geometrically so adding a document doesn't copy the whole array
+            grown = np.zeros(max(n_terms, 2 * len(self._doc_freq)), dtype=np.int64)
+            grown[:len(self._doc_freq)] = self._doc_freq
+            self._doc_freq = grown
+        for row in rows:
+            self._doc_freq[row.indices] += 1
+        self._new_rows.extend(rows)
+        self.documents.extend(doc for _, doc in added)
+        self._positions = None
+        self._weighted = None
+
+    def remove_document(self, name):
+        return self.remove_documents([name]) > 0
+
+    def remove_documents(self, names):
+        """Removes every listed document that is indexed. Returns how many were removed."""
+        if not names:
+            return 0
+        with self.writing():
+            names = [name for name in names if self._position(name) is not None]
+            if names:
+                self._remove(names)
+                self._pending.append(('remove', names))
+            return len(names)
+
+    def _remove(self, names):
+        positions = [pos for pos in (self._position(name) for name in names) if pos is not None]
+        if not positions:
+            return
+        counts = self.counts
+        removed = counts[positions]
+        self._doc_freq[:counts.shape[1]] -= np.bincount(removed.indices, minlength=counts.shape[1])
+        keep = np.ones(counts.shape[0], dtype=bool)
+        keep[positions] = False
+        self._counts = counts[keep]
+        self.documents = [doc for doc, kept in zip(self.documents, keep) if kept]
+        self._positions = None
+        self._weighted = None
+
+    def _weights(self):
+        """Returns (idf, L2-normalised tf-idf document matrix), recomputing only after a change."""
+        if self._weighted is None:
+            counts = self.counts
+            # Smoothed IDF, identical to TfidfVectorizer's default
+            self._idf = np.log((1 + counts.shape[0]) / (1 + self.doc_freq)) + 1.0
+            self._weighted = normalize(counts.multiply(self._idf).tocsr())
+        return self._idf, self._weighted
+
+    def query(self, text):
+        """Returns cosine similarity of `text` against every indexed document, in `self.documents` order."""
+        with self.lock:
+            if not self.documents:
+                return np.zeros(0)
+            idf, weighted = self._weights()
+            query_vector = self._row(Counter(self.analyzer(text)), grow=False)
+            query_vector.resize((1, weighted.shape[1]))
+            query_vector = normalize(query_vector.multiply(idf).tocsr())
+            return (weighted @ query_vector.T).toarray().ravel()
@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from tavily import TavilyClient
+from tavily.errors import TimeoutError as SearchTimeout
+
+from .search_cache import SearchCache
+
+# Load dotenv from backend root
+env_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env')
+load_dotenv(env_path)
+
+# Seconds to wait for one search; advanced searches crawl more and get longer
+TAVILY_TIMEOUT = float(os.getenv("TAVILY_TIMEOUT", "10"))
+TAVILY_ADVANCED_TIMEOUT = float(os.getenv("TAVILY_ADVANCED_TIMEOUT", "20"))
+# Kept-alive connections to the Tavily API, shared by every thread
+TAVILY_POOL_SIZE = int(os.getenv("TAVILY_POOL_SIZE", "16"))
+
+
+class SearchProvider:
+    """
+    The one Tavily client for the whole process.
+
+    Every web search goes through `search`, so all callers reuse the same
+    pooled HTTP session (and its TLS connections) instead of building a client
+    per call. Also applies a timeout per search depth and keeps call metrics.
+    Responses are cached (see SearchCache), so repeating a search within the
+    calling feature's TTL never reaches the network.
+    """
+
+    name = "tavily"
+
+    def __init__(self, api_key=None, cache=None, pool_size=TAVILY_POOL_SIZE,
+                 timeout=TAVILY_TIMEOUT, advanced_timeout=TAVILY_ADVANCED_TIMEOUT):
+        self.api_key = api_key or os.getenv("TAVILY_API_KEY")
+        self.cache = cache or SearchCache()
+        self.timeouts = {"basic": timeout, "advanced": advanced_timeout}
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.timeouts_hit = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        if self.api_key:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self.client = TavilyClient(api_key=self.api_key, session=session)
+        else:
+            self.client = None
+
+    @property
+    def available(self):
+        return self.client is not None
+
+    def search(self, query, feature=None, timeout=None, **options):
+        """
+        Runs a Tavily search and returns its response dict, from the cache when the
+        same search was made within `feature`'s TTL. `timeout` defaults to the timeout
+        for the search depth. Raises if the provider isn't configured or the search fails.
+        """
+        if self.client is None:
+            raise RuntimeError("TAVILY_API_KEY is not set")
+        key = self.cache.key(query, options)
+        cached = self.cache.get(key, feature)
+        if cached is not None:
+            return cached
+
+        if timeout is None:
+            timeout = self.timeouts.get(options.get("search_depth") or "basic", self.timeouts["basic"])
+        start = time.monotonic()
+        try:
+            response = self.client.search(query, timeout=timeout, **options)
+        except Exception as e:
+            with self.lock:
+                self.errors += 1
+                if isinstance(e, (SearchTimeout, requests.Timeout)):
+                    self.timeouts_hit += 1
+            raise
+        finally:
+            elapsed = time.monotonic() - start
+            with self.lock:
+                self.calls += 1
+                self.total_seconds += elapsed
+                self.max_seconds = max(self.max_seconds, elapsed)
+        if response.get("results"):
+            self.cache.put(key, response)
+        return response
+
+    def stats(self):
+        with self.lock:
+            return {
+                "provider": self.name,
+                "configured": self.available,
+                "calls": self.calls,
+                "errors": self.errors,
+                "timeouts": self.timeouts_hit,
+                "avg_seconds": round(self.total_seconds / self.calls, 3) if self.calls else 0.0,
+                "max_seconds": round(self.max_seconds, 3),
+                "cache": self.cache.stats(),
+            }
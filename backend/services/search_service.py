@@ -1,70 +1,200 @@
 import os
+import threading
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from .search_index import TfidfIndex, INDEX_FOLDER
+from .paper_service import page_offsets, page_for_offset
+from .tokens import count_tokens, truncate_to_tokens
+
+MIN_CONTENT_LENGTH = 50
+PASSAGE_FOLDER = os.path.join(INDEX_FOLDER, 'passages')
+CHUNK_CHARS = 1200
+CHUNK_OVERLAP = 200
+QA_CONTEXT_TOKENS = int(os.getenv("QA_CONTEXT_TOKENS", "1500"))
+
+
+def chunk_pages(pages, chunk_chars=CHUNK_CHARS, overlap=CHUNK_OVERLAP):
+    """
+    Splits a document into overlapping passages, preferring to cut at whitespace.
+    Returns the joined text and a list of (start, end, page) spans, with 0-based pages.
+    """
+    text = "".join(pages)
+    offsets = page_offsets(pages)
+    spans = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_chars, len(text))
+        if end < len(text):
+            cut = max(text.rfind(' ', start + chunk_chars // 2, end), text.rfind('\n', start + chunk_chars // 2, end))
+            if cut > start:
+                end = cut
+        spans.append((start, end, page_for_offset(offsets, start)))
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+        # Begin the next passage on a word boundary
+        boundary = text.find(' ', start, end)
+        if boundary != -1:
+            start = boundary + 1
+    return text, spans
 
 class SearchService:
-    def __init__(self, paper_service=None):
+    def __init__(self, paper_service=None, index=None, passages=None):
         self.paper_service = paper_service
+        self._index = index
+        self._passages = passages
+        self._synced_mtime = None  # Upload folder mtime at the last full scan
+        self._sync_thread = None
+        self._sync_lock = threading.Lock()
+
+    @property
+    def index(self):
+        # Loaded lazily so importing the services package stays cheap
+        if self._index is None:
+            self._index = TfidfIndex()
+        return self._index
+
+    @property
+    def passages(self):
+        """
+        Passage-level index: one entry per overlapping chunk, named '<paper>#<n>'.
+        Entries hold only the paper, page and character span; the text is read
+        back from the text cache when a passage is used.
+        """
+        if self._passages is None:
+            self._passages = TfidfIndex(PASSAGE_FOLDER, snippet_length=0)
+        return self._passages
+
+    def _passage_names(self, filename):
+        return [doc['name'] for doc in self.passages.documents if doc['paper'] == filename]
 
-    def get_all_paper_contents(self):
-        """Fetches content and filenames for all papers in the knowledge base."""
+    def _is_current(self, filename, stat):
+        return (self.index.is_current(filename, stat.st_mtime, stat.st_size)
+                and self.passages.is_current(f"{filename}#0", stat.st_mtime, stat.st_size))
+
+    def _refresh_paper(self, filename):
+        """Re-indexes one paper if its file changed since it was indexed. Returns True if the index changed."""
+        path = self.paper_service.get_paper_path(filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # Lock order is always index, then passages
+            with self.index.writing(), self.passages.writing():
+                removed = self.passages.remove_documents(self._passage_names(filename))
+                return self.index.remove_document(filename) or removed > 0
+
+        if self._is_current(filename, stat):
+            return False
+
+        # Extract before taking the write locks; other workers keep indexing meanwhile
+        pages = self.paper_service.extract_pages(path) or []
+        content = "".join(pages)
+        with self.index.writing(), self.passages.writing():
+            if self._is_current(filename, stat):
+                return False  # Another worker indexed it first
+            removed = self.passages.remove_documents(self._passage_names(filename))
+            if len(content.strip()) > MIN_CONTENT_LENGTH:
+                self.index.add_document(filename, content, mtime=stat.st_mtime, size=stat.st_size)
+                text, spans = chunk_pages(pages)
+                self.passages.add_documents([
+                    (f"{filename}#{i}", text[start:end], {
+                        "paper": filename, "page": page + 1, "start": start, "end": end,
+                        "mtime": stat.st_mtime, "size": stat.st_size,
+                    })
+                    for i, (start, end, page) in enumerate(spans)
+                ])
+                return True
+            return self.index.remove_document(filename) or removed > 0
+
+    def index_paper(self, filename):
+        """Adds or refreshes a single paper in the persisted indexes."""
         if not self.paper_service:
-            return [], []
-            
-        filenames = self.paper_service.list_papers()
-        contents = []
-        valid_filenames = []
-        
-        for name in filenames:
-            path = self.paper_service.get_paper_path(name)
-            content = self.paper_service.extract_text(path)
-            if content and len(content.strip()) > 50:
-                contents.append(content)
-                valid_filenames.append(name)
-        
-        return contents, valid_filenames
+            return
+        try:
+            before = self._folder_mtime()
+            self._refresh_paper(filename)
+            with self._sync_lock:
+                # Our own upload is what moved the folder mtime; no rescan needed for it
+                if self._synced_mtime is not None and self._synced_mtime != before:
+                    self._synced_mtime = before
+        except Exception as e:
+            print(f"Error indexing {filename}: {e}")
+
+    def sync_index(self):
+        """Brings the indexes in line with the upload folder: new/changed papers are indexed, removed ones dropped."""
+        if not self.paper_service:
+            return
+        mtime = self._folder_mtime()
+        filenames = set(self.paper_service.list_papers())
+        with self.index.writing(), self.passages.writing():
+            self.index.remove_documents([doc['name'] for doc in self.index.documents if doc['name'] not in filenames])
+            self.passages.remove_documents([doc['name'] for doc in self.passages.documents if doc['paper'] not in filenames])
+
+        for name in sorted(filenames):
+            self._refresh_paper(name)
+        with self._sync_lock:
+            self._synced_mtime = mtime
+
+    def _folder_mtime(self):
+        try:
+            return os.stat(self.paper_service.upload_folder).st_mtime_ns
+        except OSError:
+            return None
+
+    def _ensure_current(self):
+        """
+        Run before every query. Applies index changes other workers have logged. If files
+        were added to or removed from the upload folder since the last scan, a rescan is
+        started in the background; the query goes ahead with the index as it is.
+        """
+        self.index.refresh()
+        self.passages.refresh()
+        if self._folder_mtime() != self._synced_mtime:
+            self._start_sync()
+
+    def _start_sync(self):
+        with self._sync_lock:
+            if self._sync_thread is not None and self._sync_thread.is_alive():
+                return
+            self._sync_thread = threading.Thread(target=self._background_sync, name="search-sync", daemon=True)
+            self._sync_thread.start()
+
+    def _background_sync(self):
+        try:
+            self.sync_index()
+        except Exception as e:
+            print(f"Search index rescan failed: {e}")
 
     def find_similar_documents(self, query_text, k=5, threshold=0.1):
         """
         Uses TF-IDF Vectorization and Cosine Similarity to find matching documents.
         This represents a 'correct algorithm' for document-level plagiarism detection.
+        The corpus is held in a persisted index, so a query only vectorizes the query text.
         """
-        contents, filenames = self.get_all_paper_contents()
-        
-        if not contents or not query_text:
+        if not self.paper_service or not query_text:
             return []
 
-        # Initialize TF-IDF Vectorizer
-        # We use ngram_range=(1,2) to catch both words and short phrases
-        vectorizer = TfidfVectorizer(stop_words='english', ngram_range=(1, 2))
-        
         try:
-            # Fit and transform the document corpus + the query
-            tfidf_matrix = vectorizer.fit_transform(contents + [query_text])
-            
-            # The query vector is the last one in the matrix
-            query_vector = tfidf_matrix[-1]
-            document_vectors = tfidf_matrix[:-1]
-            
-            # Calculate cosine similarity between query and all documents
-            similarities = cosine_similarity(query_vector, document_vectors).flatten()
-            
+            self._ensure_current()
+
+            with self.index.lock:
+                similarities = self.index.query(query_text)
+                documents = list(self.index.documents)
+
             # Sort by similarity score
             results = []
             for idx in np.argsort(similarities)[::-1]:
                 score = similarities[idx]
-                if score >= threshold:
-                    content_snippet = contents[idx]
-                    results.append({
-                        "source": filenames[idx],
-                        "score": round(float(score) * 100, 2),
-                        "content": content_snippet[:300] + "..."
-                    })
-                
+                if score < threshold:
+                    break
+                results.append({
+                    "source": documents[idx]['name'],
+                    "score": round(float(score) * 100, 2),
+                    "content": documents[idx]['snippet'] + "..."
+                })
+
                 if len(results) >= k:
                     break
-            
+
             return results
         except Exception as e:
             print(f"Algorithm Error in Similarity Check: {e}")
@@ -73,3 +203,96 @@ class SearchService:
     def search(self, query, k=5):
         """Original search method updated to use higher accuracy algorithm."""
         return self.find_similar_documents(query, k=k)
+
+    def search_passages(self, query, k=8, threshold=0.05):
+        """
+        Scores every indexed passage against `query` and returns the best `k` with page/offset
+        metadata. The passage text is not included; see `passage_text`.
+        """
+        if not self.paper_service or not query:
+            return []
+        try:
+            self._ensure_current()
+
+            with self.passages.lock:
+                similarities = self.passages.query(query)
+                documents = list(self.passages.documents)
+
+            results = []
+            for idx in np.argsort(similarities)[::-1][:k]:
+                score = similarities[idx]
+                if score < threshold:
+                    break
+                doc = documents[idx]
+                results.append({
+                    "source": doc['paper'],
+                    "page": doc['page'],
+                    "start": doc['start'],
+                    "end": doc['end'],
+                    "mtime": doc['mtime'],
+                    "size": doc['size'],
+                    "score": round(float(score) * 100, 2),
+                })
+            return results
+        except Exception as e:
+            print(f"Passage search error: {e}")
+            return []
+
+    def _paper_text(self, passage):
+        """The paper text a passage's offsets refer to, or None if the file changed since it was indexed."""
+        path = self.paper_service.get_paper_path(passage['source'])
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if stat.st_mtime != passage['mtime'] or stat.st_size != passage['size']:
+            return None
+        pages = self.paper_service.extract_pages(path)
+        return "".join(pages) if pages else None
+
+    def passage_text(self, passage, papers=None):
+        """
+        Reads a passage's text from the paper's cached pages. `papers` maps source to
+        paper text and is filled in as papers are read, so one paper is joined once.
+        """
+        papers = {} if papers is None else papers
+        if passage['source'] not in papers:
+            papers[passage['source']] = self._paper_text(passage)
+        text = papers[passage['source']]
+        return text[passage['start']:passage['end']] if text is not None else None
+
+    def build_context(self, question, max_tokens=QA_CONTEXT_TOKENS, k=8):
+        """
+        Builds a retrieval context for `question` from the best-matching passages.
+        Passages are taken in score order until the token budget is spent; overlapping
+        passages from the same paper are then merged so shared text is sent only once.
+        """
+        selected = []
+        used = 0
+        papers = {}
+        for passage in self.search_passages(question, k=k):
+            passage['content'] = self.passage_text(passage, papers)
+            if passage['content'] is None:
+                continue  # The paper changed or was removed since it was indexed
+            cost = count_tokens(passage['content'])
+            if used + cost > max_tokens:
+                if not selected:
+                    passage['content'] = truncate_to_tokens(passage['content'], max_tokens)
+                    selected.append(passage)
+                break
+            selected.append(passage)
+            used += cost
+
+        blocks = []
+        for passage in sorted(selected, key=lambda p: (p['source'], p['start'])):
+            last = blocks[-1] if blocks else None
+            if last and last['source'] == passage['source'] and passage['start'] <= last['end']:
+                if passage['end'] > last['end']:
+                    last['content'] += passage['content'][last['end'] - passage['start']:]
+                    last['end'] = passage['end']
+                last['score'] = max(last['score'], passage['score'])
+            else:
+                blocks.append(dict(passage))
+
+        blocks.sort(key=lambda b: b['score'], reverse=True)
+        return "\n\n".join(f"[{b['source']}, p. {b['page']}]\n{b['content']}" for b in blocks)
@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+import uuid
+
+STREAM_BUFFER_TTL = int(os.getenv("STREAM_BUFFER_TTL", "300"))
+HEARTBEAT_SECONDS = 15
+
+
+class StreamBuffer:
+    """Chunks produced so far by one generation, plus whether it has finished."""
+
+    def __init__(self, owner):
+        self.stream_id = uuid.uuid4().hex
+        self.owner = owner
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.finished_at = None
+        self.condition = threading.Condition()
+
+    def append(self, chunk):
+        with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    def finish(self, error=None):
+        with self.condition:
+            self.done = True
+            self.error = error
+            self.finished_at = time.time()
+            self.condition.notify_all()
+
+
+class StreamService:
+    """
+    Runs LLM generations in the background and keeps their output for a short time.
+
+    A generation keeps running if the client disconnects, so a reconnecting client
+    can replay everything after the last chunk it saw instead of asking again.
+    Buffers are dropped STREAM_BUFFER_TTL seconds after their generation finishes.
+
+    Buffers live in the memory of the process running the generation, so with
+    several workers a resume request must reach the same one (sticky sessions);
+    elsewhere it gets a 404 and the client asks again.
+    """
+
+    def __init__(self, ttl=STREAM_BUFFER_TTL):
+        self.ttl = ttl
+        self.streams = {}
+        self.lock = threading.Lock()
+
+    def start(self, chunks, owner, first_chunk=None):
+        """Consumes the `chunks` iterator on a background thread. Returns the new StreamBuffer."""
+        buffer = StreamBuffer(owner)
+        if first_chunk:
+            buffer.append(first_chunk)
+        with self.lock:
+            self._purge()
+            self.streams[buffer.stream_id] = buffer
+
+        def run():
+            try:
+                for chunk in chunks:
+                    buffer.append(chunk)
+                buffer.finish()
+            except Exception as e:
+                print(f"Background stream {buffer.stream_id} failed: {e}")
+                buffer.finish(error=str(e))
+
+        threading.Thread(target=run, daemon=True).start()
+        return buffer
+
+    def get(self, stream_id, owner):
+        with self.lock:
+            self._purge()
+            buffer = self.streams.get(stream_id)
+        if buffer is None or buffer.owner != owner:
+            return None
+        return buffer
+
+    def _purge(self):
+        cutoff = time.time() - self.ttl
+        for stream_id in [sid for sid, b in self.streams.items() if b.finished_at and b.finished_at < cutoff]:
+            del self.streams[stream_id]
+
+    def follow(self, buffer, start=0):
+        """
+        Yields (index, chunk) from `start` onwards as chunks arrive, until the generation
+        finishes. Yields (None, None) as a heartbeat while waiting for a slow chunk.
+        """
+        index = start
+        while True:
+            with buffer.condition:
+                if index >= len(buffer.chunks) and not buffer.done:
+                    buffer.condition.wait(timeout=HEARTBEAT_SECONDS)
+                available = buffer.chunks[index:]
+                done = buffer.done
+            if not available and not done:
+                yield None, None
+                continue
+            for chunk in available:
+                yield index, chunk
+                index += 1
+            if done and index >= len(buffer.chunks):
+                return
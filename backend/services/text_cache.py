@@ -0,0 +1,133 @@
+import hashlib
+from array import array
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+TEXT_CACHE_FOLDER = 'text_cache'
+TEXT_CACHE_DB = 'text_cache.db'
+DEFAULT_MAX_BYTES = int(os.getenv("TEXT_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+
+def file_digest(filepath, chunk_size=1024 * 1024):
+    sha = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class TextCache:
+    """
+    Content-addressed cache of extracted document text, page by page.
+
+    Each document is stored as its zlib-compressed joined text plus the
+    character offset of every page, in SQLite, keyed by the SHA-256 of the
+    source file, so identical uploads share one entry and an overwritten file
+    simply misses. A per-path (mtime, size) record lets unchanged files skip
+    rehashing. Total compressed size is capped; least recently used entries
+    are evicted first.
+    """
+
+    def __init__(self, cache_folder=TEXT_CACHE_FOLDER, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_folder = cache_folder
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        if not os.path.exists(cache_folder):
+            os.makedirs(cache_folder)
+        self.conn = sqlite3.connect(os.path.join(cache_folder, TEXT_CACHE_DB), check_same_thread=False)
+        with self.conn:
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(texts)")]
+            if columns and 'page_offsets' not in columns:
+                # Entries from before page offsets were tracked; it is only a cache, so start over
+                self.conn.execute("DROP TABLE texts")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS texts ("
+                "digest TEXT PRIMARY KEY, body BLOB NOT NULL, page_offsets BLOB NOT NULL, "
+                "nbytes INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS texts_last_access ON texts (last_access)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, mtime REAL NOT NULL, size INTEGER NOT NULL, digest TEXT NOT NULL)"
+            )
+
+    def _digest_for(self, filepath):
+        """Returns the file's content hash, reusing the stored one when mtime and size are unchanged."""
+        stat = os.stat(filepath)
+        path = os.path.abspath(filepath)
+        with self.lock:
+            row = self.conn.execute("SELECT mtime, size, digest FROM files WHERE path = ?", (path,)).fetchone()
+        if row and row[0] == stat.st_mtime and row[1] == stat.st_size:
+            return row[2]
+
+        digest = file_digest(filepath)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files (path, mtime, size, digest) VALUES (?, ?, ?, ?)",
+                (path, stat.st_mtime, stat.st_size, digest),
+            )
+        return digest
+
+    def invalidate(self, filepath):
+        """Forgets the stored hash for `filepath` so its next read rehashes the file."""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM files WHERE path = ?", (os.path.abspath(filepath),))
+
+    def get(self, digest):
+        """Returns the cached list of page texts, or None."""
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT body, page_offsets FROM texts WHERE digest = ?", (digest,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE texts SET last_access = ? WHERE digest = ?", (time.time(), digest))
+        text = zlib.decompress(row[0]).decode('utf-8')
+        offsets = array('q')
+        offsets.frombytes(row[1])
+        bounds = list(offsets) + [len(text)]
+        return [text[bounds[i]:bounds[i + 1]] for i in range(len(offsets))]
+
+    def put(self, digest, pages):
+        body = zlib.compress("".join(pages).encode('utf-8'))
+        offsets = array('q')
+        position = 0
+        for page in pages:
+            offsets.append(position)
+            position += len(page)
+        offsets = offsets.tobytes()
+        nbytes = len(body) + len(offsets)
+        if nbytes > self.max_bytes:
+            return
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO texts (digest, body, page_offsets, nbytes, last_access) VALUES (?, ?, ?, ?, ?)",
+                (digest, body, offsets, nbytes, time.time()),
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM texts").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for digest, nbytes in self.conn.execute("SELECT digest, nbytes FROM texts ORDER BY last_access").fetchall():
+            self.conn.execute("DELETE FROM texts WHERE digest = ?", (digest,))
+            total -= nbytes
+            if total <= self.max_bytes:
+                break
+        self.conn.execute("DELETE FROM files WHERE digest NOT IN (SELECT digest FROM texts)")
+
+    def lookup(self, filepath):
+        """Returns the cached pages for `filepath` without extracting anything on a miss."""
+        return self.get(self._digest_for(filepath))
+
+    def get_or_extract(self, filepath, extract):
+        """Returns the cached pages for `filepath`, calling `extract(filepath)` and caching the result on a miss."""
+        digest = self._digest_for(filepath)
+        pages = self.get(digest)
+        if pages is None:
+            pages = extract(filepath)
+            if pages is not None:
+                self.put(digest, pages)
+        return pages
@@ -0,0 +1,36 @@
+import re
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+_WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Counts prompt tokens locally. Uses tiktoken when it is installed; otherwise
+    estimates from words and punctuation, with long words counted as several
+    sub-word tokens the way BPE tokenizers split them.
+    """
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return sum(1 + len(word) // 6 for word in _WORD_PATTERN.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts `text` down to roughly `max_tokens` tokens."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text, disallowed_special=())[:max_tokens])
+    kept = 0
+    for match in _WORD_PATTERN.finditer(text):
+        kept += 1 + len(match.group()) // 6
+        if kept > max_tokens:
+            return text[:match.start()]
+    return text
@@ -0,0 +1,156 @@
+import threading
+import time
+from concurrent.futures import Future
+
+
+def normalize_topic(topic):
+    """Cache key for a topic: case and spacing don't matter."""
+    return " ".join(str(topic).lower().split())
+
+
+class TopicCache:
+    """
+    In-memory cache of slow lookups keyed by topic, with stale-while-revalidate.
+
+    A value younger than `ttl` is served as is. An older one is still served
+    immediately for up to `stale_ttl` more seconds while one background thread
+    fetches a fresh copy. A miss loads in the caller's thread, and concurrent
+    misses for the same key wait for that one load instead of starting their own.
+    Empty results are not stored, so a failed upstream call is retried next time.
+    At most `max_entries` keys are kept.
+
+    With a `shared` store (get(key) -> (value, fetched_at) or None, put(key, value,
+    fetched_at)), every load is also written there, and a missing or expired entry
+    is first looked up there, so a value fetched by another process is reused.
+    """
+
+    def __init__(self, ttl, stale_ttl, max_entries, shared=None):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.shared = shared
+        self.entries = {}  # key -> (value, fetched_at)
+        self.loading = {}  # key -> Future of the load in progress
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.collapsed = 0
+        self.refreshes = 0
+
+    def get(self, key, loader):
+        """The cached value for `key`, calling `loader()` to fill or refresh it."""
+        now = time.time()
+        owner = False
+        if self.shared is not None:
+            with self.lock:
+                entry = self.entries.get(key)
+            if (entry is None or now - entry[1] >= self.ttl) and self._adopt(key, entry):
+                with self.lock:
+                    self.shared_hits += 1
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, fetched_at = entry
+                age = now - fetched_at
+                if age < self.ttl:
+                    self.hits += 1
+                    return value
+                if age < self.ttl + self.stale_ttl:
+                    self.stale_hits += 1
+                    self._refresh_locked(key, loader)
+                    return value
+            future = self.loading.get(key)
+            if future is not None:
+                self.collapsed += 1
+            else:
+                self.misses += 1
+                future = self.loading[key] = Future()
+                owner = True
+        if not owner:
+            return future.result()
+        return self._load(key, loader, future)
+
+    def _adopt(self, key, entry):
+        """Takes the shared copy of `key` if it is newer than `entry` (ours). Returns True if it was taken."""
+        try:
+            stored = self.shared.get(key)
+        except Exception as e:
+            print(f"Topic cache shared lookup failed for '{key}': {e}")
+            return False
+        if stored is None or (entry is not None and stored[1] <= entry[1]):
+            return False
+        with self.lock:
+            current = self.entries.get(key)
+            if current is not None and stored[1] <= current[1]:
+                return False
+            self.entries[key] = stored
+            self._trim()
+        return True
+
+    def _trim(self):
+        if len(self.entries) > self.max_entries:
+            # Topics come from the query string; forget the least recently fetched
+            del self.entries[min(self.entries, key=lambda k: self.entries[k][1])]
+
+    def refresh(self, key, loader):
+        """Starts a background reload of `key` unless one is already running."""
+        with self.lock:
+            return self._refresh_locked(key, loader)
+
+    def _refresh_locked(self, key, loader):
+        if key in self.loading:
+            return False
+        future = self.loading[key] = Future()
+        self.refreshes += 1
+        threading.Thread(target=self._load, args=(key, loader, future), daemon=True).start()
+        return True
+
+    def _load(self, key, loader, future):
+        try:
+            value = loader()
+        except Exception as e:
+            print(f"Topic cache load failed for '{key}': {e}")
+            value = None
+        fetched_at = time.time()
+        if value and self.shared is not None:
+            try:
+                self.shared.put(key, value, fetched_at)
+            except Exception as e:
+                print(f"Topic cache shared store failed for '{key}': {e}")
+        with self.lock:
+            if value:
+                self.entries[key] = (value, fetched_at)
+                self._trim()
+            else:
+                # Keep serving what we had, if anything
+                value = self.entries.get(key, (value, None))[0]
+            del self.loading[key]
+        future.set_result(value)
+        return value
+
+    def expires_in(self, key):
+        """Seconds until `key` goes stale (negative once it has), or None if it isn't cached here or in `shared`."""
+        with self.lock:
+            entry = self.entries.get(key)
+        if self.shared is not None:
+            self._adopt(key, entry)
+            with self.lock:
+                entry = self.entries.get(key)
+        return None if entry is None else entry[1] + self.ttl - time.time()
+
+    def stats(self):
+        with self.lock:
+            entries = len(self.entries)
+            loading = len(self.loading)
+        return {
+            "entries": entries,
+            "loading": loading,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "collapsed": self.collapsed,
+            "refreshes": self.refreshes,
+        }
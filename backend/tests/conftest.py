@@ -0,0 +1,20 @@
+"""
+Shared test setup. Run from backend/: `python -m pytest tests`.
+
+Importing the services package creates its stores (rooms/, llm_cache/,
+search_cache/, text_cache/, ...) relative to the working directory, so the
+tests run from a scratch directory instead of backend/.
+"""
+import importlib
+import os
+import sys
+import tempfile
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+os.chdir(tempfile.mkdtemp(prefix="backend-tests-"))
+
+
+def service_module(name):
+    """`services.<name>` the module; the package attribute of the same name is the singleton."""
+    return importlib.import_module(f"services.{name}")
@@ -0,0 +1,109 @@
+import pytest
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+
+from conftest import service_module
+from controllers import main_controller
+from models import db, Conversation, User
+
+conversation_service = service_module("conversation_service")
+TurnConflict = conversation_service.TurnConflict
+
+
+class FakeHistory:
+    def __init__(self):
+        self.logged = []
+
+    def log(self, *args, **kwargs):
+        self.logged.append((args, kwargs))
+
+
+def chat(*contents):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": c} for i, c in enumerate(contents)]
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'chats.db'}"
+    app.config["JWT_SECRET_KEY"] = "test-secret-key-long-enough-for-hs256-signing"
+    db.init_app(app)
+    JWTManager(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([User(id=1, username="a", email="a@x", password_hash="-"),
+                            User(id=2, username="b", email="b@x", password_hash="-")])
+        db.session.commit()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def service(app):
+    return conversation_service.ConversationService(FakeHistory())
+
+
+def stored(service, conversation_id):
+    return [turn["content"] for turn in service.turns(conversation_id)]
+
+
+def test_new_conversation_is_logged_once(service):
+    conversation = service.append(1, None, chat("hi", "hello"))
+    assert conversation.turn_count == 2
+    assert conversation.title == "hi"
+    assert stored(service, conversation.id) == ["hi", "hello"]
+    service.append(1, conversation.id, chat("hi", "hello", "more", "sure"), offset=0)
+    assert len(service.history_logger.logged) == 1
+
+
+def test_retried_and_overlapping_saves_append_only_new_turns(service):
+    conversation = service.append(1, None, chat("a", "b"))
+    assert service.append(1, conversation.id, chat("a", "b"), offset=0).turn_count == 2
+    assert service.append(1, conversation.id, chat("a", "b", "c", "d"), offset=0).turn_count == 4
+    # Only the tail, starting at the client's last known position
+    assert service.append(1, conversation.id, [{"role": "user", "content": "e"}], offset=4).turn_count == 5
+    assert stored(service, conversation.id) == ["a", "b", "c", "d", "e"]
+    assert service.turns(conversation.id, after=3, limit=1) == [{"role": "assistant", "content": "d"}]
+
+
+def test_offset_past_the_end_is_a_conflict(service):
+    conversation = service.append(1, None, chat("a", "b"))
+    with pytest.raises(TurnConflict) as raised:
+        service.append(1, conversation.id, chat("x"), offset=3)
+    assert raised.value.turn_count == 2
+    assert stored(service, conversation.id) == ["a", "b"]
+
+
+def test_concurrent_save_loses_the_compare_and_set(service):
+    conversation = service.append(1, None, chat("a", "b"))
+    db.session.get(Conversation, conversation.id)  # This worker's view: 2 turns
+    with db.engine.begin() as other_worker:
+        other_worker.execute(Conversation.__table__.update().values(turn_count=3))
+    with pytest.raises(TurnConflict) as raised:
+        service.append(1, conversation.id, chat("c"), offset=2)
+    assert raised.value.turn_count == 3
+
+
+def test_other_users_conversation_is_not_found(service):
+    conversation = service.append(1, None, chat("a", "b"))
+    with pytest.raises(LookupError):
+        service.append(2, conversation.id, chat("a", "b", "c"), offset=0)
+    assert service.get(2, conversation.id) is None
+
+
+def test_save_chat_route_reports_bad_offsets_and_conflicts(app, monkeypatch):
+    monkeypatch.setattr(main_controller, "conversation_service",
+                        conversation_service.ConversationService(FakeHistory()))
+    app.register_blueprint(main_controller.main_bp, url_prefix="/api")
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {create_access_token(identity='1')}"}
+
+    saved = client.post("/api/save-chat", json={"messages": chat("a", "b")}, headers=headers).get_json()
+    for offset in ("two", -1):
+        response = client.post("/api/save-chat", headers=headers, json={
+            "conversation_id": saved["conversation_id"], "offset": offset, "messages": chat("c")})
+        assert response.status_code == 400
+    response = client.post("/api/save-chat", headers=headers, json={
+        "conversation_id": saved["conversation_id"], "offset": 5, "messages": chat("c")})
+    assert response.status_code == 409
+    assert response.get_json()["turn_count"] == 2
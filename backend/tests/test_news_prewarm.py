@@ -0,0 +1,69 @@
+import os
+import time
+
+from conftest import service_module
+
+news = service_module("news_service")
+news_store = service_module("news_store")
+
+
+class FakeSearch:
+    available = True
+
+    def __init__(self):
+        self.calls = 0
+
+    def search(self, query, **options):
+        self.calls += 1
+        return {"results": [{"url": f"https://example.org/{self.calls}/{i}", "title": query, "content": "x"}
+                            for i in range(4)]}
+
+
+def make_worker(tmp_path):
+    search = FakeSearch()
+    store = news_store.NewsStore(str(tmp_path / "news.db"))
+    return news.NewsService(search=search, store=store), search
+
+
+def test_non_leader_serves_page_warmed_by_leader(tmp_path):
+    leader, leader_search = make_worker(tmp_path)
+    follower, follower_search = make_worker(tmp_path)
+    lock_path = str(tmp_path / "prewarm.lock")
+
+    # Requests through the follower count towards the shared popularity ranking
+    follower._track("news", "Quantum Computing")
+    assert leader._is_prewarm_leader(lock_path)
+    assert not follower._is_prewarm_leader(lock_path)
+
+    leader.prewarm(interval=60)
+    key = "news:quantum computing"
+    leader.cache.loading.get(key).result(timeout=5)
+
+    page = follower.get_latest_news("Quantum Computing")
+    assert page and page[0]["title"] == "Quantum Computing"
+    assert follower_search.calls == 0
+    assert follower.cache.stats()["shared_hits"] == 1
+    assert leader_search.calls > 0
+
+
+def test_follower_adopts_leaders_refresh_of_expired_page(tmp_path):
+    leader, _ = make_worker(tmp_path)
+    follower, follower_search = make_worker(tmp_path)
+    key = "conferences:robotics"
+    old = [{"title": "old"}]
+    follower.cache.entries[key] = (old, 0.0)  # Long expired locally
+    leader.store.put(key, [{"title": "new"}], fetched_at=time.time())
+
+    assert follower.get_conferences("Robotics") == [{"title": "new"}]
+    assert follower_search.calls == 0
+
+
+def test_popularity_is_shared(tmp_path):
+    a, _ = make_worker(tmp_path)
+    b, _ = make_worker(tmp_path)
+    for _ in range(3):
+        a._track("news", "Genomics")
+    b._track("news", "Genomics")
+    b._track("conferences", "Robotics")
+    assert b.popular_topics(1) == [("news:genomics", "news", "Genomics")]
+    assert os.path.exists(tmp_path / "news.db")
@@ -0,0 +1,111 @@
+"""
+Runs the account and history paths against a throwaway PostgreSQL server
+(pgserver), the database used when several workers share one DATABASE_URL.
+Skipped when pgserver is not installed.
+"""
+import importlib
+import os
+
+import pytest
+
+from conftest import service_module
+
+pgserver = pytest.importorskip("pgserver")
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    srv = pgserver.get_server(tmp_path_factory.mktemp("pgdata"), cleanup_mode="delete")
+    yield srv
+    srv.cleanup()
+
+
+@pytest.fixture(scope="module")
+def app(server):
+    # The app reads DATABASE_URL when it is first imported
+    os.environ["DATABASE_URL"] = server.get_uri()
+    module = importlib.import_module("app")
+    from models import db
+    with module.app.app_context():
+        assert db.engine.dialect.name == "postgresql"
+    yield module.app
+    importlib.import_module("services").history_logger.close()
+    with module.app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture(scope="module")
+def client(app):
+    return app.test_client()
+
+
+def register(client, name):
+    email = f"{name}@example.org"
+    response = client.post("/api/auth/register", json={"username": name, "email": email, "password": "secret"})
+    assert response.status_code == 201
+    response = client.post("/api/auth/login", json={"email": email, "password": "secret"})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.get_json()['access_token']}"}
+
+
+def user_id(client, headers):
+    response = client.get("/api/auth/me", headers=headers)
+    assert response.status_code == 200
+    return response.get_json()["id"]
+
+
+def flush(app, events):
+    """Writes `events` ((user_id, action, item_name, content) tuples) as one batch."""
+    logger = service_module("history_logger").HistoryLogger()
+    logger.app = app
+    for event in events:
+        logger.log(*event)
+    logger._write(logger._drain())
+    return logger
+
+
+def test_me_looks_up_the_token_identity(client):
+    headers = register(client, "ada")
+    assert isinstance(user_id(client, headers), int)
+    assert client.get("/api/auth/me").status_code == 401
+
+
+def test_dashboard_lists_history_and_counts(app, client):
+    headers = register(client, "grace")
+    uid = user_id(client, headers)
+    long_name = "x" * 500  # Longer than the item_name column; PostgreSQL rejects it untruncated
+    body = "summary text " * 400  # Stored as a blob
+    logger = flush(app, [
+        (uid, "Summarized", long_name, body),
+        (uid, "Summarized", "short", "small"),
+        (uid, "Chat", "question", None),
+    ])
+    assert logger.written == 3 and logger.failed == 0
+
+    response = client.get("/api/dashboard", headers=headers)
+    assert response.status_code == 200
+    data = response.get_json()
+    summaries = next(s for s in data["stats"] if s["label"] == "Summaries Generated")
+    assert summaries["value"] == "2"
+    items = {item["item"][:5]: item for item in data["recent_activity"]}
+    truncated = items["xxxxx"]
+    assert len(truncated["item"]) == 200
+    assert truncated["content"] is None and truncated["content_size"] == len(body)
+
+    response = client.get(f"/api/history/{truncated['id']}", headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()["content"] == body
+
+
+def test_failed_batch_is_split_so_only_the_bad_row_is_lost(app, client):
+    headers = register(client, "linus")
+    uid = user_id(client, headers)
+    logger = flush(app, [
+        (uid, "Chat", "before", None),
+        (10 ** 9, "Chat", "no such user", None),  # Foreign key violation
+        (uid, "Chat", "after", None),
+    ])
+    assert logger.written == 2 and logger.failed == 1
+
+    items = [item["item"] for item in client.get("/api/dashboard", headers=headers).get_json()["recent_activity"]]
+    assert sorted(items) == ["after", "before"]
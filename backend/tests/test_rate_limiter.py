@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from conftest import service_module
+
+rate_limiter = service_module("rate_limiter")
+GroqScheduler = rate_limiter.GroqScheduler
+RateLimitExceeded = rate_limiter.RateLimitExceeded
+INTERACTIVE = rate_limiter.PRIORITY_INTERACTIVE
+STANDARD = rate_limiter.PRIORITY_STANDARD
+BATCH = rate_limiter.PRIORITY_BATCH
+
+
+@pytest.fixture(autouse=True)
+def short_waits(monkeypatch):
+    monkeypatch.setitem(rate_limiter.MAX_WAIT_SECONDS, INTERACTIVE, 1.0)
+    monkeypatch.setitem(rate_limiter.MAX_WAIT_SECONDS, STANDARD, 0.4)
+    monkeypatch.setitem(rate_limiter.MAX_WAIT_SECONDS, BATCH, 0.1)
+
+
+def drained(tpm=60000, **options):
+    """A scheduler whose token budget is spent; it refills at tpm / 60 tokens a second."""
+    scheduler = GroqScheduler(rpm=600, tpm=tpm, **options)
+    scheduler.tokens.level = 0
+    return scheduler
+
+
+def queued_in_background(scheduler, tokens, priority):
+    thread = threading.Thread(target=scheduler.acquire, args=(tokens, priority))
+    thread.start()
+    deadline = time.monotonic() + 2
+    while scheduler.stats()["queued"] == 0 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return thread
+
+
+def test_admits_within_budget():
+    scheduler = GroqScheduler(rpm=60, tpm=1000)
+    scheduler.acquire(400)
+    assert scheduler.stats()["tokens_available"] == 600
+    assert scheduler.stats()["shed"] == 0
+
+
+def test_sheds_up_front_when_the_wait_exceeds_the_priority_limit():
+    scheduler = drained()
+    started = time.monotonic()
+    with pytest.raises(RateLimitExceeded) as raised:
+        scheduler.acquire(200, BATCH)  # 0.2s away; batch calls may wait 0.1s
+    assert time.monotonic() - started < 0.05
+    assert raised.value.retry_after == 1
+    assert scheduler.stats()["shed"] == 1
+
+
+def test_interactive_call_waits_where_batch_is_shed():
+    scheduler = drained()
+    with pytest.raises(RateLimitExceeded):
+        scheduler.acquire(200, BATCH)
+    started = time.monotonic()
+    scheduler.acquire(200, INTERACTIVE)
+    assert 0.15 < time.monotonic() - started < 0.8
+
+
+def test_budget_of_calls_queued_ahead_counts_towards_the_wait():
+    scheduler = drained()
+    ahead = queued_in_background(scheduler, 500, INTERACTIVE)
+    # Alone this call would wait 0.1s; behind the queued one it would wait 0.6s
+    with pytest.raises(RateLimitExceeded):
+        scheduler.acquire(100, STANDARD)
+    ahead.join()
+    assert scheduler.stats()["shed"] == 1
+
+
+def test_sheds_when_the_queue_is_full():
+    scheduler = drained(max_queue=1)
+    ahead = queued_in_background(scheduler, 100, INTERACTIVE)
+    with pytest.raises(RateLimitExceeded):
+        scheduler.acquire(1, INTERACTIVE)
+    ahead.join()
+
+
+def test_server_reported_reset_blocks_admission():
+    scheduler = GroqScheduler(rpm=600, tpm=60000)
+    scheduler.update_from_headers({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "2m5s"})
+    with pytest.raises(RateLimitExceeded) as raised:
+        scheduler.acquire(10, INTERACTIVE)
+    assert raised.value.retry_after == 125
+
+
+def test_async_callers_are_shed_and_admitted_the_same_way():
+    scheduler = drained()
+
+    async def run():
+        with pytest.raises(RateLimitExceeded):
+            await scheduler.acquire_async(200, BATCH)
+        await scheduler.acquire_async(200, INTERACTIVE)
+
+    asyncio.run(run())
+    assert scheduler.stats()["shed"] == 1
+    assert scheduler.stats()["queued"] == 0
@@ -0,0 +1,75 @@
+import threading
+from datetime import datetime
+
+from conftest import service_module
+
+room_store = service_module("room_store")
+
+
+def open_stores(tmp_path, n):
+    """`n` stores on one database, each with its own connection, like n worker processes."""
+    path = str(tmp_path / "rooms.db")
+    return [room_store.SQLiteRoomStore(path, log_folder=str(tmp_path / "logs")) for _ in range(n)]
+
+
+def ids(messages):
+    return [m["id"] for m in messages]
+
+
+def test_ids_are_sequential_across_connections(tmp_path):
+    first, second = open_stores(tmp_path, 2)
+    first.create_room("r", "Room", "2026-01-01 00:00:00")
+    for i in range(6):
+        store = first if i % 2 else second
+        assert store.append_message("r", {"user": "u", "content": str(i)})["id"] == i + 1
+    assert ids(first.read_messages("r")) == ids(second.read_messages("r")) == [1, 2, 3, 4, 5, 6]
+    assert [m["content"] for m in second.read_messages("r", after=4)] == ["4", "5"]
+    assert first.message_count("r") == second.message_count("r") == 6
+
+
+def test_concurrent_writers_never_share_or_skip_an_id(tmp_path):
+    stores = open_stores(tmp_path, 4)
+    stores[0].create_room("r", "Room", "2026-01-01 00:00:00")
+    assigned = [[] for _ in stores]
+
+    def write(n):
+        for i in range(25):
+            assigned[n].append(stores[n].append_message("r", {"user": str(n), "content": str(i)})["id"])
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(len(stores))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(i for writer in assigned for i in writer) == list(range(1, 101))
+    messages = stores[1].read_messages("r")
+    assert ids(messages) == list(range(1, 101))
+    for n, writer in enumerate(assigned):
+        # Each writer's messages appear in the order it sent them
+        assert writer == sorted(writer)
+        assert [m["content"] for m in messages if m["user"] == str(n)] == [str(i) for i in range(25)]
+
+
+def test_changes_since_reports_only_other_connections_messages(tmp_path):
+    writer, watcher = open_stores(tmp_path, 2)
+    writer.create_room("r", "Room", "2026-01-01 00:00:00")
+    cursor = watcher.change_cursor()
+    writer.append_message("r", {"user": "a", "content": "1"})
+    watcher.append_message("r", {"user": "b", "content": "2"})  # Published by the watcher's own process
+    writer.append_message("r", {"user": "a", "content": "3"})
+
+    cursor, changes = watcher.changes_since(cursor)
+    assert [(room, m["id"], m["content"]) for room, m in changes] == [("r", 1, "1"), ("r", 3, "3")]
+    cursor, changes = watcher.changes_since(cursor)
+    assert changes == []
+
+
+def test_unknown_room_and_since_lookup(tmp_path):
+    (store,) = open_stores(tmp_path, 1)
+    assert store.append_message("missing", {"user": "u", "content": "x"}) is None
+    store.create_room("r", "Room", "2026-01-01 00:00:00")
+    for minute in range(3):
+        store.append_message("r", {"user": "u", "content": str(minute), "timestamp": f"2026-01-01 10:0{minute}:00"})
+    assert store.last_id_before("r", datetime(2026, 1, 1, 10, 1, 30)) == 2
+    assert store.last_id_before("r", datetime(2026, 1, 1, 9, 0)) == 0
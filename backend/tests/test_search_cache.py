@@ -0,0 +1,87 @@
+import pytest
+
+from conftest import service_module
+
+search_cache = service_module("search_cache")
+response_cache = service_module("response_cache")
+
+TTLS = {"news": 900, "trends": 24 * 3600}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(search_cache, "time", clock)
+    monkeypatch.setattr(response_cache, "time", clock)
+    return clock
+
+
+def make_cache(tmp_path, **options):
+    return search_cache.SearchCache(str(tmp_path / "results.db"), ttls=TTLS, default_ttl=3600, **options)
+
+
+def test_each_feature_applies_its_own_ttl(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    key = cache.key("quantum computing", {"topic": "news"})
+    cache.put(key, {"results": ["r"]})
+
+    clock.now += 1000
+    assert cache.get(key, "news") is None  # 15 minutes
+    assert cache.get(key, "trends") == {"results": ["r"]}
+    assert cache.get(key, "journal_match") == {"results": ["r"]}  # Unlisted: default_ttl
+
+    clock.now += 3000
+    assert cache.get(key, "journal_match") is None
+    assert cache.get(key, "trends") == {"results": ["r"]}
+
+    clock.now += 24 * 3600
+    assert cache.get(key, "trends") is None
+    features = cache.stats()["features"]
+    assert features["news"]["misses"] == 1
+    assert features["trends"]["memory_hits"] == 2 and features["trends"]["misses"] == 1
+
+
+def test_results_are_shared_through_disk(tmp_path, clock):
+    first = make_cache(tmp_path)
+    key = first.key("graph networks", {})
+    first.put(key, {"results": ["g"]})
+
+    second = make_cache(tmp_path)  # Another worker, or this one after a restart
+    clock.now += 60
+    assert second.get(key, "news") == {"results": ["g"]}
+    assert second.get(key, "news") == {"results": ["g"]}
+    assert second.stats()["features"]["news"] == {"memory_hits": 1, "disk_hits": 1, "misses": 0}
+
+    clock.now += 900
+    assert second.get(key, "news") is None  # The disk copy's age counts from the first put
+
+
+def test_keys_ignore_case_and_spacing_but_not_options(tmp_path, clock):
+    cache = make_cache(tmp_path)
+    assert cache.key("  Quantum   Computing ", {"topic": "news"}) == cache.key("quantum computing", {"topic": "news"})
+    assert cache.key("quantum computing", {"topic": "news"}) != cache.key("quantum computing", {"topic": "general"})
+
+
+def test_memory_keeps_only_the_most_recent_entries(tmp_path, clock):
+    cache = make_cache(tmp_path, memory_entries=2)
+    keys = [cache.key(q, {}) for q in ("a", "b", "c")]
+    for key in keys:
+        cache.put(key, {"results": [key]})
+    assert list(cache.memory) == keys[1:]
+    assert cache.get(keys[0], "news") == {"results": [keys[0]]}  # Still on disk
+    assert cache.stats()["features"]["news"]["disk_hits"] == 1
+
+
+def test_feature_ttls_can_be_overridden_from_the_environment(monkeypatch):
+    monkeypatch.setenv("SEARCH_TTL_FUNDING", "60")
+    ttls = search_cache.feature_ttls()
+    assert ttls["funding"] == 60
+    assert ttls["visual"] == search_cache.DEFAULT_FEATURE_TTLS["visual"]
@@ -0,0 +1,99 @@
+import os
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+from conftest import service_module
+
+search_index = service_module("search_index")
+
+DOCS = {
+    "attention.pdf": "transformer attention heads model long range dependencies in text",
+    "graphs.pdf": "graph neural networks pass messages between neighbouring nodes",
+    "retrieval.pdf": "retrieval augmented generation grounds a language model in documents",
+    "vision.pdf": "convolutional networks learn visual features from image pixels",
+}
+
+
+def logged(index):
+    return index.conn.execute("SELECT COUNT(*) FROM changes").fetchone()[0]
+
+
+def names(index):
+    return sorted(doc["name"] for doc in index.documents)
+
+
+def test_scores_match_a_full_refit(tmp_path):
+    index = search_index.TfidfIndex(str(tmp_path))
+    for name, text in DOCS.items():
+        index.add_document(name, text)
+    index.remove_document("graphs.pdf")
+    index.add_document("graphs.pdf", DOCS["graphs.pdf"] + " and edges")
+
+    texts = [DOCS[doc["name"]] + (" and edges" if doc["name"] == "graphs.pdf" else "") for doc in index.documents]
+    vectorizer = TfidfVectorizer(stop_words="english", ngram_range=(1, 2))
+    expected = cosine_similarity(vectorizer.fit_transform(texts), vectorizer.transform(["attention model"])).ravel()
+    assert np.allclose(index.query("attention model"), expected)
+
+
+def test_changes_are_replayed_by_other_workers(tmp_path):
+    first = search_index.TfidfIndex(str(tmp_path))
+    second = search_index.TfidfIndex(str(tmp_path))
+    first.add_documents([(name, text, {}) for name, text in DOCS.items()])
+
+    assert second.refresh()
+    assert names(second) == sorted(DOCS)
+    second.remove_document("vision.pdf")
+
+    assert first.refresh()
+    assert "vision.pdf" not in first
+    assert np.allclose(first.query("language model documents"), second.query("language model documents"))
+    assert not first.refresh()  # Nothing new since
+
+
+def test_writer_catches_up_before_logging(tmp_path):
+    first = search_index.TfidfIndex(str(tmp_path))
+    second = search_index.TfidfIndex(str(tmp_path))
+    first.add_document("attention.pdf", DOCS["attention.pdf"])
+    # `second` has not refreshed; its write must not lose the other worker's document
+    second.add_document("graphs.pdf", DOCS["graphs.pdf"])
+    assert names(second) == ["attention.pdf", "graphs.pdf"]
+    first.refresh()
+    assert names(first) == ["attention.pdf", "graphs.pdf"]
+
+
+def test_compaction_folds_the_log_into_a_snapshot(tmp_path):
+    folder = str(tmp_path)
+    writer = search_index.TfidfIndex(folder, compact_after=3)
+    lagging = search_index.TfidfIndex(folder, compact_after=3)
+    writer.add_document("attention.pdf", DOCS["attention.pdf"])
+    writer.add_document("graphs.pdf", DOCS["graphs.pdf"])
+    assert logged(writer) == 2
+    assert not os.path.exists(os.path.join(folder, search_index.SNAPSHOT_FILE))
+
+    writer.add_document("retrieval.pdf", DOCS["retrieval.pdf"])
+    assert logged(writer) == 0
+    assert os.path.exists(os.path.join(folder, search_index.SNAPSHOT_FILE))
+    writer.add_document("vision.pdf", DOCS["vision.pdf"])
+    assert logged(writer) == 1
+
+    # A worker that missed the compacted changes reloads the snapshot, then replays the rest
+    assert lagging.refresh()
+    assert names(lagging) == sorted(DOCS)
+    fresh = search_index.TfidfIndex(folder)
+    assert names(fresh) == sorted(DOCS)
+    assert fresh.seq == writer.seq
+    assert np.allclose(fresh.query("visual features"), writer.query("visual features"))
+
+
+def test_failed_write_block_logs_nothing(tmp_path):
+    index = search_index.TfidfIndex(str(tmp_path))
+    index.add_document("attention.pdf", DOCS["attention.pdf"])
+    with pytest.raises(RuntimeError):
+        with index.writing():
+            index.add_document("graphs.pdf", DOCS["graphs.pdf"])
+            raise RuntimeError("extraction failed")
+    assert names(index) == ["attention.pdf"]
+    assert names(search_index.TfidfIndex(str(tmp_path))) == ["attention.pdf"]
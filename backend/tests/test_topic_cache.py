@@ -0,0 +1,116 @@
+import threading
+import time
+
+from conftest import service_module
+
+topic_cache = service_module("topic_cache")
+
+
+class Loader:
+    """Returns `value` and counts calls; with `gate` set, each call waits until the gate opens."""
+
+    def __init__(self, value, gate=None):
+        self.value = value
+        self.gate = gate
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.gate is not None:
+            assert self.gate.wait(timeout=5)
+        return self.value
+
+
+def make_cache(max_entries=10):
+    return topic_cache.TopicCache(ttl=60, stale_ttl=600, max_entries=max_entries)
+
+
+def age(cache, key, seconds):
+    value, _ = cache.entries[key]
+    cache.entries[key] = (value, time.time() - seconds)
+
+
+def settle(cache, key):
+    future = cache.loading.get(key)
+    if future is not None:
+        future.result(timeout=5)
+
+
+def test_fresh_value_is_served_from_memory():
+    cache = make_cache()
+    loader = Loader(["page"])
+    assert cache.get("ai", loader) == ["page"]
+    assert cache.get("ai", loader) == ["page"]
+    assert loader.calls == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_stale_value_is_served_while_one_refresh_runs():
+    cache = make_cache()
+    cache.get("ai", Loader(["old"]))
+    age(cache, "ai", 120)
+    gate = threading.Event()
+    refresh = Loader(["new"], gate)
+
+    started = time.monotonic()
+    assert cache.get("ai", refresh) == ["old"]
+    assert cache.get("ai", refresh) == ["old"]
+    assert time.monotonic() - started < 0.5  # Neither caller waited for the upstream fetch
+    gate.set()
+    settle(cache, "ai")
+
+    assert refresh.calls == 1
+    assert cache.get("ai", refresh) == ["new"]
+    assert cache.stats()["stale_hits"] == 2 and cache.stats()["refreshes"] == 1
+
+
+def test_value_past_the_stale_window_is_reloaded_in_the_caller():
+    cache = make_cache()
+    cache.get("ai", Loader(["old"]))
+    age(cache, "ai", 60 + 600 + 1)
+    assert cache.get("ai", Loader(["new"])) == ["new"]
+
+
+def test_concurrent_misses_share_one_load():
+    cache = make_cache()
+    gate = threading.Event()
+    loader = Loader(["page"], gate)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("ai", loader))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while cache.stats()["collapsed"] < 4 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    gate.set()
+    for thread in threads:
+        thread.join()
+
+    assert loader.calls == 1
+    assert results == [["page"]] * 5
+
+
+def test_empty_results_are_not_cached_and_failed_refreshes_keep_the_old_value():
+    cache = make_cache()
+    empty = Loader([])
+    assert cache.get("ai", empty) == []
+    assert cache.get("ai", empty) == []
+    assert empty.calls == 2
+
+    cache.get("ai", Loader(["old"]))
+    age(cache, "ai", 120)
+
+    def failing():
+        raise RuntimeError("upstream down")
+
+    assert cache.get("ai", failing) == ["old"]
+    settle(cache, "ai")
+    assert cache.entries["ai"][0] == ["old"]
+
+
+def test_least_recently_fetched_topic_is_dropped():
+    cache = make_cache(max_entries=2)
+    for topic in ("a", "b", "c"):
+        cache.get(topic, Loader([topic]))
+        time.sleep(0.01)
+    assert sorted(cache.entries) == ["b", "c"]
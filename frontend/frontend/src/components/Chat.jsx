@@ -1,10 +1,11 @@
 import { useState, useRef, useEffect } from 'react';
 import { useNavigate, useLocation } from 'react-router-dom';
 import {
-    askQuestion, uploadPaper, getDashboardData, visualizePaper, deepWebResearch,
+    askQuestion, uploadPaper, waitForExtraction, getDashboardData, visualizePaper, deepWebResearch,
     getKnowledgeGraph, getPapers, getPaperContent, summarizePaper, matchJournals,
     getResearchTrends, scoutFunding, checkIEEEFormat, draftAcademicSection,
-    synthesizePapers, createRoom, getRoom, addRoomMessage, saveChatHistory
+    synthesizePapers, createRoom, getRoom, addRoomMessage, saveChatHistory, getHistoryItem,
+    getConversation
 } from '../services/api';
 import { useAuth } from '../context/AuthContext';
 import { Paperclip, Sparkles, Send, User, Users, ArrowUp, Bot, FileText, Zap, X, Menu, History, MessageSquare, Trash2, Volume2, VolumeX, Globe, Share2, ExternalLink, Network, BarChart2, LineChart, TrendingUp, DollarSign, Award, FileCheck, PenTool, CheckCircle, AlertCircle } from 'lucide-react';
@@ -750,6 +751,25 @@ const WelcomeScreen = ({ username, onSuggestionClick }) => {
     );
 };
 
+// History listings only carry a preview of large entries; fetch the full body when one is opened.
+// Chats are loaded as their conversation's turns, a page at a time.
+const withContent = async (item) => {
+    if (item.conversation_id) {
+        const turns = [];
+        while (true) {
+            const res = await getConversation(item.conversation_id, turns.length);
+            turns.push(...res.data.turns);
+            if (!res.data.turns.length || turns.length >= res.data.turn_count) break;
+        }
+        return { ...item, turns };
+    }
+    if (item.content == null && item.id && item.content_size) {
+        const res = await getHistoryItem(item.id);
+        return res.data;
+    }
+    return item;
+};
+
 const Sidebar = ({ isOpen, toggleSidebar, onHistorySelect, onPaperSelect }) => {
     const [history, setHistory] = useState([]);
     const [papers, setPapers] = useState([]);
@@ -894,6 +914,8 @@ export default function Chat({ toggleMainSidebar }) {
     const messagesEndRef = useRef(null);
     const speechInstance = useRef(null);
     const readingRef = useRef(false);
+    // The stored conversation this chat appends to, and how many of its messages are saved
+    const conversationRef = useRef({ id: null, saved: 0 });
 
     useEffect(() => {
         const handleRetry = (e) => {
@@ -905,33 +927,48 @@ export default function Chat({ toggleMainSidebar }) {
 
     useEffect(() => {
         if (location.state && location.state.historyItem) {
-            const item = location.state.historyItem;
-            // Try to parse content as a full messages JSON array (new format)
-            let restored = null;
-            try {
-                if (item.content && item.content.startsWith('[')) {
-                    const parsed = JSON.parse(item.content);
-                    if (Array.isArray(parsed) && parsed.length > 0) {
-                        restored = parsed;
-                    }
-                }
-            } catch (_) { /* not JSON, fall back */ }
-
-            if (restored) {
-                // Full conversation: all user + AI messages
-                setMessages(restored);
-            } else if (item.item || item.content) {
-                // Legacy: single Q&A pair
-                setMessages([
-                    { role: 'user', content: item.item || '' },
-                    { role: 'assistant', content: item.content || '' },
-                ]);
-            }
+            restoreHistoryItem(location.state.historyItem);
             // Clear state so it doesn't reload on every render
             navigate(location.pathname, { replace: true, state: {} });
         }
     }, [location.state, navigate]);
 
+    const restoreHistoryItem = async (summary) => {
+        let item = summary;
+        try {
+            item = await withContent(summary);
+        } catch (err) {
+            console.error("History item fetch error:", err);
+        }
+        if (item.turns) {
+            setMessages(item.turns);
+            conversationRef.current = { id: item.conversation_id, saved: item.turns.length };
+            return;
+        }
+        conversationRef.current = { id: null, saved: 0 };
+        // Older entries hold the whole conversation as a JSON array
+        let restored = null;
+        try {
+            if (item.content && item.content.startsWith('[')) {
+                const parsed = JSON.parse(item.content);
+                if (Array.isArray(parsed) && parsed.length > 0) {
+                    restored = parsed;
+                }
+            }
+        } catch (_) { /* not JSON, fall back */ }
+
+        if (restored) {
+            // Full conversation: all user + AI messages
+            setMessages(restored);
+        } else if (item.item || item.content) {
+            // Legacy: single Q&A pair
+            setMessages([
+                { role: 'user', content: item.item || '' },
+                { role: 'assistant', content: item.content || '' },
+            ]);
+        }
+    };
+
     const scrollToBottom = () => {
         messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
     };
@@ -1047,6 +1084,21 @@ export default function Chat({ toggleMainSidebar }) {
         }
     };
 
+    // Sends only the messages not saved yet; starts over with the full conversation if the server disagrees
+    const saveConversation = async (conversation) => {
+        const { id, saved } = conversationRef.current;
+        try {
+            let res;
+            try {
+                res = await saveChatHistory(conversation.slice(saved), id, saved);
+            } catch (err) {
+                if (err.response?.status !== 409) throw err;
+                res = await saveChatHistory(conversation, id, 0);
+            }
+            conversationRef.current = { id: res.data.conversation_id, saved: res.data.turn_count };
+        } catch (_) { /* non-critical */ }
+    };
+
     const handleStreamingResponse = async (prompt, conversationHistory = []) => {
         setLoading(true);
         const token = localStorage.getItem('token');
@@ -1113,7 +1165,7 @@ export default function Chat({ toggleMainSidebar }) {
                     ...userAssistantMsgs,
                     { role: 'assistant', content: aiMessageContent }
                 ];
-                saveChatHistory(fullConversation).catch(() => {/* non-critical */ });
+                saveConversation(fullConversation);
             }
         } catch (error) {
             console.error("Streaming error:", error);
@@ -1365,7 +1417,9 @@ export default function Chat({ toggleMainSidebar }) {
         setMessages(prev => [...prev, { role: 'system', content: `Uploading ${file.name}...` }]);
         try {
             const res = await uploadPaper(file);
-            const docContent = res.data.content;
+            await waitForExtraction(res.data.job_id);
+            const contentRes = await getPaperContent(res.data.filename);
+            const docContent = contentRes.data.content;
 
             // Set as active document for session knowledge
             setActiveDocument({
@@ -1434,12 +1488,9 @@ export default function Chat({ toggleMainSidebar }) {
                 isOpen={sidebarOpen}
                 toggleSidebar={() => setSidebarOpen(false)}
                 onHistorySelect={(item) => {
-                    setMessages([
-                        { role: 'user', content: item.item },
-                        { role: 'assistant', content: item.content }
-                    ]);
                     setActiveDocument(null);
                     setSidebarOpen(false);
+                    restoreHistoryItem(item);
                 }}
                 onPaperSelect={async (filename) => {
                     setLoading(true);
@@ -1501,7 +1552,7 @@ export default function Chat({ toggleMainSidebar }) {
                 <motion.button
                     whileHover={{ scale: 1.05, backgroundColor: '#1e293b' }}
                     whileTap={{ scale: 0.95 }}
-                    onClick={() => { setMessages([]); setActiveDocument(null); }}
+                    onClick={() => { setMessages([]); setActiveDocument(null); conversationRef.current = { id: null, saved: 0 }; }}
                     style={{
                         background: 'rgba(30, 41, 59, 0.7)',
                         backdropFilter: 'blur(8px)',
@@ -1,6 +1,6 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useAuth } from '../context/AuthContext';
-import { createRoom, getRoom, addRoomMessage, getMessages, listRooms } from '../services/api';
+import { createRoom, getRoom, addRoomMessage, getMessages, listRooms, subscribeToRoom } from '../services/api';
 import { Users, MessageSquare, Send, Plus, Search, LogOut, Hash, User, History } from 'lucide-react';
 import { motion, AnimatePresence } from 'framer-motion';
 
@@ -15,6 +15,7 @@ export default function Collaboration() {
     const [joinInput, setJoinInput] = useState('');
     const [loading, setLoading] = useState(false);
     const [existingRooms, setExistingRooms] = useState([]);
+    const cursorRef = useRef(null); // id of the newest message fetched so far
 
     useEffect(() => {
         if (!isInRoom) {
@@ -32,18 +33,46 @@ export default function Collaboration() {
     };
 
     useEffect(() => {
-        let interval;
-        if (isInRoom && roomId) {
-            fetchMessages();
-            interval = setInterval(fetchMessages, 3000); // Poll every 3s
-        }
-        return () => clearInterval(interval);
+        if (!isInRoom || !roomId) return;
+        // New messages are pushed over a room subscription; on a dropped connection we
+        // catch up with one fetch and resubscribe from the last message seen
+        const controller = new AbortController();
+        cursorRef.current = null;
+        const listen = async () => {
+            await fetchMessages();
+            while (!controller.signal.aborted) {
+                try {
+                    cursorRef.current = await subscribeToRoom(roomId, cursorRef.current, message => mergeMessages([message], false), controller.signal);
+                } catch (error) {
+                    if (controller.signal.aborted) return;
+                    console.error("Room subscription dropped:", error);
+                    await new Promise(resolve => setTimeout(resolve, 3000));
+                    await fetchMessages();
+                }
+            }
+        };
+        listen();
+        return () => controller.abort();
     }, [isInRoom, roomId]);
 
+    const mergeMessages = (incoming, replace) => {
+        if (incoming.length) {
+            cursorRef.current = Math.max(cursorRef.current ?? 0, incoming[incoming.length - 1].id);
+        }
+        setMessages(prev => {
+            // Optimistic messages have no id yet; the server copy replaces them
+            const kept = replace ? [] : prev.filter(m => m.id !== undefined);
+            const lastId = kept.length ? kept[kept.length - 1].id : 0;
+            return [...kept, ...incoming.filter(m => m.id > lastId)];
+        });
+    };
+
     const fetchMessages = async () => {
         try {
-            const res = await getMessages(roomId);
-            setMessages(res.data.messages);
+            const since = cursorRef.current;
+            const res = await getMessages(roomId, since);
+            mergeMessages(res.data.messages, since === null);
+            cursorRef.current = Math.max(cursorRef.current ?? 0, res.data.next_cursor);
         } catch (error) {
             console.error("Error fetching messages:", error);
         }
@@ -73,7 +73,7 @@ export default function HistoryPage() {
                         {history.map((item, idx) => {
                             const msgs = parseMessages(item.content);
                             const msgCount = msgs ? msgs.length : null;
-                            const firstAI = msgs ? msgs.find(m => m.role === 'assistant')?.content : null;
+                            const firstAI = msgs ? msgs.find(m => m.role === 'assistant')?.content : item.preview;
                             const preview = firstAI ? (firstAI.slice(0, 120) + (firstAI.length > 120 ? '…' : '')) : null;
                             const accentColor = actionColor[item.action] || '#64748b';
                             const isClickable = item.action === 'Chat';
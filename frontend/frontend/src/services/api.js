@@ -46,6 +46,15 @@ export const uploadPaper = (file) => {
     headers: { 'Content-Type': 'multipart/form-data' },
   });
 };
+export const getUploadStatus = (jobId) => api.get(`/upload/status/${jobId}`);
+export const waitForExtraction = async (jobId, intervalMs = 1000) => {
+  for (;;) {
+    const res = await getUploadStatus(jobId);
+    if (res.data.status === 'completed') return res.data;
+    if (res.data.status === 'failed') throw new Error(res.data.error || 'Text extraction failed');
+    await new Promise(resolve => setTimeout(resolve, intervalMs));
+  }
+};
 export const searchPapers = (query) => api.post('/search', { query });
 export const summarizePaper = (data) => api.post('/summarize', data);
 export const askQuestion = (question, context) => {
@@ -64,6 +73,7 @@ export const checkPlagiarism = (data) => {
   return api.post('/check-plagiarism', data);
 };
 export const getDashboardData = () => api.get('/dashboard');
+export const getHistoryItem = (id) => api.get(`/history/${id}`);
 export const getConferences = (topic) => api.get(`/conferences?topic=${topic}`);
 export const visualizePaper = (data) => api.post('/visualize-paper', data);
 export const deepWebResearch = (data) => api.post('/web-research', data);
@@ -77,8 +87,46 @@ export const synthesizePapers = (data) => api.post('/synthesize-papers', data);
 export const createRoom = (data) => api.post('/collaboration/create-room', data);
 export const getRoom = (roomId) => api.get(`/collaboration/rooms/${roomId}`);
 export const addRoomMessage = (data) => api.post('/collaboration/add-message', data);
-export const getMessages = (roomId) => api.get(`/collaboration/rooms/${roomId}/messages`);
+export const getMessages = (roomId, since) => api.get(`/collaboration/rooms/${roomId}/messages`, { params: { since } });
 export const listRooms = () => api.get('/collaboration/rooms');
-export const saveChatHistory = (messages) => api.post('/save-chat', { messages });
+
+// Streams new room messages (Server-Sent Events) to `onMessage` until `signal` aborts or the
+// server ends the stream. Resolves with the id of the last message seen, to reconnect from.
+export const subscribeToRoom = async (roomId, after, onMessage, signal) => {
+  const params = after != null ? `?after=${after}` : '';
+  const response = await fetch(`${api.defaults.baseURL}/collaboration/rooms/${roomId}/events${params}`, {
+    headers: { Authorization: `Bearer ${localStorage.getItem('token')}`, Accept: 'text/event-stream' },
+    signal,
+  });
+  if (!response.ok) throw new Error(`Room subscription failed (${response.status})`);
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let lastId = after;
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) return lastId;
+    buffer += decoder.decode(value, { stream: true });
+    const events = buffer.split('\n\n');
+    buffer = events.pop();
+    for (const event of events) {
+      const lines = event.split('\n');
+      // Skip keep-alives and control events such as `overflow`; the next connection catches up
+      if (lines.some(line => line.startsWith('event:'))) continue;
+      const data = lines.filter(line => line.startsWith('data: ')).map(line => line.slice(6)).join('\n');
+      if (!data) continue;
+      const message = JSON.parse(data);
+      lastId = message.id;
+      onMessage(message);
+    }
+  }
+};
+// Appends the messages from position `offset` on to a conversation (a new one without `conversationId`)
+export const saveChatHistory = (messages, conversationId = null, offset = 0) =>
+    api.post('/save-chat', { messages, conversation_id: conversationId, offset });
+export const getConversations = () => api.get('/conversations');
+export const getConversation = (conversationId, after = 0) =>
+    api.get(`/conversations/${conversationId}`, { params: { after } });
 
 export default api;